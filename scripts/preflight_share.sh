@@ -6,7 +6,7 @@ cd "$ROOT_DIR"
 
 echo "== WhisperMac preflight for public share =="
 
-PATTERN='(sk-[A-Za-z0-9]{20,}|ghp_[A-Za-z0-9]{30,}|api[_-]?key\s*[:=]\s*["'"'"'][^"'"'"']+["'"'"']|token\s*[:=]\s*["'"'"'][^"'"'"']+["'"'"']|secret\s*[:=]\s*["'"'"'][^"'"'"']+["'"'"']|password\s*[:=]\s*["'"'"'][^"'"'"']+["'"'"']|BEGIN [A-Z ]*PRIVATE KEY)'
+PATTERN='(sk-[A-Za-z0-9]{20,}|gsk_[A-Za-z0-9]{20,}|ghp_[A-Za-z0-9]{30,}|api[_-]?key\s*[:=]\s*["'"'"'][^"'"'"']+["'"'"']|token\s*[:=]\s*["'"'"'][^"'"'"']+["'"'"']|secret\s*[:=]\s*["'"'"'][^"'"'"']+["'"'"']|password\s*[:=]\s*["'"'"'][^"'"'"']+["'"'"']|BEGIN [A-Z ]*PRIVATE KEY)'
 EXCLUDES=(
   --glob '!.git/**'
   --glob '!venv/**'
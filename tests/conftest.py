@@ -0,0 +1,59 @@
+"""
+Общие фикстуры тестов. Пути логов, кэшей и перелива аудио whisper_mac
+вычисляет при импорте от $HOME, поэтому подменяем окружение до импорта:
+тесты не трогают ~/whisper_log.txt и ~/.cache/whispermac пользователя.
+"""
+
+import os
+import sys
+import tempfile
+import wave
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_HOME = tempfile.mkdtemp(prefix="whispermac-tests-")
+os.environ["HOME"] = _HOME
+os.environ["WHISPERMAC_AUDIO_SPILL_DIR"] = os.path.join(_HOME, "spill")
+os.environ["WHISPERMAC_MEETING_DIR"] = os.path.join(_HOME, "meetings")
+os.environ["WHISPERMAC_INSTANCE_LOCK"] = os.path.join(_HOME, "app.lock")
+os.environ.pop("GROQ_API_KEY", None)
+
+import whisper_mac as wm  # noqa: E402
+
+wm._quiet_logs(False)
+
+SAMPLE_RATE = wm.SAMPLE_RATE
+
+
+def speech(seconds: float, *, seed: int = 7, level: float = 0.05) -> np.ndarray:
+    """«Речь» для FakeEngine: громкий шум кусками по 1.5–4 s вперемешку с паузами."""
+    rng = np.random.default_rng(seed)
+    audio = np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+    pos = 0
+    while pos < len(audio):
+        span = int(rng.uniform(1.5, 4.0) * SAMPLE_RATE)
+        if rng.random() < 0.75:
+            audio[pos:pos + span] = rng.standard_normal(len(audio[pos:pos + span])) * level
+        pos += span
+    return audio
+
+
+def wav_bytes(audio: np.ndarray) -> bytes:
+    import io
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(SAMPLE_RATE)
+        wf.writeframes(wm._to_pcm16(audio).tobytes())
+    return buf.getvalue()
+
+
+@pytest.fixture
+def home() -> Path:
+    return Path(_HOME)
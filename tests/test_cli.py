@@ -0,0 +1,38 @@
+"""Командная строка: таблицы команд whisper_mac и whisper_bench."""
+
+import subprocess
+import sys
+
+import whisper_bench
+import whisper_mac as wm
+from conftest import ROOT
+
+
+def test_app_commands_do_not_include_benches():
+    assert set(wm.COMMANDS) == {"report", "transcribe", "serve"}
+    assert all(name.startswith("bench") for name in whisper_bench.COMMANDS)
+
+
+def test_bench_module_is_the_same_app_module():
+    assert wm._bench_module() is whisper_bench
+    assert whisper_bench.wm is wm
+
+
+def test_make_engine_uses_bench_fakes():
+    engine = wm._make_engine("fake:0.01")
+    assert isinstance(engine, whisper_bench.FakeEngine)
+    assert engine.rtf == 0.01
+
+
+def test_unknown_bench_command():
+    assert whisper_bench.main(["bench-nope"]) == 2
+    assert whisper_bench.main([]) == 2
+
+
+def test_bench_dispatch_through_app(tmp_path):
+    proc = subprocess.run(
+        [sys.executable, str(ROOT / "whisper_mac.py"), "bench-paste"],
+        cwd=tmp_path, capture_output=True, text=True, timeout=120,
+    )
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout
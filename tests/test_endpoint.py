@@ -0,0 +1,73 @@
+"""Автостоп по тишине: Endpointer на синтетической речи и обрезка хвоста в сессии."""
+
+import numpy as np
+
+import whisper_mac as wm
+from conftest import SAMPLE_RATE, speech
+from whisper_bench import FakeEngine
+
+BLOCK = 1024
+# Сглаженный RMS опускается под порог не сразу: громкая речь держит его ~5 блоков.
+HANGOVER = 6 * BLOCK / SAMPLE_RATE
+
+
+def _tone(seconds: float, level: float = 0.05) -> np.ndarray:
+    rng = np.random.default_rng(3)
+    return (rng.standard_normal(int(seconds * SAMPLE_RATE)) * level).astype(np.float32)
+
+
+def _silence(seconds: float) -> np.ndarray:
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+
+def _run(ep: wm.Endpointer, audio: np.ndarray) -> list:
+    return [i for i in range(0, len(audio), BLOCK) if ep.feed(audio[i:i + BLOCK])]
+
+
+def test_fires_once_after_silence():
+    ep = wm.Endpointer(silence_ms=900, min_speech_ms=300, keep_ms=200)
+    audio = np.concatenate([_tone(2.0), _silence(3.0)])
+    fired = _run(ep, audio)
+    assert len(fired) == 1
+    fired_sec = ep.fired_at / SAMPLE_RATE
+    assert 2.9 <= fired_sec <= 2.9 + HANGOVER
+
+
+def test_trim_keeps_speech_and_keep_ms():
+    ep = wm.Endpointer(silence_ms=900, min_speech_ms=300, keep_ms=200)
+    audio = np.concatenate([_tone(2.0), _silence(1.5)])
+    _run(ep, audio)
+    kept = (len(audio) - ep.trim_samples) / SAMPLE_RATE
+    assert 2.2 <= kept <= 2.2 + HANGOVER
+
+
+def test_short_pause_does_not_fire():
+    ep = wm.Endpointer(silence_ms=900, min_speech_ms=300)
+    audio = np.concatenate([_tone(1.0), _silence(0.5), _tone(1.0)])
+    assert _run(ep, audio) == []
+
+
+def test_click_without_speech_does_not_fire():
+    ep = wm.Endpointer(silence_ms=900, min_speech_ms=300)
+    audio = np.concatenate([_tone(0.05), _silence(3.0)])
+    assert _run(ep, audio) == []
+
+
+def test_trimmed_session_matches_speech_only():
+    voiced = speech(6.0)
+    voiced[-SAMPLE_RATE:] = 0.0              # конец речи — тишина, как перед автостопом
+    audio = np.concatenate([voiced, _silence(2.0)])
+    ep = wm.Endpointer()
+    session = wm.TranscriptionSession(FakeEngine(rtf=0.0), fast_repo="")
+    session.start()
+    for i in range(0, len(audio), BLOCK):
+        block = audio[i:i + BLOCK].copy()
+        session.feed(block)
+        if ep.feed(block):
+            break
+    session.trim_tail(ep.trim_samples)
+    session.stop()
+    text = session.wait(timeout=30)
+    expected = wm.TranscriptionSession(FakeEngine(rtf=0.0), fast_repo="").run_offline(voiced)
+    assert text == expected
+    assert session.trace.meta["trimmed_ms"] > 0
@@ -0,0 +1,56 @@
+"""FocusTracker на FakeFocusSource: активное приложение и цель вставки без опроса."""
+
+import whisper_mac as wm
+from whisper_bench import FakeFocusSource
+
+SELF = "com.whispermac.app"
+
+
+def _tracker(source, changes=None):
+    return wm.FocusTracker(
+        source,
+        excluded=lambda bid: not bid or bid == SELF,
+        on_change=changes.append if changes is not None else None,
+    ).start()
+
+
+def test_initial_state_from_running_apps():
+    source = FakeFocusSource(running=("com.apple.Safari", "com.apple.Notes"), front="com.apple.Notes")
+    tracker = _tracker(source)
+    assert tracker.frontmost == "com.apple.Notes"
+    assert tracker.last_external()[0] == "com.apple.Notes"
+    assert tracker.app_for("com.apple.Safari") is not None
+    assert tracker.app_for("com.example.missing") is None
+
+
+def test_own_window_keeps_last_external_target():
+    changes = []
+    source = FakeFocusSource(running=("com.apple.Notes",), front="com.apple.Notes")
+    tracker = _tracker(source, changes)
+    source.activate(SELF)
+    assert tracker.frontmost == SELF
+    assert tracker.last_external()[0] == "com.apple.Notes"
+    source.activate("com.apple.Safari")
+    assert tracker.last_external()[0] == "com.apple.Safari"
+    assert changes == ["com.apple.Notes", "com.apple.Safari"]
+
+
+def test_launch_and_terminate_update_index():
+    source = FakeFocusSource(front=None)
+    tracker = _tracker(source)
+    source.launch("com.apple.Terminal")
+    app = tracker.app_for("com.apple.Terminal")
+    assert app is not None
+    source.activate("com.apple.Terminal")
+    source.terminate("com.apple.Terminal")
+    assert tracker.app_for("com.apple.Terminal") is None
+    assert tracker.last_external() == (None, 0.0)
+
+
+def test_broken_source_does_not_raise():
+    class Broken(FakeFocusSource):
+        def subscribe(self, *handlers):
+            raise RuntimeError("нет AppKit")
+
+    tracker = _tracker(Broken(running=("com.apple.Notes",), front="com.apple.Notes"))
+    assert tracker.frontmost == "com.apple.Notes"
@@ -0,0 +1,133 @@
+"""Groq: лимиты GroqQuota и повторы groq_transcribe против MockGroqServer."""
+
+import socket
+
+import numpy as np
+import pytest
+
+import whisper_mac as wm
+from conftest import SAMPLE_RATE
+from whisper_bench import FakeEngine, MockGroqServer
+
+AUDIO = (np.random.default_rng(3).standard_normal(6 * SAMPLE_RATE) * 0.05).astype(np.float32)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def groq(monkeypatch):
+    """Запуск groq_transcribe против mock-сервера; вернёт (текст, mock)."""
+    monkeypatch.setattr(wm, "GROQ_API_KEY", "test")
+    monkeypatch.setattr(wm, "GROQ_RETRIES", 2)
+    monkeypatch.setattr(wm, "GROQ_RETRY_BUDGET_SEC", 4.0)
+    monkeypatch.setattr(wm, "GROQ_CHUNKED", False)
+    servers = []
+
+    def run(quota=None, calls=1, **mock_kw):
+        mock = MockGroqServer(FakeEngine(rtf=0.0), **mock_kw)
+        servers.append(mock)
+        monkeypatch.setattr(wm, "GROQ_API_URL", mock.url)
+        quota = quota or wm.GroqQuota()
+        texts = [
+            wm.groq_transcribe(AUDIO, api_key="test", quota=quota,
+                               trace=wm.UtteranceTrace("groq", persist=False))
+            for _ in range(calls)
+        ]
+        return texts, mock
+
+    yield run
+    for mock in servers:
+        mock.close()
+
+
+def test_ok(groq):
+    texts, mock = groq()
+    assert texts[0]
+    assert mock.requests == 1
+
+
+def test_short_retry_after_is_retried(groq):
+    texts, mock = groq(script=[(429, {"retry-after": "0.3"})])
+    assert texts[0]
+    assert mock.requests == 2
+
+
+def test_long_retry_after_blocks_groq(groq):
+    quota = wm.GroqQuota()
+    texts, mock = groq(quota, calls=2, script=[(429, {"retry-after": "30"})])
+    assert texts == ["", ""]
+    assert mock.requests == 1        # второй вызов не дошёл до сервера
+    assert quota.blocked_for() > 25
+
+
+def test_5xx_retried_within_budget(groq):
+    texts, mock = groq(script=[(503, {}), (503, {})])
+    assert texts[0]
+    assert mock.requests == 3
+
+
+def test_5xx_gives_up_after_retries(groq):
+    texts, mock = groq(script=[(500, {})] * 10)
+    assert texts == [""]
+    assert mock.requests == 3
+
+
+def test_4xx_is_not_retried(groq):
+    texts, mock = groq(script=[(400, {})])
+    assert texts == [""]
+    assert mock.requests == 1
+
+
+def test_exhausted_audio_seconds_go_local_before_sending(groq):
+    texts, mock = groq(wm.GroqQuota(reserve=0.0), calls=3, audio_limit=15.0)
+    assert [bool(t) for t in texts] == [True, True, False]
+    assert mock.requests == 2
+
+
+def test_client_request_limit(groq):
+    texts, mock = groq(wm.GroqQuota(req_per_min=2), calls=3)
+    assert [bool(t) for t in texts] == [True, True, False]
+    assert mock.requests == 2
+
+
+def test_connection_refused(monkeypatch):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    monkeypatch.setattr(wm, "GROQ_API_URL", f"http://127.0.0.1:{port}/openai/v1/audio/transcriptions")
+    monkeypatch.setattr(wm, "GROQ_RETRY_BUDGET_SEC", 1.0)
+    assert wm.groq_transcribe(AUDIO, api_key="test", quota=wm.GroqQuota()) == ""
+
+
+def test_rejected_chunked_body_falls_back_to_content_length(groq, monkeypatch):
+    monkeypatch.setattr(wm, "GROQ_CHUNKED", True)
+    texts, mock = groq(script=[(411, {})])
+    assert texts[0]
+    assert mock.requests == 2
+    assert wm.GROQ_CHUNKED is False     # дальше сразу с Content-Length
+
+
+def test_quota_reserve_and_refill():
+    clock = Clock()
+    quota = wm.GroqQuota(audio_sec_per_hour=100.0, req_per_min=0, reserve=0.1, clock=clock)
+    assert quota.admit(80.0) == ""
+    quota.spend(audio_sec=80.0)
+    assert quota.admit(15.0)         # 20 осталось, резерв 10
+    clock.now += 360.0               # +10 аудио-секунд за 6 минут
+    assert quota.admit(15.0) == ""
+
+
+def test_quota_headers_block_until_reset():
+    clock = Clock()
+    quota = wm.GroqQuota(clock=clock)
+    quota.observe({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "45s"})
+    assert "исчерпан" in quota.admit(1.0)
+    clock.now += 46.0
+    quota.observe({"x-ratelimit-remaining-requests": "10"})
+    assert quota.admit(1.0) == ""
@@ -0,0 +1,77 @@
+"""Выбор способа вставки: PasteStrategyCache и paste_with_strategy на FakePasteBackend."""
+
+import whisper_mac as wm
+from whisper_bench import FakePasteBackend
+
+APP = "com.example.editor"
+
+
+def test_first_paste_walks_the_chain_then_cache_goes_straight():
+    backend = FakePasteBackend({(APP, "pynput"): (True, 1.0)})
+    cache = wm.PasteStrategyCache(None)
+    ok, method, attempts = wm.paste_with_strategy(backend, cache, APP, "x", mode="auto")
+    assert ok and method == "pynput"
+    assert [m for m, _, _ in attempts] == ["ax", "osascript-keycode", "osascript", "pynput"]
+
+    backend.calls.clear()
+    ok, method, attempts = wm.paste_with_strategy(backend, cache, APP, "x", mode="auto")
+    assert ok and method == "pynput"
+    assert backend.calls == [(APP, "pynput")]
+
+
+def test_fastest_working_method_first():
+    cache = wm.PasteStrategyCache(None)
+    cache.record(APP, "osascript", True, 40.0)
+    cache.record(APP, "session", True, 2.0)
+    assert cache.order(APP)[:2] == ["session", "osascript"]
+
+
+def test_method_demoted_after_failures_in_a_row():
+    cache = wm.PasteStrategyCache(None, demote_after=2)
+    cache.record(APP, "ax", True, 1.0)
+    cache.record(APP, "ax", False, 1.0)
+    assert cache.order(APP)[0] == "ax"
+    cache.record(APP, "ax", False, 1.0)
+    assert cache.order(APP)[-1] == "ax"
+    cache.record(APP, "ax", True, 1.0)      # снова сработал — серия сброшена
+    assert cache.order(APP)[0] == "ax"
+
+
+def test_no_accessibility_skips_simulated_paste():
+    backend = FakePasteBackend({(APP, m): (True, 0.0) for m in wm.PASTE_NEEDS_AX},
+                               accessibility=False)
+    ok, method, attempts = wm.paste_with_strategy(backend, None, APP, "x", mode="auto")
+    assert not ok and method == ""
+    assert not any(target == APP and m in wm.PASTE_NEEDS_AX for target, m in backend.calls)
+    assert [m for m, _, _ in attempts] == ["ax", "osascript-keycode", "osascript"]
+
+
+def test_explicit_mode_bypasses_cache():
+    backend = FakePasteBackend({(APP, "osascript-keycode"): (True, 0.0)})
+    cache = wm.PasteStrategyCache(None)
+    cache.record(APP, "ax", True, 0.5)
+    ok, method, _ = wm.paste_with_strategy(backend, cache, APP, "x", mode="keycode")
+    assert ok and method == "osascript-keycode"
+    assert backend.calls == [(APP, "osascript-keycode")]
+
+
+def test_cache_survives_restart(tmp_path):
+    path = tmp_path / "paste_strategy.json"
+    wm.PasteStrategyCache(path).record(APP, "session", True, 3.0)
+    reloaded = wm.PasteStrategyCache(path)
+    assert reloaded.order(APP)[0] == "session"
+    assert reloaded.stats(APP)["session"]["ok"] == 1
+
+
+def test_corrupt_cache_file_is_ignored(tmp_path):
+    path = tmp_path / "paste_strategy.json"
+    path.write_text("{not json", encoding="utf-8")
+    assert wm.PasteStrategyCache(path).order(APP) == list(wm.PASTE_METHODS)
+
+
+def test_base_backend_fails_every_method_without_raising():
+    cache = wm.PasteStrategyCache(None)
+    ok, method, attempts = wm.paste_with_strategy(wm.PasteBackend(), cache, APP, "x", mode="auto")
+    assert not ok and method == ""
+    assert attempts and not any(sent for _, sent, _ in attempts)
+    assert all(m not in wm.PASTE_NEEDS_AX for m, _, _ in attempts)
@@ -0,0 +1,134 @@
+"""TranscriptionServer: OpenAI-совместимый API поверх FakeEngine."""
+
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+import whisper_mac as wm
+from conftest import speech, wav_bytes
+from whisper_bench import FakeEngine
+
+
+def _multipart(fields: dict, wav: bytes) -> tuple:
+    boundary = "whispermac-test"
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="a.wav"\r\n'
+        f"Content-Type: audio/wav\r\n\r\n".encode() + wav + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def _request(url: str, body: bytes = None, ctype: str = None) -> tuple:
+    req = urllib.request.Request(url, data=body, method="POST" if body is not None else "GET")
+    if ctype:
+        req.add_header("Content-Type", ctype)
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return resp.status, resp.read(), dict(resp.headers)
+    except urllib.error.HTTPError as ex:
+        return ex.code, ex.read(), dict(ex.headers)
+
+
+@pytest.fixture
+def server():
+    srv = wm.TranscriptionServer(FakeEngine(rtf=0.0), "127.0.0.1:0", workers=2, batch_ms=0)
+    yield srv
+    srv.close()
+
+
+def test_health_reports_engine(server):
+    status, raw, _ = _request(server.address + "/health")
+    health = json.loads(raw)
+    assert status == 200
+    assert health["status"] == "ok"
+    assert health["engine"] == "FakeEngine"
+    assert health["workers"] == 2
+
+
+def test_models_lists_engine(server):
+    status, raw, _ = _request(server.address + "/v1/models")
+    assert status == 200
+    assert json.loads(raw)["data"][0]["id"] == "FakeEngine"
+
+
+def test_transcription_matches_session(server):
+    wav = wav_bytes(speech(12.0))
+    audio = wm._decode_upload("a.wav", wav)
+    expected = wm.TranscriptionSession(FakeEngine(rtf=0.0), fast_repo="").run_offline(audio)
+    assert expected
+    body, ctype = _multipart({"model": "whisper-large-v3"}, wav)
+    status, raw, _ = _request(server.address + "/v1/audio/transcriptions", body, ctype)
+    assert status == 200
+    assert json.loads(raw)["text"] == expected
+
+    body, ctype = _multipart({"response_format": "text"}, wav)
+    status, raw, _ = _request(server.address + "/openai/v1/audio/transcriptions", body, ctype)
+    assert status == 200
+    assert raw.decode("utf-8") == expected + "\n"
+    assert server.health()["served"] == 2
+
+
+def test_bad_requests(server):
+    status, _, _ = _request(server.address + "/v1/audio/transcriptions", b"x", "text/plain")
+    assert status == 400
+    status, _, _ = _request(server.address + "/nope")
+    assert status == 404
+
+
+def test_full_queue_rejected_with_retry_after():
+    srv = wm.TranscriptionServer(FakeEngine(rtf=0.0), "127.0.0.1:0", workers=1, queue_size=1)
+    try:
+        srv._stopping.set()          # воркер выходит и больше не разбирает очередь
+        for t in srv._workers:
+            t.join(timeout=5)
+        srv.jobs.put_nowait(wm._ServeJob(speech(1.0), None))
+        body, ctype = _multipart({}, wav_bytes(speech(1.0)))
+        status, _, headers = _request(srv.address + "/v1/audio/transcriptions", body, ctype)
+        assert status == 503
+        assert headers["Retry-After"] == "1"
+        assert srv.health()["rejected"] == 1
+    finally:
+        srv.close()
+
+
+
+def test_timed_out_job_is_not_decoded(monkeypatch):
+    monkeypatch.setattr(wm, "GROQ_TIMEOUT", 0.2)
+    engine = FakeEngine(rtf=0.0)
+    calls = []
+    monkeypatch.setattr(engine, "transcribe", lambda audio, **opts: calls.append(opts) or {"text": ""})
+    srv = wm.TranscriptionServer(engine, "127.0.0.1:0", workers=1)
+    try:
+        srv._stopping.set()          # воркер выходит: запрос так и стоит в очереди
+        for t in srv._workers:
+            t.join(timeout=5)
+        body, ctype = _multipart({}, wav_bytes(speech(2.0)))
+        status, _, _ = _request(srv.address + "/v1/audio/transcriptions", body, ctype)
+        assert status == 504
+        job = srv.jobs.get_nowait()
+        assert job.cancelled
+        srv._run_job(job)
+        assert calls == []
+        assert job.done.is_set() and job.text is None
+        health = srv.health()
+        assert (health["timeouts"], health["cancelled"], health["served"]) == (1, 1, 0)
+    finally:
+        srv.close()
+
+def test_unix_socket_is_private(home):
+    sock = home / "serve.sock"
+    srv = wm.TranscriptionServer(FakeEngine(rtf=0.0), f"unix:{sock}")
+    try:
+        assert srv.address == f"unix:{sock}"
+        assert sock.stat().st_mode & 0o777 == 0o600
+    finally:
+        srv.close()
+    assert not sock.exists()
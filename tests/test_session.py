@@ -0,0 +1,149 @@
+"""TranscriptionSession на FakeEngine: стриминг по чанкам против целой записи."""
+
+import threading
+
+import numpy as np
+
+import whisper_mac as wm
+from conftest import SAMPLE_RATE, speech
+from whisper_bench import FakeEngine
+
+
+def _stream(audio: np.ndarray, engine, block: int = 1024) -> tuple:
+    results = []
+    session = wm.TranscriptionSession(engine, fast_repo="",
+                                      on_result=lambda text, trace: results.append(text))
+    session.start()
+    for i in range(0, len(audio), block):
+        session.feed(audio[i:i + block].copy())
+    session.stop()
+    return session.wait(timeout=30), results
+
+
+def test_streaming_matches_offline():
+    audio = speech(40.0)
+    offline = wm.TranscriptionSession(FakeEngine(rtf=0.0), fast_repo="").run_offline(audio)
+    text, results = _stream(audio, FakeEngine(rtf=0.0))
+    assert offline
+    assert text == offline
+    assert results == [offline]
+
+
+def test_silence_gives_empty_result():
+    text, results = _stream(np.zeros(3 * SAMPLE_RATE, dtype=np.float32), FakeEngine(rtf=0.0))
+    assert text == ""
+    assert results == [""]
+
+
+def test_feed_after_stop_is_dropped():
+    session = wm.TranscriptionSession(FakeEngine(rtf=0.0), fast_repo="")
+    session.start()
+    session.feed(speech(2.0))
+    session.stop()
+    session.feed(speech(2.0, seed=8))   # опоздавший блок аудио-коллбэка
+    session.wait(timeout=30)
+    assert session.text is not None
+    assert session.trace.meta["chars"] == len(session.text)
+
+
+def test_on_result_called_once_from_worker():
+    calls = []
+    done = threading.Event()
+
+    def on_result(text, trace):
+        calls.append(threading.current_thread().name)
+        done.set()
+
+    session = wm.TranscriptionSession(FakeEngine(rtf=0.0), fast_repo="", on_result=on_result)
+    session.start()
+    session.feed(speech(5.0))
+    session.stop()
+    assert done.wait(30)
+    session.wait(timeout=30)
+    assert len(calls) == 1
+    assert calls[0] != threading.main_thread().name
+
+
+class BrokenEngine(FakeEngine):
+    """Движок, который падает после n удачных вызовов (как процесс инференса после второго краша)."""
+
+    def __init__(self, ok_calls: int = 0):
+        super().__init__(rtf=0.0)
+        self.ok_calls = ok_calls
+
+    def transcribe(self, audio, **opts):
+        if self.ok_calls <= 0:
+            raise RuntimeError("процесс инференса упал")
+        self.ok_calls -= 1
+        return super().transcribe(audio, **opts)
+
+
+class Pipeline:
+    """Очередь вставки App без Tk: шина сразу отдаёт итог в _deliver_in_order."""
+
+    _on_session_result = wm.App._on_session_result
+    _deliver_in_order = wm.App._deliver_in_order
+
+    def __init__(self):
+        self._jobs = {}
+        self._results = {}
+        self._next_paste_seq = 1
+        self._lock = threading.Lock()
+        self.pasted = []
+        self.bus = self
+
+    def post(self, kind, payload):
+        with self._lock:
+            self._deliver_in_order(*payload)
+
+    def _save(self, text):
+        pass
+
+    def _submit_paste(self, seq, text, trace, target=None):
+        self.pasted.append((seq, text))
+
+    def _reset(self):
+        pass
+
+    def record(self, seq: int, engine, audio: np.ndarray) -> wm.TranscriptionSession:
+        session = wm.TranscriptionSession(engine, fast_repo="")
+        self._jobs[seq] = {"session": session, "target": "com.example.editor"}
+        session.on_result = lambda text, trace: self._on_session_result(seq, text, trace)
+        session.start()
+        for i in range(0, len(audio), 1024):
+            session.feed(audio[i:i + 1024].copy())
+        session.stop()
+        return session
+
+
+def test_failed_engine_still_finishes_with_decoded_chunks():
+    results = []
+    audio = speech(20.0)
+    session = wm.TranscriptionSession(BrokenEngine(ok_calls=1), fast_repo="",
+                                      on_result=lambda text, trace: results.append(text))
+    session.start()
+    for i in range(0, len(audio), 1024):
+        session.feed(audio[i:i + 1024].copy())
+    session.stop()
+    text = session.wait(timeout=30)
+    assert text                      # первый чанк декодирован до ошибки
+    assert results == [text]
+    assert "RuntimeError" in session.trace.meta["error"]
+
+
+def test_failed_session_does_not_block_next_paste():
+    pipeline = Pipeline()
+    broken = pipeline.record(1, BrokenEngine(), speech(20.0))
+    assert broken.wait(timeout=30) == ""
+    ok = pipeline.record(2, FakeEngine(rtf=0.0), speech(6.0, seed=9))
+    text = ok.wait(timeout=30)
+    assert text
+    assert pipeline.pasted == [(2, text)]
+    assert pipeline._jobs == {} and pipeline._results == {}
+    assert pipeline._next_paste_seq == 3
+
+
+def test_offline_failure_is_reported():
+    session = wm.TranscriptionSession(BrokenEngine(), fast_repo="")
+    assert session.run_offline(speech(8.0)) == ""
+    assert session.trace.meta["error"].startswith("RuntimeError")
@@ -0,0 +1,132 @@
+"""
+Спекулятивное декодирование: совпадение с жадным проходом (игрушечная LM,
+без mlx), какие вызовы уходят в черновой декодер и сверка токенов с
+жадным декодированием mlx_whisper на Mac.
+"""
+
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+import whisper_mac as wm
+from whisper_bench import _toy_pick, _ToyDecoderState
+
+
+def _toy(seed: int, n_tokens: int, noise: float = 0.0) -> _ToyDecoderState:
+    return _ToyDecoderState(seed, n_tokens, call_ms=0.0, token_ms=0.0, noise=noise)
+
+
+def _greedy(seed: int, n_tokens: int, *, k: int, noise: float) -> tuple:
+    draft = _toy(seed, n_tokens, noise) if k else None
+    return wm.speculative_greedy(_toy(seed, n_tokens), draft, [1, 2, 3], k=k,
+                                 pick=_toy_pick, eot=_ToyDecoderState.EOT)
+
+
+@pytest.mark.parametrize("k", [1, 2, 4, 8])
+@pytest.mark.parametrize("noise", [0.0, 0.15, 1.0, 5.0])
+def test_draft_does_not_change_tokens(k, noise):
+    for seed in range(20):
+        plain, plain_lp, _ = _greedy(seed, 30, k=0, noise=noise)
+        spec, spec_lp, stats = _greedy(seed, 30, k=k, noise=noise)
+        assert spec == plain
+        assert spec_lp == pytest.approx(plain_lp)
+        assert stats["accepted"] <= stats["proposed"]
+
+
+def test_perfect_draft_accepts_everything():
+    _, _, stats = _greedy(5, 40, k=4, noise=0.0)
+    assert stats["accepted"] == stats["proposed"]
+    assert stats["target_calls"] < 40
+
+
+def test_max_tokens_respected():
+    tokens, _, _ = wm.speculative_greedy(_toy(1, 500), _toy(1, 500, 0.2), [1, 2, 3], k=4,
+                                         pick=_toy_pick, eot=_ToyDecoderState.EOT, max_tokens=50)
+    assert len(tokens) == 50
+
+
+class RecordingEngine:
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, audio, **opts):
+        self.calls.append(opts)
+        return {"text": "inner", "segments": []}
+
+
+def _routed(monkeypatch, opts: dict, seconds: float = 5.0) -> str:
+    inner = RecordingEngine()
+    engine = wm.SpeculativeEngine(inner, "draft")
+    engine.draft = object()
+    monkeypatch.setattr(engine, "decode", lambda audio, **kw: {"text": "spec", "segments": []})
+    return engine.transcribe(np.zeros(int(seconds * wm.SAMPLE_RATE), dtype=np.float32), **opts)["text"]
+
+
+def test_chunk_calls_go_to_draft(monkeypatch):
+    monkeypatch.setattr(wm, "SPECULATIVE_DRAFT_REPO", "draft")
+    inner = RecordingEngine()
+    wm.TranscriptionSession(inner, fast_repo="")._decode_piece(
+        np.zeros(5 * wm.SAMPLE_RATE, dtype=np.float32), [], "chunk")
+    assert inner.calls[0]["without_timestamps"] is True
+    assert _routed(monkeypatch, inner.calls[0]) == "spec"
+
+
+@pytest.mark.parametrize("opts, seconds", [
+    ({"temperature": 0.0}, 5.0),                                   # с временными метками
+    ({"temperature": 0.0, "without_timestamps": True}, 40.0),      # больше одного окна
+    ({"temperature": (0.0, 0.2), "without_timestamps": True}, 5.0),
+    ({"temperature": 0.0, "without_timestamps": True, "word_timestamps": True}, 5.0),
+    ({"temperature": 0.0, "without_timestamps": True, "path_or_hf_repo": "fast"}, 5.0),
+])
+def test_other_calls_fall_back_to_inner(monkeypatch, opts, seconds):
+    assert _routed(monkeypatch, opts, seconds) == "inner"
+
+
+def _corpus_windows(tmp_path) -> list:
+    """Окна реплей-корпуса bench-speculative и, на Mac, фраза от say."""
+    from whisper_bench import _synthetic_corpus
+    files = _synthetic_corpus(tmp_path)
+    if shutil.which("say") is not None:
+        path = tmp_path / "phrase.wav"
+        subprocess.run(
+            ["say", "-o", str(path), "--data-format=LEI16@16000",
+             "The quick brown fox jumps over the lazy dog. Speculative decoding should not change the text."],
+            check=True, timeout=60,
+        )
+        files.append(path)
+    window = int(wm.CHUNK_SEC * wm.SAMPLE_RATE)
+    pieces = []
+    for path in files:
+        audio = wm._read_wav_mono16k(path)
+        pieces.extend(audio[off:off + window] for off in range(0, len(audio), window)
+                      if len(audio) - off >= wm.MIN_DURATION * wm.SAMPLE_RATE)
+    return pieces
+
+
+def test_tokens_match_mlx_whisper_greedy(tmp_path):
+    mlx_whisper = pytest.importorskip("mlx_whisper")
+    import mlx.core as mx
+    from mlx_whisper.audio import N_FRAMES, N_SAMPLES, log_mel_spectrogram, pad_or_trim
+    from mlx_whisper.decoding import DecodingOptions, decode
+
+    engine = wm.SpeculativeEngine(
+        mlx_whisper, wm.SPECULATIVE_DRAFT_REPO or "distil-whisper/distil-large-v3",
+    )
+    engine.load_draft(targeted=False)
+    model = engine._target()
+    options = DecodingOptions(language=wm.LANGUAGE, temperature=0.0, without_timestamps=True,
+                              prompt=wm.HOTWORDS_PROMPT)
+    for piece in _corpus_windows(tmp_path):
+        # Окно как в transcribe(): mel с паддингом, обрезка до 3000 кадров.
+        mel = log_mel_spectrogram(piece, n_mels=model.dims.n_mels, padding=N_SAMPLES)
+        mel = pad_or_trim(mel[:mel.shape[-2] - N_FRAMES], N_FRAMES, axis=-2).astype(mx.float16)
+        reference = decode(model, mel, options)
+        # transcribe() пропускает окно при no_speech_prob > 0.6 и avg_logprob <= -1.0.
+        skipped = reference.no_speech_prob > 0.6 and reference.avg_logprob <= -1.0
+        expected = [] if skipped else [reference.tokens]
+
+        for k in (0, engine.k):
+            result = engine.decode(piece, prompt=wm.HOTWORDS_PROMPT, k=k)
+            assert [seg["tokens"] for seg in result["segments"]] == expected, f"k={k}"
@@ -0,0 +1,101 @@
+"""UIEventBus и AnimationLoop без Tk: пробуждение из чужих потоков и сон в покое."""
+
+import select
+import threading
+
+import whisper_mac as wm
+
+
+class FakeTk:
+    """root.tk: запоминает file handler, run_ready() зовёт его, если fd читаем."""
+
+    def __init__(self):
+        self.handlers = {}
+
+    def createfilehandler(self, fd, mask, fn):
+        self.handlers[fd] = fn
+
+    def deletefilehandler(self, fd):
+        self.handlers.pop(fd, None)
+
+    def run_ready(self, timeout: float = 0.0) -> int:
+        ready, _, _ = select.select(list(self.handlers), [], [], timeout)
+        for fd in ready:
+            self.handlers[fd](fd, 2)
+        return len(ready)
+
+
+class Scheduler:
+    """after(ms, fn): копит вызовы, run_all() выполняет по порядку."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def after(self, ms, fn):
+        self.jobs.append((ms, fn))
+        return len(self.jobs)
+
+    def run_next(self):
+        ms, fn = self.jobs.pop(0)
+        fn()
+        return ms
+
+
+def test_post_from_thread_wakes_once_until_ack():
+    bus = wm.UIEventBus()
+    tkapp = FakeTk()
+    woke = []
+    assert bus.attach(tkapp, lambda: woke.append(1))
+    assert tkapp.run_ready() == 0                 # в покое fd не читаем
+
+    threads = [threading.Thread(target=bus.post, args=(wm.EV_STATE, i)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert tkapp.run_ready(timeout=1.0) == 1
+    assert woke == [1]
+    assert tkapp.run_ready() == 0                 # байт прочитан, новых post() не было
+
+    seen = []
+    bus.on(wm.EV_STATE, seen.append)
+    bus.drain()
+    assert sorted(seen) == list(range(20))
+    bus.post(wm.EV_STATE, "again")
+    assert tkapp.run_ready(timeout=1.0) == 1
+    bus.close(tkapp)
+    assert tkapp.handlers == {}
+
+
+def test_events_before_attach_are_not_lost():
+    bus = wm.UIEventBus()
+    bus.post(wm.EV_STATE, "ready")
+    tkapp = FakeTk()
+    woke = []
+    bus.attach(tkapp, lambda: woke.append(1))
+    assert tkapp.run_ready(timeout=1.0) == 1 and woke
+    bus.close()
+
+
+def test_loop_sleeps_without_poll():
+    sched = Scheduler()
+    frames = []
+    loop = wm.AnimationLoop(sched.after, lambda: frames.append(1) and False)
+    loop.wake()
+    sched.run_next()
+    assert loop.sleeping
+    assert sched.jobs == []                       # ни кадров, ни опроса
+
+
+def test_fallback_poll_backs_off():
+    sched = Scheduler()
+    pending = [False]
+    loop = wm.AnimationLoop(sched.after, lambda: False, poll=lambda: pending[0],
+                            poll_ms=50, poll_max_ms=400)
+    loop.wake()
+    sched.run_next()
+    delays = [sched.run_next() for _ in range(5)]
+    assert delays == [50, 100, 200, 400, 400]
+    pending[0] = True
+    sched.run_next()                              # проверка нашла событие → кадр
+    assert sched.jobs[-1][0] == 0
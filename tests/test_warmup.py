@@ -0,0 +1,61 @@
+"""Прогрев локальной модели: по умолчанию — формы, запасной путь — transcribe по нулям."""
+
+import whisper_mac as wm
+
+
+class CountingEngine:
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, audio, **opts):
+        self.calls.append(opts.get("path_or_hf_repo"))
+        return {"text": "", "segments": []}
+
+
+class FakeWarmup:
+    loaded = []
+    fail = False
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.timings = {}
+
+    def run(self, install=True):
+        if self.fail:
+            raise RuntimeError("нет mlx")
+        self.loaded.append((self.repo, install))
+        self.timings.update(load_ms=1.0, encoder_ms=1.0, decoder_ms=1.0, total_ms=3.0)
+        return f"model:{self.repo}"
+
+
+def _fake_warmup(monkeypatch, fail=False):
+    monkeypatch.setattr(FakeWarmup, "loaded", [])
+    monkeypatch.setattr(FakeWarmup, "fail", fail)
+    monkeypatch.setattr(wm, "ModelWarmup", FakeWarmup)
+
+
+def test_default_warms_shapes_without_transcribe(monkeypatch):
+    _fake_warmup(monkeypatch)
+    engine = CountingEngine()
+    timings = wm.warm_local_model(engine)
+    assert wm.WARMUP_SHAPES
+    assert timings["mode"] == "shapes"
+    assert FakeWarmup.loaded == [(wm.MODEL_REPO, True)]
+    assert engine.calls == []
+
+
+def test_failed_shapes_fall_back_to_transcribe(monkeypatch):
+    _fake_warmup(monkeypatch, fail=True)
+    engine = CountingEngine()
+    timings = wm.warm_local_model(engine)
+    assert timings["mode"] == "legacy"
+    assert engine.calls == [wm.MODEL_REPO]
+
+
+def test_cascade_keeps_loaded_models(monkeypatch):
+    _fake_warmup(monkeypatch)
+    models = wm.ModelSet({wm.MODEL_REPO: wm._MlxModel(None, wm.MODEL_REPO),
+                          "fast": wm._MlxModel(None, "fast")})
+    timings = wm.warm_local_model(models)
+    assert timings["mode"] == timings["fast_mode"] == "shapes"
+    assert [m.model for m in models.engines.values()] == [f"model:{wm.MODEL_REPO}", "model:fast"]
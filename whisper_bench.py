@@ -0,0 +1,1795 @@
+#!/usr/bin/env python3
+"""
+Бенчмарки и подставные реализации WhisperMac.
+
+Всё, что нужно только для замеров и тестов, живёт здесь, а не в приложении:
+FakeEngine/GilBoundEngine, MockGroqServer, fake-бэкенды вставки и фокуса и
+команды bench-*. Запуск — как раньше, через whisper_mac.py
+(`python whisper_mac.py bench-groq`), или напрямую: `python whisper_bench.py bench-groq`.
+"""
+
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+import whisper_mac as wm
+from whisper_mac import (
+    AUDIO_SPILL_SEC,
+    BAR_COUNT,
+    BAR_STEP,
+    BAR_W,
+    BARS_X,
+    CAPTURE_BLOCK,
+    CAPTURE_PREROLL_MS,
+    CASCADE_FAST_REPO,
+    CHUNK_SEC,
+    ENDPOINT_KEEP_MS,
+    ENDPOINT_MIN_SPEECH_MS,
+    ENDPOINT_RMS,
+    ENDPOINT_SILENCE_MS,
+    EQ_RMS_THRESHOLD,
+    H,
+    HOTWORDS_PROMPT,
+    MIN_DURATION,
+    MODEL_REPO,
+    PASTE_DEMOTE_AFTER,
+    SAMPLE_RATE,
+    SPECULATIVE_DRAFT_REPO,
+    SPECULATIVE_K,
+    UI_IDLE_POLL_MS,
+    W,
+    _UPLOAD_CODECS,
+    AnimationLoop,
+    AudioStore,
+    BarRenderer,
+    CaptureStream,
+    Endpointer,
+    FocusSource,
+    GroqQuota,
+    InferenceClient,
+    MeetingTranscript,
+    ModelSet,
+    PasteBackend,
+    PasteStrategyCache,
+    SpeculativeEngine,
+    _TimedBody,
+    TranscriptionSession,
+    UIEventBus,
+    UploadPlanner,
+    UtteranceTrace,
+    _cascade_repo,
+    _decode_upload,
+    _encode_for_groq,
+    groq_transcribe,
+    _iter_http_body,
+    _lazy_import,
+    local_engine,
+    _log_softmax_at,
+    _multipart_pieces,
+    _parse_multipart,
+    paste_with_strategy,
+    _percentile,
+    _quiet_logs,
+    _read_wav_mono16k,
+    _sounddevice_stream,
+    speculative_greedy,
+    tk,
+    _to_pcm16,
+    warm_local_model,
+)
+
+
+# ═══════════════════════════════════════════════════
+# Подставные фокус и вставка: проверки PasteStrategyCache и FocusTracker без macOS.
+
+
+class FakeFocusSource(FocusSource):
+    """Ручные события фокуса для проверок без macOS."""
+
+    def __init__(self, running=(), front=None):
+        self._apps = {bid: object() for bid in running}
+        self._front = front
+        self._handlers = None
+
+    def running(self) -> list:
+        return list(self._apps.items())
+
+    def frontmost(self):
+        return self._front, self._apps.get(self._front)
+
+    def subscribe(self, on_activate, on_launch, on_terminate):
+        self._handlers = (on_activate, on_launch, on_terminate)
+
+    def launch(self, bid):
+        self._apps[bid] = object()
+        self._handlers[1](bid, self._apps[bid])
+
+    def activate(self, bid):
+        self._front = bid
+        self._handlers[0](bid, self._apps.setdefault(bid, object()))
+
+    def terminate(self, bid):
+        app = self._apps.pop(bid, None)
+        self._handlers[2](bid, app)
+
+
+class FakePasteBackend(PasteBackend):
+    """Детерминированная вставка для бенчмарка: (bundle, способ) → (успех, мс)."""
+
+    def __init__(self, profile: dict, *, default=(False, 5.0), accessibility: bool = True):
+        self.profile = profile
+        self.default = default
+        self.accessibility = accessibility
+        self.calls = []
+
+    def accessibility_ok(self) -> bool:
+        return self.accessibility
+
+    def send(self, method: str, target: str, text: str) -> bool:
+        ok, ms = self.profile.get((target, method), self.default)
+        self.calls.append((target, method))
+        time.sleep(ms / 1000.0)
+        return ok
+
+
+# ── Прогрев: python whisper_mac.py bench-warmup ──
+
+def bench_warmup_main(argv: list) -> int:
+    """Время до готовности модели в чистых процессах: transcribe по нулям против прогрева форм."""
+    import argparse
+    import statistics
+    parser = argparse.ArgumentParser(
+        prog="whisper_mac.py bench-warmup",
+        description="time-to-ready локальной модели: legacy-прогрев vs прогрев форм",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+    if _lazy_import("mlx_whisper") is None:
+        print("mlx_whisper недоступен на этой машине")
+        return 2
+
+    code = (
+        "import json, time, whisper_mac as w; w._quiet_logs(False); "
+        "t = time.perf_counter(); e = w._lazy_import('mlx_whisper'); "
+        "r = w.warm_local_model(e, targeted={targeted}); "
+        "r['import_ms'] = round((t - w._PROCESS_T0) * 1000, 1); print(json.dumps(r))"
+    )
+    # Первый прогон — прогреть дисковый кэш ОС весами (в замер не идёт), иначе
+    # первый режим платит за холодное чтение с диска.
+    modes = (("legacy", False), ("shapes", True))
+    subprocess.run([sys.executable, "-c", code.format(targeted=True)],
+                   capture_output=True, cwd=str(Path(__file__).resolve().parent))
+    for name, targeted in modes:
+        ready = []
+        for _ in range(max(1, args.repeat)):
+            proc = subprocess.run(
+                [sys.executable, "-c", code.format(targeted=targeted)],
+                capture_output=True, text=True, cwd=str(Path(__file__).resolve().parent),
+            )
+            lines = proc.stdout.strip().splitlines()
+            if proc.returncode != 0 or not lines:
+                print(f"{name}: ошибка\n{proc.stderr[-400:]}")
+                return 1
+            ready.append(json.loads(lines[-1])["ready_ms"])
+        print(f"{name:<8} time-to-ready p50 {statistics.median(ready):>8.0f}ms  "
+              f"(min {min(ready):.0f}, max {max(ready):.0f})")
+    return 0
+
+
+# ═══════════════════════════════════════════════════
+# Офлайн-бенчмарк: python whisper_mac.py bench <dir|wav...>
+#
+# Проигрывает WAV-файлы блоками по 1024 сэмпла в TranscriptionSession —
+# те же воркеры (_streaming_worker / _groq_worker), что и в App, но без
+# микрофона, окна и Groq.
+
+FAKE_HARD_RMS = 4 * EQ_RMS_THRESHOLD   # тише — «неразборчивая» речь для FakeEngine(errors)
+FAKE_VOCAB = (
+    "привет", "сегодня", "мы", "обсуждаем", "релиз", "WhisperMac", "задачи",
+    "на", "неделю", "Claude", "Code", "проверить", "логи", "и", "метрики",
+    "Zoom", "созвон", "в", "три", "часа", "Miro", "доска", "готова",
+)
+
+
+class FakeEngine:
+    """
+    Детерминированный стенд-ин mlx_whisper для бенчмарков. "Декодирует"
+    со скоростью rtf (sleep) и возвращает текст, зависящий только от
+    содержимого аудио: 1–2 слова на каждые 0.5 s звука выше порога EQ
+    (~2.5 слова в секунду). Слова считаются по полусекундным кадрам, так что
+    текст по чанкам совпадает с текстом по всей записи — это «эталон».
+
+    errors — доля ошибок «слабой модели»: столько слов подменяется в тихих
+    кадрах (RMS ниже FAKE_HARD_RMS, как неразборчивая речь) и в десять раз
+    меньше в громких; avg_logprob падает вместе с долей подмен.
+    """
+
+    def __init__(self, rtf: float = 0.05, errors: float = 0.0):
+        self.rtf = rtf
+        self.errors = errors
+
+    def transcribe(self, audio, **opts) -> dict:
+        audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+        time.sleep(len(audio) / SAMPLE_RATE * self.rtf)
+        frame = SAMPLE_RATE // 2
+        voiced = 0
+        words = []
+        wrong = 0
+        for i in range(0, len(audio) - frame + 1, frame):
+            seg = audio[i:i + frame]
+            rms = float(np.sqrt(np.mean(seg * seg)))
+            if rms <= EQ_RMS_THRESHOLD:
+                continue
+            voiced += 1
+            seed = zlib.crc32(np.round(seg[::160] * 1000.0).astype(np.int16).tobytes())
+            rate = self.errors if rms < FAKE_HARD_RMS else self.errors * 0.1
+            for k in range(2 if seed % 4 == 0 else 1):
+                pick = seed + k * 7919
+                if rate and (seed >> 8) // (k + 1) % 1000 < rate * 1000:
+                    pick += 1   # подмена соседним словом словаря
+                    wrong += 1
+                words.append(FAKE_VOCAB[pick % len(FAKE_VOCAB)])
+        no_speech = 0.05 if voiced else 0.95
+        avg_logprob = -0.35 - 3.0 * wrong / max(1, len(words))
+        return {
+            "text": " ".join(words),
+            "segments": [{"avg_logprob": avg_logprob, "no_speech_prob": no_speech}],
+        }
+
+
+class GilBoundEngine(FakeEngine):
+    """
+    FakeEngine, который «декодирует», не отпуская GIL: кусками по hold_ms
+    крутит builtin sum(range(n)) — C-цикл без проверок eval-loop, как длинный
+    вызов в расширение. Нужен bench-ui, чтобы воспроизвести конкуренцию за GIL.
+    """
+
+    def __init__(self, rtf: float = 0.3, hold_ms: float = 40.0):
+        super().__init__(rtf)
+        self.hold_ms = hold_ms
+        self._per_ms = None
+
+    def _calibrate(self) -> int:
+        n = 200_000
+        started = time.perf_counter()
+        sum(range(n))
+        per_ms = n / max(1e-6, (time.perf_counter() - started) * 1000.0)
+        return max(1000, int(per_ms))
+
+    def transcribe(self, audio, **opts) -> dict:
+        if self._per_ms is None:
+            self._per_ms = self._calibrate()
+        audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+        deadline = time.perf_counter() + len(audio) / SAMPLE_RATE * self.rtf
+        block = int(self._per_ms * self.hold_ms)
+        while time.perf_counter() < deadline:
+            sum(range(block))
+        rtf, self.rtf = self.rtf, 0.0
+        try:
+            return super().transcribe(audio, **opts)
+        finally:
+            self.rtf = rtf
+
+
+class MockGroqServer:
+    """
+    Локальный стенд-ин Groq /audio/transcriptions на 127.0.0.1: принимает
+    тот же multipart, распознаёт FakeEngine'ом, отвечает {"text": ...}.
+
+    script       — ответы на первые запросы: [(status, {заголовки}), ...], дальше — обычные.
+    audio_limit  — аудио-секунд до исчерпания; ответы несут x-ratelimit-*-audio-seconds,
+                   сверх лимита — 429 с Retry-After = reset_sec.
+    bandwidth_kbps — тело читается не быстрее этого (медленный аплинк); 0 — без ограничения.
+    Тело — по Content-Length или chunked (счётчик chunked). Время обработки после
+    приёма тела отдаётся в x-processing-ms.
+    """
+
+    def __init__(self, engine, *, latency_sec: float = 0.0, script=None,
+                 audio_limit: float = None, reset_sec: float = 3600.0,
+                 bandwidth_kbps: float = 0.0):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = server._read_throttled(self)
+                received = time.perf_counter()
+                with server._lock:
+                    server.requests += 1
+                    scripted = server.script.pop(0) if server.script else None
+                if scripted is not None:
+                    status, headers = scripted
+                    self._reply(status, {"error": {"message": f"scripted {status}"}}, headers)
+                    return
+                try:
+                    fields, files = _parse_multipart(self.headers.get("Content-Type", ""), body)
+                    fname, data = files["file"]
+                    audio = _decode_upload(fname, data)
+                    headers = server._charge(len(audio) / SAMPLE_RATE)
+                    if headers is None:
+                        self._reply(429, {"error": {"message": "rate limit: audio seconds"}},
+                                    {"retry-after": f"{server.reset_sec:.0f}", **server._limit_headers()})
+                        return
+                    if server.latency_sec:
+                        time.sleep(server.latency_sec)
+                    text = engine.transcribe(audio, initial_prompt=fields.get("prompt"))["text"]
+                    headers["x-processing-ms"] = f"{(time.perf_counter() - received) * 1000.0:.1f}"
+                    self._reply(200, {"text": text}, headers)
+                except Exception as ex:  # noqa: BLE001
+                    self._reply(400, {"error": {"message": str(ex)}})
+
+            def _reply(self, status: int, payload: dict, headers: dict = None):
+                raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, *_args):
+                pass
+
+        self.latency_sec = latency_sec
+        self.script = list(script or [])
+        self.audio_limit = audio_limit
+        self.audio_used = 0.0
+        self.reset_sec = reset_sec
+        self.requests = 0
+        self.chunked = 0
+        self.bandwidth_kbps = bandwidth_kbps
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._httpd.server_port}/openai/v1/audio/transcriptions"
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def _read_throttled(self, handler) -> bytes:
+        # Сокетные буферы loopback вмещают мегабайты, поэтому «канал» — темп чтения:
+        # ответ уходит не раньше, чем тело пришло бы по медленной ссылке.
+        rate = self.bandwidth_kbps * 1000.0 / 8.0
+        started = time.perf_counter()
+        parts, got = [], 0
+        for block in _iter_http_body(handler, 16 * 1024):
+            parts.append(block)
+            got += len(block)
+            ahead = got / rate - (time.perf_counter() - started) if rate else 0.0
+            if ahead > 0:
+                time.sleep(ahead)
+        if "chunked" in (handler.headers.get("Transfer-Encoding") or "").lower():
+            with self._lock:
+                self.chunked += 1
+        return b"".join(parts)
+
+    def _limit_headers(self) -> dict:
+        if self.audio_limit is None:
+            return {}
+        return {
+            "x-ratelimit-limit-audio-seconds": f"{self.audio_limit:.0f}",
+            "x-ratelimit-remaining-audio-seconds": f"{max(0.0, self.audio_limit - self.audio_used):.1f}",
+            "x-ratelimit-reset-audio-seconds": f"{self.reset_sec:.0f}s",
+        }
+
+    def _charge(self, audio_sec: float):
+        """Заголовки лимита для ответа 200 или None, если аудио-секунд не хватает."""
+        with self._lock:
+            if self.audio_limit is not None and self.audio_used + audio_sec > self.audio_limit:
+                return None
+            self.audio_used += audio_sec
+            return self._limit_headers()
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def _replay_feed(path: Path, engine, *, use_groq: bool, speed: float, **session_kw) -> tuple:
+    """Подача записи блоками по 1024 сэмпла и stop; распознавание идёт дальше в фоне."""
+    audio = _read_wav_mono16k(path)
+    trace = UtteranceTrace("groq" if use_groq else "local", persist=False)
+    session = TranscriptionSession(engine, use_groq=use_groq, trace=trace, **session_kw)
+    session.start()
+
+    block = 1024
+    t0 = time.perf_counter()
+    for i in range(0, len(audio), block):
+        blk = audio[i:i + block].reshape(-1, 1)
+        session.feed(blk.copy())
+        if speed > 0:
+            due = t0 + (i + len(blk)) / SAMPLE_RATE / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    session.stop()
+    trace.add("stop", session.stopped_at, time.perf_counter())
+    return session, len(audio) / SAMPLE_RATE
+
+
+def _replay_result(path: Path, session, audio_sec: float) -> dict:
+    text = session.wait()
+    trace = session.trace
+    decode_ms = sum(sp["ms"] for sp in trace.spans if sp["phase"] in ("decode", "final_pass", "final_safe", "server"))
+    return {
+        "file": path.name,
+        "audio_sec": round(audio_sec, 2),
+        "stop_to_text_ms": round((session.finished_at - session.stopped_at) * 1000.0, 1),
+        "rtf": round(decode_ms / 1000.0 / audio_sec, 4) if audio_sec else 0.0,
+        "final_pass": any(sp["phase"] == "final_pass" for sp in trace.spans),
+        "text": text or "",
+    }
+
+
+def _replay_file(path: Path, engine, *, use_groq: bool, speed: float, **session_kw) -> dict:
+    """Одна запись: подача → stop → ждём текст."""
+    session, audio_sec = _replay_feed(path, engine, use_groq=use_groq, speed=speed, **session_kw)
+    return _replay_result(path, session, audio_sec)
+
+
+def _peak_rss_mb() -> float:
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss: байты на macOS, килобайты на Linux.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _bench_summary(rows: list) -> dict:
+    latencies = [r["stop_to_text_ms"] for r in rows]
+    return {
+        "files": len(rows),
+        "audio_sec": round(sum(r["audio_sec"] for r in rows), 1),
+        "stop_to_text_p50_ms": round(_percentile(latencies, 50), 1),
+        "stop_to_text_p95_ms": round(_percentile(latencies, 95), 1),
+        "rtf_mean": round(sum(r["rtf"] for r in rows) / len(rows), 4),
+        "final_pass_rate": round(sum(1 for r in rows if r["final_pass"]) / len(rows), 3),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+# Метрика → (допуск относительный, допуск абсолютный); все "меньше — лучше".
+BENCH_TOLERANCES = {
+    "stop_to_text_p50_ms": (0.15, 30.0),
+    "stop_to_text_p95_ms": (0.20, 50.0),
+    "rtf_mean": (0.15, 0.005),
+    "final_pass_rate": (0.0, 0.10),
+    "peak_rss_mb": (0.15, 20.0),
+}
+
+
+def _compare_baseline(summary: dict, baseline: dict, scale: float = 1.0) -> list:
+    """Список регрессий: (метрика, baseline, сейчас, порог)."""
+    regressions = []
+    for key, (rel, abs_slack) in BENCH_TOLERANCES.items():
+        if key not in baseline or key not in summary:
+            continue
+        base = float(baseline[key])
+        limit = base * (1.0 + rel * scale) + abs_slack * scale
+        if float(summary[key]) > limit:
+            regressions.append((key, base, summary[key], round(limit, 3)))
+    return regressions
+
+
+def _bench_inputs(paths: list) -> list:
+    files = []
+    for raw in paths:
+        p = Path(raw).expanduser()
+        if p.is_dir():
+            files.extend(sorted(p.glob("*.wav")))
+        elif p.exists():
+            files.append(p)
+    return files
+
+
+def bench_main(argv: list) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="whisper_mac.py bench",
+        description="Офлайн-реплей WAV через захват и воркеры: stop→text, RTF, память, final-pass",
+    )
+    parser.add_argument("inputs", nargs="+", help="каталог(и) или WAV-файлы")
+    parser.add_argument("--engine", choices=("fake", "mlx", "groq-mock"), default="fake")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="1 — реальное время, N — в N раз быстрее, 0 — без пауз")
+    parser.add_argument("--fake-rtf", type=float, default=0.05, help="скорость FakeEngine")
+    parser.add_argument("--mock-latency", type=float, default=0.15,
+                        help="задержка ответа mock-Groq, сек")
+    parser.add_argument("--baseline", help="JSON с эталоном: сравнить и вернуть 1 при регрессии")
+    parser.add_argument("--save-baseline", help="записать текущую сводку как эталон")
+    parser.add_argument("--tolerance-scale", type=float, default=1.0,
+                        help="множитель допусков при сравнении с эталоном")
+    parser.add_argument("--json", help="сохранить подробный отчёт в JSON")
+    parser.add_argument("--back-to-back", action="store_true",
+                        help="записи подряд, не дожидаясь текста предыдущей (конвейер)")
+    parser.add_argument("--verbose", action="store_true", help="печатать лог воркеров")
+    args = parser.parse_args(argv)
+
+    _quiet_logs(args.verbose)
+    files = _bench_inputs(args.inputs)
+    if not files:
+        print("Нет WAV-файлов для реплея")
+        return 2
+
+    mock = None
+    use_groq = args.engine == "groq-mock"
+    if args.engine == "mlx":
+        engine = local_engine(_lazy_import("mlx_whisper"))
+        if engine is None:
+            print("mlx_whisper недоступен на этой машине")
+            return 2
+    else:
+        engine = FakeEngine(rtf=args.fake_rtf)
+    if use_groq:
+        mock = MockGroqServer(engine, latency_sec=args.mock_latency)
+        wm.GROQ_API_URL = mock.url
+        wm.GROQ_API_KEY = "bench"
+
+    rows = []
+    started = time.perf_counter()
+    try:
+        if args.back_to_back:
+            # Как частые короткие диктовки: следующая запись стартует сразу после stop
+            # предыдущей, не дожидаясь её текста.
+            fed = [(path, *_replay_feed(path, engine, use_groq=use_groq, speed=args.speed))
+                   for path in files]
+            results = [_replay_result(path, session, sec) for path, session, sec in fed]
+        else:
+            results = (_replay_file(path, engine, use_groq=use_groq, speed=args.speed)
+                       for path in files)
+        for row in results:
+            rows.append(row)
+            print(
+                f"{row['file']:<32}{row['audio_sec']:>8.1f}s  stop→text {row['stop_to_text_ms']:>8.1f}ms  "
+                f"RTF {row['rtf']:.3f}  final={'да' if row['final_pass'] else 'нет'}"
+            )
+    finally:
+        if mock is not None:
+            mock.close()
+
+    summary = _bench_summary(rows)
+    summary["wall_sec"] = round(time.perf_counter() - started, 2)
+    summary["back_to_back"] = bool(args.back_to_back)
+    summary["engine"] = args.engine
+    summary["speed"] = args.speed
+    print()
+    for key, value in summary.items():
+        print(f"{key:<22}{value}")
+
+    if args.json:
+        Path(args.json).write_text(
+            json.dumps({"summary": summary, "files": rows}, ensure_ascii=False, indent=2),
+            encoding="utf-8",
+        )
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(
+            json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+        print(f"\nЭталон сохранён: {args.save_baseline}")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = _compare_baseline(summary, baseline, args.tolerance_scale)
+        if regressions:
+            print("\nРЕГРЕССИИ относительно эталона:")
+            for key, base, cur, limit in regressions:
+                print(f"  {key}: {base} → {cur} (порог {limit})")
+            return 1
+        print("\nРегрессий относительно эталона нет")
+    return 0
+
+
+# ── Время импорта: python whisper_mac.py bench-imports ──────────
+
+IMPORT_BENCH_MODULES = (
+    "numpy", "tkinter", "sounddevice", "mlx_whisper",
+    "ApplicationServices", "Quartz", "AppKit", "pynput",
+)
+
+
+def _importtime(code: str) -> dict:
+    """Запуск `python -X importtime -c code` в чистом процессе → {модуль: cumulative мс}."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, timeout=300,
+        cwd=str(Path(__file__).resolve().parent),
+    )
+    if proc.returncode != 0:
+        return {}
+    times = {}
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[0].startswith("import time:"):
+            continue
+        try:
+            cumulative_us = int(parts[1])
+        except ValueError:
+            continue   # строка-заголовок
+        name = parts[2].strip()
+        if name not in times:   # модуль грузится один раз — первое вхождение и есть его цена
+            times[name] = cumulative_us / 1000.0
+    return times
+
+
+def bench_imports_main(argv: list) -> int:
+    import argparse
+    import statistics
+    parser = argparse.ArgumentParser(
+        prog="whisper_mac.py bench-imports",
+        description="Стоимость импорта тяжёлых модулей и самого whisper_mac (в отдельных процессах)",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="прогонов на модуль (медиана)")
+    args = parser.parse_args(argv)
+    repeat = max(1, args.repeat)
+
+    print(f"{'модуль':<22}{'мс (медиана)':>14}  в импорте whisper_mac")
+    own = [_importtime("import whisper_mac") for _ in range(repeat)]
+    pulled = set(own[0]) if own and own[0] else set()
+    for name in IMPORT_BENCH_MODULES:
+        runs = [_importtime(f"import {name}").get(name) for _ in range(repeat)]
+        runs = [r for r in runs if r is not None]
+        cost = f"{statistics.median(runs):>14.1f}" if runs else f"{'недоступен':>14}"
+        print(f"{name:<22}{cost}  {'да' if name in pulled else 'нет'}")
+    own_ms = [r["whisper_mac"] for r in own if "whisper_mac" in r]
+    if own_ms:
+        print(f"{'whisper_mac':<22}{statistics.median(own_ms):>14.1f}")
+    return 0
+
+
+# ── Отзывчивость UI во время декодирования: python whisper_mac.py bench-ui ──
+
+def _lateness_probe(stop: threading.Event, interval: float, out: list, work=None):
+    """Просыпается каждые interval сек (как _tick/коллбэк PortAudio) и пишет опоздание, мс."""
+    due = time.perf_counter() + interval
+    while not stop.is_set():
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        out.append(max(0.0, (time.perf_counter() - due) * 1000.0))
+        if work is not None:
+            work()
+        due += interval
+        if due < time.perf_counter():   # не копим долг после длинной паузы
+            due = time.perf_counter() + interval
+
+
+def bench_ui_main(argv: list) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="whisper_mac.py bench-ui",
+        description="Джиттер 33-мс тика и опоздание аудио-коллбэка во время декодирования",
+    )
+    parser.add_argument("--seconds", type=float, default=8.0, help="длительность каждого режима")
+    parser.add_argument("--rtf", type=float, default=0.5, help="скорость GIL-движка")
+    parser.add_argument("--hold-ms", type=float, default=40.0,
+                        help="сколько GIL-движок держит GIL за один C-вызов")
+    parser.add_argument("--modes", default="idle,inproc,process",
+                        help="через запятую: idle, inproc, process")
+    args = parser.parse_args(argv)
+    _quiet_logs(False)
+
+    t = np.arange(SAMPLE_RATE * 12, dtype=np.float32) / SAMPLE_RATE
+    audio = (0.1 * np.sin(2 * np.pi * 220.0 * t)).astype(np.float32)
+    frame = audio[:1024]
+
+    def audio_work():
+        # Та же работа, что в _on_audio_block: RMS + FFT по блоку.
+        float(np.sqrt(np.mean(frame ** 2)))
+        np.abs(np.fft.rfft(frame * np.hanning(len(frame))))
+
+    print(f"{'режим':<10}{'тик p50/p95/p99/max, мс':>34}{'коллбэк p50/p95/p99/max, мс':>36}")
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        engine = None
+        if mode == "inproc":
+            engine = GilBoundEngine(args.rtf, args.hold_ms)
+        elif mode == "process":
+            engine = InferenceClient(f"gil:{args.rtf}:{args.hold_ms}", ring_sec=60).start()
+            if not engine.wait_ready(60):
+                print("process: процесс инференса не поднялся")
+                return 1
+
+        stop = threading.Event()
+        ticks, callbacks = [], []
+        probes = [
+            threading.Thread(target=_lateness_probe, args=(stop, 0.033, ticks), daemon=True),
+            threading.Thread(target=_lateness_probe,
+                             args=(stop, 1024 / SAMPLE_RATE, callbacks, audio_work), daemon=True),
+        ]
+
+        def decode_loop():
+            while not stop.is_set():
+                session = TranscriptionSession(
+                    engine, trace=UtteranceTrace("local", persist=False)
+                )
+                session.run_offline(audio)
+
+        if engine is not None:
+            probes.append(threading.Thread(target=decode_loop, daemon=True))
+        for th in probes:
+            th.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for th in probes:
+            th.join(timeout=30)
+        if isinstance(engine, InferenceClient):
+            engine.close()
+
+        def fmt(values):
+            return "/".join(
+                f"{_percentile(values, q):.1f}" for q in (50, 95, 99)
+            ) + f"/{max(values):.1f}" if values else "-"
+
+        print(f"{mode:<10}{fmt(ticks):>34}{fmt(callbacks):>36}")
+    return 0
+
+
+# Профиль приложений для bench-paste: как ведут себя способы вставки (успех, мс).
+# Таймаут osascript — те же 1.5 с, что в cmd_v_osascript*.
+BENCH_PASTE_PROFILE = {
+    ("com.apple.TextEdit", "ax"): (True, 12.0),
+    ("com.google.Chrome", "ax"): (False, 350.0),
+    ("com.google.Chrome", "osascript-keycode"): (True, 240.0),
+    ("com.google.Chrome", "osascript"): (True, 260.0),
+    ("com.tinyspeck.slackmacgap", "ax"): (False, 40.0),
+    ("com.tinyspeck.slackmacgap", "osascript-keycode"): (False, 1500.0),
+    ("com.tinyspeck.slackmacgap", "osascript"): (False, 1500.0),
+    ("com.tinyspeck.slackmacgap", "pynput"): (True, 50.0),
+    ("com.apple.Terminal", "ax"): (False, 20.0),
+    ("com.apple.Terminal", "osascript-keycode"): (True, 230.0),
+}
+
+
+def bench_paste_main(argv: list) -> int:
+    """Средняя задержка вставки: фиксированная цепочка против кэша стратегий (fake-бэкенд)."""
+    import argparse
+    import statistics
+    import tempfile
+    parser = argparse.ArgumentParser(
+        prog="whisper_mac.py bench-paste",
+        description="задержка вставки по приложениям: цепочка auto vs кэш стратегий",
+    )
+    parser.add_argument("--rounds", type=int, default=6, help="вставок в каждое приложение")
+    parser.add_argument("--scale", type=float, default=0.1,
+                        help="множитель задержек профиля (1 = реальное время)")
+    args = parser.parse_args(argv)
+    _quiet_logs(False)
+
+    profile = {k: (ok, ms * args.scale) for k, (ok, ms) in BENCH_PASTE_PROFILE.items()}
+    apps = sorted({bid for bid, _ in profile})
+    with tempfile.TemporaryDirectory() as tmp:
+        # Второй кэш читает файл первого — как после перезапуска приложения.
+        path = Path(tmp) / "paste_strategy.json"
+        modes = (("chain", lambda: None), ("cache", lambda: PasteStrategyCache(path)),
+                 ("restart", lambda: PasteStrategyCache(path)))
+        print(f"{'режим':<10}{'приложение':<30}{'мс p50/max':>16}{'попыток':>10}  способ")
+        for name, make_cache in modes:
+            cache = make_cache()
+            for bid in apps:
+                backend = FakePasteBackend(profile, default=(False, 5.0 * args.scale))
+                lat, tries, method = [], [], ""
+                for _ in range(max(1, args.rounds)):
+                    started = time.perf_counter()
+                    ok, method, attempts = paste_with_strategy(
+                        backend, cache, bid, "текст", mode="auto"
+                    )
+                    lat.append((time.perf_counter() - started) * 1000.0 / args.scale)
+                    tries.append(len(attempts))
+                print(f"{name:<10}{bid:<30}{_percentile(lat, 50):>8.0f}/{max(lat):<7.0f}"
+                      f"{statistics.mean(tries):>10.1f}  {method or '-'}")
+
+        # Разжалование: выученный способ перестал работать.
+        cache = PasteStrategyCache(path)
+        profile[("com.apple.TextEdit", "ax")] = (False, 12.0 * args.scale)
+        profile[("com.apple.TextEdit", "osascript-keycode")] = (True, 230.0 * args.scale)
+        backend = FakePasteBackend(profile)
+        firsts = []
+        for _ in range(PASTE_DEMOTE_AFTER + 1):
+            paste_with_strategy(backend, cache, "com.apple.TextEdit", "текст", mode="auto")
+            firsts.append(cache.order("com.apple.TextEdit")[0])
+        print(f"TextEdit после отказа ax: первым пробуется {' → '.join(firsts)}")
+    return 0
+
+class _BenchScheduler:
+    """after(ms, fn) и createfilehandler без Tk: bench-render на машине без дисплея."""
+
+    def __init__(self):
+        self._heap = []
+        self._n = 0
+        self._files = {}
+
+    def createfilehandler(self, fd, mask, fn):
+        self._files[fd] = fn
+
+    def deletefilehandler(self, fd):
+        self._files.pop(fd, None)
+
+    def after(self, ms, fn):
+        import heapq
+        self._n += 1
+        heapq.heappush(self._heap, (time.perf_counter() + ms / 1000.0, self._n, fn))
+        return self._n
+
+    def run(self, seconds: float):
+        import heapq
+        import select
+        end = time.perf_counter() + seconds
+        while True:
+            now = time.perf_counter()
+            if now >= end:
+                return
+            due = self._heap[0][0] if self._heap else end
+            wait = max(0.0, min(due, end) - now)
+            if self._files:
+                ready, _, _ = select.select(list(self._files), [], [], wait)
+                for fd in ready:
+                    self._files[fd](fd, 2)
+                if ready:
+                    continue
+            else:
+                time.sleep(wait)
+            if self._heap and self._heap[0][0] <= time.perf_counter():
+                heapq.heappop(self._heap)[2]()
+
+
+class _CountingCanvas:
+    """Считает вызовы canvas (и передаёт их настоящему, если он есть)."""
+
+    def __init__(self, canvas=None):
+        self.canvas = canvas
+        self.calls = 0
+
+    def coords(self, *args):
+        self.calls += 1
+        if self.canvas is not None:
+            self.canvas.coords(*args)
+
+    def itemconfig(self, *args, **kw):
+        self.calls += 1
+        if self.canvas is not None:
+            self.canvas.itemconfig(*args, **kw)
+
+
+def bench_render_main(argv: list) -> int:
+    """Пробуждения цикла анимации, вызовы canvas и CPU: старый цикл против damage tracking."""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="whisper_mac.py bench-render",
+        description="пробуждения/с, вызовы canvas/с и CPU анимации пилюли: legacy vs damage tracking",
+    )
+    parser.add_argument("--seconds", type=float, default=5.0, help="длительность каждого замера")
+    parser.add_argument("--modes", default="idle,recording", help="через запятую: idle, processing, recording")
+    parser.add_argument("--headless", action="store_true", help="без Tk даже при наличии дисплея")
+    parser.add_argument("--events-per-sec", type=float, default=0.0,
+                        help="события шины из фонового потока (как EV_STATE от воркеров)")
+    args = parser.parse_args(argv)
+
+    root = None
+    if not args.headless:
+        try:
+            root = tk.Tk()
+            root.withdraw()
+        except tk.TclError:
+            root = None
+    print(f"цикл: {'Tk' if root is not None else 'headless (без дисплея)'}")
+    # Пробуждения — все вызовы в Tk-потоке: кадры, опрос шины (если без file handler)
+    # и срабатывания socketpair шины; цикл собирается так же, как в App.
+    print(f"{'вариант':<10}{'режим':<12}{'пробуждений/с':>15}{'canvas/с':>10}{'CPU, мс/с':>11}")
+    rng = np.random.default_rng(0)
+    levels = np.zeros(BAR_COUNT, dtype=np.float32)
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        for variant, damage in (("legacy", False), ("damage", True)):
+            sched = _BenchScheduler() if root is None else None
+            canvas = _CountingCanvas(tk.Canvas(root, width=W, height=H) if root is not None else None)
+            bars = []
+            for i in range(BAR_COUNT):
+                x = BARS_X + i * BAR_STEP
+                bid = canvas.canvas.create_rectangle(x, 0, x + BAR_W, 1) if canvas.canvas else i
+                bars.append((bid, x))
+            renderer = BarRenderer(canvas, bars, track_damage=damage)
+
+            bus = UIEventBus()
+            bus.on(wm.EV_STATE, lambda _payload: None)
+
+            def frame():
+                bus.drain()
+                if mode == "recording":
+                    levels[:] = rng.random(BAR_COUNT, dtype=np.float32)
+                changed = renderer.render(mode, levels)
+                return mode != "idle" or changed > 0 or bus.pending()
+
+            tkapp = sched if sched is not None else root.tk
+            attached = bus.attach(tkapp, lambda: loop.wake())
+            loop = AnimationLoop(sched.after if sched else root.after, frame, suspend=damage,
+                                 poll=None if attached else bus.pending, poll_ms=UI_IDLE_POLL_MS)
+            stop = threading.Event()
+            poster = None
+            if args.events_per_sec > 0:
+                def post():
+                    while not stop.wait(1.0 / args.events_per_sec):
+                        bus.post(wm.EV_STATE, "bench")
+                poster = threading.Thread(target=post, daemon=True)
+                poster.start()
+            cpu0 = time.process_time()
+            loop.wake()
+            if sched is not None:
+                sched.run(args.seconds)
+            else:
+                root.after(int(args.seconds * 1000), root.quit)
+                root.mainloop()
+            cpu_ms = (time.process_time() - cpu0) * 1000.0
+            stop.set()
+            if poster is not None:
+                poster.join()
+            bus.close(tkapp)
+            wakeups = loop.wakeups + loop.polls + bus.wakes
+            print(f"{variant:<10}{mode:<12}{wakeups / args.seconds:>15.1f}"
+                  f"{canvas.calls / args.seconds:>10.0f}{cpu_ms / args.seconds:>11.2f}")
+            if root is not None:
+                for job in root.tk.call("after", "info"):
+                    root.after_cancel(job)
+    if root is not None:
+        root.destroy()
+    return 0
+
+class _FakeInputStream:
+    """Стенд-ин sd.InputStream: открытие занимает open_ms, дальше блоки в реальном темпе."""
+
+    def __init__(self, callback, open_ms: float = 120.0):
+        self.callback = callback
+        self.open_ms = open_ms
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        time.sleep(self.open_ms / 1000.0)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        period = CAPTURE_BLOCK / SAMPLE_RATE
+        # Первый блок приходит, когда буфер устройства заполнился.
+        while not self._stop.wait(period):
+            block = np.zeros((CAPTURE_BLOCK, 1), dtype=np.float32)
+            self.callback(block, CAPTURE_BLOCK, None, None)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+    def close(self):
+        pass
+
+
+def bench_capture_main(argv: list) -> int:
+    """Старт записи → первый сэмпл: поток на каждую запись против постоянного с pre-roll."""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="whisper_mac.py bench-capture",
+        description="задержка начала записи: открытие потока на запись vs постоянный поток с pre-roll",
+    )
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--fake", action="store_true",
+                        help="без микрофона: эмулировать поток (открытие --open-ms)")
+    parser.add_argument("--open-ms", type=float, default=120.0)
+    parser.add_argument("--preroll-ms", type=float, default=CAPTURE_PREROLL_MS)
+    args = parser.parse_args(argv)
+    _quiet_logs(False)
+
+    factory = _sounddevice_stream
+    if args.fake or _lazy_import("sounddevice") is None:
+        print(f"поток: эмуляция (открытие {args.open_ms:.0f} мс)")
+
+        def factory(callback):
+            return _FakeInputStream(callback, args.open_ms)
+    print(f"{'режим':<12}{'begin→блок p50/max, мс':>26}{'pre-roll, мс':>14}{'аудио до begin, мс':>20}")
+    for name, persistent in (("per-record", False), ("persistent", True)):
+        cap = CaptureStream(persistent=persistent, preroll_ms=args.preroll_ms,
+                            stream_factory=factory)
+        if persistent:
+            cap.open()
+            time.sleep(args.preroll_ms / 1000.0 + 0.1)
+        first, pre = [], []
+        try:
+            for _ in range(max(1, args.repeat)):
+                session = TranscriptionSession(FakeEngine(), trace=UtteranceTrace("bench", persist=False))
+                cap.begin(session)
+                deadline = time.perf_counter() + 5.0
+                while cap.first_block_ms is None and time.perf_counter() < deadline:
+                    time.sleep(0.002)
+                cap.end()
+                first.append(cap.first_block_ms or float("nan"))
+                pre.append(cap.preroll_ms)
+                # Пауза между диктовками: кольцо снова наполняется.
+                time.sleep(args.preroll_ms / 1000.0 + 0.05)
+        finally:
+            cap.close()
+        # «Аудио до begin» > 0 — столько речи до нажатия уже в записи,
+        # < 0 — столько начала после нажатия теряется.
+        lead = [p - f for f, p in zip(first, pre)]
+        print(f"{name:<12}{_percentile(first, 50):>16.1f}/{max(first):<9.1f}"
+              f"{_percentile(pre, 50):>14.0f}{_percentile(lead, 50):>20.1f}")
+    return 0
+
+def bench_endpoint_main(argv: list) -> int:
+    """Автостоп на записанных WAV: где сработал, сколько отрезал, не оборвал ли речь."""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="whisper_mac.py bench-endpoint",
+        description="проверка автостопа по тишине на WAV: момент срабатывания и обрезка хвоста",
+    )
+    parser.add_argument("inputs", nargs="+", help="WAV-файлы или каталоги")
+    parser.add_argument("--pad-sec", type=float, default=2.0,
+                        help="тишина в конце, как будто пользователь ещё не кликнул")
+    parser.add_argument("--silence-ms", type=float, default=ENDPOINT_SILENCE_MS)
+    parser.add_argument("--min-speech-ms", type=float, default=ENDPOINT_MIN_SPEECH_MS)
+    parser.add_argument("--keep-ms", type=float, default=ENDPOINT_KEEP_MS)
+    parser.add_argument("--rms", type=float, default=ENDPOINT_RMS)
+    args = parser.parse_args(argv)
+    files = _bench_inputs(args.inputs)
+    if not files:
+        print("нет входных WAV")
+        return 2
+
+    print(f"{'файл':<28}{'длина':>8}{'речь до':>9}{'стоп':>8}{'отрезано':>10}{'сэкономлено':>13}  итог")
+    early = 0
+    for path in files:
+        audio = _read_wav_mono16k(path)
+        audio = np.concatenate([audio, np.zeros(int(args.pad_sec * SAMPLE_RATE), dtype=np.float32)])
+        ep = Endpointer(silence_ms=args.silence_ms, min_speech_ms=args.min_speech_ms,
+                        keep_ms=args.keep_ms, threshold=args.rms)
+        speech_end = 0
+        for pos in range(0, len(audio), CAPTURE_BLOCK):
+            block = audio[pos:pos + CAPTURE_BLOCK]
+            if float(np.sqrt(np.mean(block * block))) > args.rms:
+                speech_end = pos + len(block)
+            if ep.feed(block):
+                break
+        total = len(audio) / SAMPLE_RATE
+        if ep.fired_at is None:
+            print(f"{path.name:<28}{total:>7.1f}s{speech_end / SAMPLE_RATE:>8.1f}s{'-':>8}{'-':>10}{'-':>13}  не сработал")
+            continue
+        kept_end = ep.fired_at - ep.trim_samples
+        ok = kept_end >= speech_end
+        early += not ok
+        print(
+            f"{path.name:<28}{total:>7.1f}s{speech_end / SAMPLE_RATE:>8.1f}s"
+            f"{ep.fired_at / SAMPLE_RATE:>7.1f}s{ep.trim_samples / SAMPLE_RATE:>9.2f}s"
+            f"{(len(audio) - ep.fired_at) / SAMPLE_RATE:>12.2f}s  {'ok' if ok else 'оборвал речь'}"
+        )
+    return 1 if early else 0
+
+def _memory_probe(mode: str, seconds: float, spill_sec: float) -> dict:
+    """Запись длиной seconds блоками по 1024 + подготовка WAV для Groq; пиковый RSS процесса."""
+    rng = np.random.default_rng(0)
+    noise = (rng.standard_normal(SAMPLE_RATE) * 0.05).astype(np.float32)
+    n_blocks = int(seconds * SAMPLE_RATE) // CAPTURE_BLOCK
+    base_mb = _peak_rss_mb()
+    if mode == "legacy":
+        # Как было до AudioStore: список float32-блоков, склейка на стопе, WAV в памяти.
+        chunks = []
+        for i in range(n_blocks):
+            off = (i * CAPTURE_BLOCK) % (SAMPLE_RATE - CAPTURE_BLOCK)
+            chunks.append(noise[off:off + CAPTURE_BLOCK].reshape(-1, 1).copy())
+        started = time.perf_counter()
+        all_audio = np.concatenate([c.flatten() for c in chunks])
+        pcm16 = (np.clip(all_audio.astype(np.float32), -1.0, 1.0) * 32767.0).astype("<i2")
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(SAMPLE_RATE)
+            wf.writeframes(pcm16.tobytes())
+        pieces = [buf.getvalue()]
+        spilled = False
+    else:
+        store = AudioStore(spill_sec=spill_sec if mode == "spill" else 0.0)
+        for i in range(n_blocks):
+            off = (i * CAPTURE_BLOCK) % (SAMPLE_RATE - CAPTURE_BLOCK)
+            store.append(noise[off:off + CAPTURE_BLOCK].reshape(-1, 1).copy())
+        started = time.perf_counter()
+        _, pieces, _ = _encode_for_groq(store, "wav")
+        spilled = store.spilled
+    stop_ms = (time.perf_counter() - started) * 1000.0
+    # «Отправка»: тело multipart читается блоками, как это делает requests.
+    _, body_pieces = _multipart_pieces({"model": "x"}, "audio.wav", pieces, "audio/wav")
+    body = _TimedBody(body_pieces)
+    sent = 0
+    for block in body:
+        sent += len(block)
+    if mode != "legacy":
+        store.close()
+    return {
+        "mode": mode, "audio_sec": round(n_blocks * CAPTURE_BLOCK / SAMPLE_RATE, 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1), "base_rss_mb": round(base_mb, 1),
+        "stop_ms": round(stop_ms, 1), "body_mb": round(sent / 2 ** 20, 1), "spilled": spilled,
+    }
+
+
+def bench_memory_main(argv: list) -> int:
+    """Пиковый RSS длинной записи: как было, AudioStore в RAM, AudioStore с переливом на диск."""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="whisper_mac.py bench-memory",
+        description="пиковая память и время стопа для длинной синтетической записи",
+    )
+    parser.add_argument("--minutes", type=float, default=60.0)
+    parser.add_argument("--spill-sec", type=float, default=AUDIO_SPILL_SEC or 300.0)
+    parser.add_argument("--modes", default="legacy,ram,spill")
+    args = parser.parse_args(argv)
+
+    print(f"{'режим':<8}{'аудио':>9}{'пик RSS, МБ':>13}{'(база)':>9}{'стоп, мс':>10}{'тело, МБ':>10}")
+    code = (
+        "import json, whisper_mac as w, whisper_bench as b; w._quiet_logs(False); "
+        "print(json.dumps(b._memory_probe({mode!r}, {seconds}, {spill})))"
+    )
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        # Каждый режим — в чистом процессе: ru_maxrss не сбрасывается.
+        proc = subprocess.run(
+            [sys.executable, "-c", code.format(mode=mode, seconds=args.minutes * 60, spill=args.spill_sec)],
+            capture_output=True, text=True, cwd=str(Path(__file__).resolve().parent),
+        )
+        lines = proc.stdout.strip().splitlines()
+        if proc.returncode != 0 or not lines:
+            print(f"{mode}: ошибка\n{proc.stderr[-400:]}")
+            return 1
+        r = json.loads(lines[-1])
+        print(f"{r['mode']:<8}{r['audio_sec'] / 60:>8.0f}m{r['peak_rss_mb']:>13.0f}{r['base_rss_mb']:>9.0f}"
+              f"{r['stop_ms']:>10.0f}{r['body_mb']:>10.0f}")
+    return 0
+
+
+def _current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return _peak_rss_mb()   # macOS: только пик
+
+
+def _meeting_probe(mode: str, hours: float, speed: float, rtf: float, every_min: float) -> dict:
+    """
+    Синтетическая встреча (8 s речи / 2 s тишины) блоками по 1024 в ускоренном
+    времени; каждые every_min минут аудио — RSS процесса и отставание декодера.
+    """
+    rng = np.random.default_rng(0)
+    base = (rng.standard_normal(50 * SAMPLE_RATE) * 0.05).astype(np.float32)
+    for sec in range(8, 50, 10):
+        base[sec * SAMPLE_RATE:(sec + 2) * SAMPLE_RATE] *= 0.01
+    out_dir = Path(tempfile.mkdtemp(prefix="whispermac-meeting-"))
+    meeting = MeetingTranscript(out_dir / "meeting.txt") if mode == "meeting" else None
+    trace = UtteranceTrace("local", persist=False)
+    # Движок спит rtf·(аудио) реального времени; при ускорении speed это rtf·speed в «часах» встречи.
+    session = TranscriptionSession(FakeEngine(rtf / speed), trace=trace, meeting=meeting)
+    session.start()
+    total = int(hours * 3600 * SAMPLE_RATE) // CAPTURE_BLOCK * CAPTURE_BLOCK
+    every = int(every_min * 60 * SAMPLE_RATE)
+    points = []
+    t0 = time.perf_counter()
+    for i in range(0, total, CAPTURE_BLOCK):
+        off = i % (len(base) - CAPTURE_BLOCK)
+        session.feed(base[off:off + CAPTURE_BLOCK].copy())
+        if (i + CAPTURE_BLOCK) % every < CAPTURE_BLOCK:
+            points.append({
+                "min": round((i + CAPTURE_BLOCK) / SAMPLE_RATE / 60),
+                "rss_mb": round(_current_rss_mb(), 1),
+                "lag_sec": round(session.lag_sec, 1),
+            })
+        delay = t0 + (i + CAPTURE_BLOCK) / SAMPLE_RATE / speed - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    session.stop()
+    text = session.wait() or ""
+    row = {
+        "mode": mode, "audio_min": round(total / SAMPLE_RATE / 60), "points": points,
+        "peak_rss_mb": round(_peak_rss_mb(), 1), "text_chars": len(text),
+        "stop_to_text_ms": round((session.finished_at - session.stopped_at) * 1000.0, 1),
+    }
+    if meeting is not None:
+        row["segments"] = meeting.segments
+        row["file_kb"] = round(meeting.path.stat().st_size / 1024, 1) if meeting.path.exists() else 0.0
+        row["gaps"] = meeting.path.read_text(encoding="utf-8").count("пропущено") if meeting.path.exists() else 0
+    shutil.rmtree(out_dir, ignore_errors=True)
+    return row
+
+
+def bench_meeting_main(argv: list) -> int:
+    """Многочасовая запись: обычная диктовка против режима встречи — RSS и отставание по ходу."""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="whisper_mac.py bench-meeting",
+        description="память и отставание декодера на многочасовой синтетической встрече",
+    )
+    parser.add_argument("--hours", type=float, default=3.0)
+    parser.add_argument("--speed", type=float, default=200.0, help="ускорение подачи аудио")
+    parser.add_argument("--rtf", type=float, default=0.3, help="скорость «декодера» относительно аудио")
+    parser.add_argument("--every-min", type=float, default=30.0)
+    parser.add_argument("--modes", default="dictation,meeting")
+    args = parser.parse_args(argv)
+
+    code = (
+        "import json, whisper_mac as w, whisper_bench as b; w._quiet_logs(False); "
+        "print(json.dumps(b._meeting_probe({mode!r}, {hours}, {speed}, {rtf}, {every})))"
+    )
+    failed = False
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        proc = subprocess.run(
+            [sys.executable, "-c", code.format(mode=mode, hours=args.hours, speed=args.speed,
+                                               rtf=args.rtf, every=args.every_min)],
+            capture_output=True, text=True, cwd=str(Path(__file__).resolve().parent),
+        )
+        lines = proc.stdout.strip().splitlines()
+        if proc.returncode != 0 or not lines:
+            print(f"{mode}: ошибка\n{proc.stderr[-400:]}")
+            return 1
+        r = json.loads(lines[-1])
+        print(f"{r['mode']}: {r['audio_min']} мин, пик RSS {r['peak_rss_mb']:.0f} МБ, "
+              f"текст в памяти {r['text_chars']} симв., стоп→итог {r['stop_to_text_ms']:.0f} мс")
+        if "segments" in r:
+            print(f"  стенограмма: {r['segments']} фраз, {r['file_kb']:.0f} КБ, пропусков {r['gaps']}")
+        print(f"  {'мин':>6}{'RSS, МБ':>10}{'отставание, s':>15}")
+        for pt in r["points"]:
+            print(f"  {pt['min']:>6}{pt['rss_mb']:>10.0f}{pt['lag_sec']:>15.1f}")
+        if mode == "meeting" and len(r["points"]) >= 2:
+            # Плоско: вторая половина не выше первой отметки больше чем на 10 %/10 МБ.
+            first = r["points"][0]
+            worst_rss = max(pt["rss_mb"] for pt in r["points"])
+            worst_lag = max(pt["lag_sec"] for pt in r["points"])
+            if worst_rss > first["rss_mb"] * 1.1 + 10 or worst_lag > first["lag_sec"] * 1.5 + 2 * CHUNK_SEC:
+                print("  ⚠ память или отставание растут с длиной встречи")
+                failed = True
+    return 1 if failed else 0
+
+
+# ── Каскад моделей: python whisper_mac.py bench-cascade ──────────
+
+def _word_error_rate(ref: str, hyp: str) -> float:
+    """WER по словам (регистр и пунктуация не считаются)."""
+    import re
+    r = re.findall(r"[\w$]+", ref.lower())
+    h = re.findall(r"[\w$]+", hyp.lower())
+    if not r:
+        return 0.0 if not h else 1.0
+    prev = list(range(len(h) + 1))
+    for i, rw in enumerate(r, 1):
+        cur = [i] + [0] * len(h)
+        for j, hw in enumerate(h, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (rw != hw))
+        prev = cur
+    return prev[-1] / len(r)
+
+
+def _synthetic_corpus(out_dir: Path, durations=(8, 15, 25, 40, 60)) -> list:
+    """WAV-файлы из кусков громкой/тихой «речи» и пауз — для FakeEngine(errors)."""
+    rng = np.random.default_rng(7)
+    files = []
+    for n, sec in enumerate(durations):
+        audio = np.zeros(int(sec * SAMPLE_RATE), dtype=np.float32)
+        pos = 0
+        while pos < len(audio):
+            span = int(rng.uniform(1.5, 4.0) * SAMPLE_RATE)
+            level = rng.choice((0.05, 0.05, 0.01, 0.0))   # громко, громко, тихо, пауза
+            audio[pos:pos + span] = rng.standard_normal(len(audio[pos:pos + span])) * level
+            pos += span
+        path = out_dir / f"synth_{n}_{sec}s.wav"
+        with wave.open(str(path), "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(SAMPLE_RATE)
+            wf.writeframes(_to_pcm16(audio).tobytes())
+        files.append(path)
+    return files
+
+
+def bench_cascade_main(argv: list) -> int:
+    """Одна большая модель, одна быстрая и каскад: stop→text и WER на одном корпусе."""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="whisper_mac.py bench-cascade",
+        description="stop→text и WER: большая модель, быстрая модель, каскад",
+    )
+    parser.add_argument("inputs", nargs="*",
+                        help="WAV (эталон — рядом .txt); без аргументов — синтетический корпус")
+    parser.add_argument("--engine", choices=("fake", "mlx"), default="fake")
+    parser.add_argument("--fast-repo", default=CASCADE_FAST_REPO or "mlx-community/whisper-large-v3-turbo")
+    parser.add_argument("--speed", type=float, default=4.0,
+                        help="ускорение подачи; rtf фейковых моделей делится на него же")
+    parser.add_argument("--large-rtf", type=float, default=0.9)
+    parser.add_argument("--large-errors", type=float, default=0.05)
+    parser.add_argument("--fast-rtf", type=float, default=0.2)
+    parser.add_argument("--fast-errors", type=float, default=0.5)
+    parser.add_argument("--configs", default="large,fast,cascade")
+    parser.add_argument("--json", help="сохранить подробный отчёт в JSON")
+    parser.add_argument("--verbose", action="store_true", help="печатать лог воркеров")
+    args = parser.parse_args(argv)
+
+    _quiet_logs(args.verbose)
+    tmp = None
+    files = _bench_inputs(args.inputs)
+    if not args.inputs:
+        tmp = Path(tempfile.mkdtemp(prefix="whispermac-cascade-"))
+        files = _synthetic_corpus(tmp)
+    if not files:
+        print("Нет WAV-файлов для реплея")
+        return 2
+
+    fast_repo = _cascade_repo(args.fast_repo)
+    if not fast_repo:
+        print("--fast-repo должен отличаться от MODEL_REPO")
+        return 2
+    if args.engine == "mlx":
+        mlx = _lazy_import("mlx_whisper")
+        if mlx is None:
+            print("mlx_whisper недоступен на этой машине")
+            return 2
+        models = ModelSet.mlx(mlx, (MODEL_REPO, fast_repo))
+        warm_local_model(models)
+        large, fast = models.engines[MODEL_REPO], models.engines[fast_repo]
+        truth = None
+    else:
+        scale = max(args.speed, 1e-6)
+        large = FakeEngine(args.large_rtf / scale, errors=args.large_errors)
+        fast = FakeEngine(args.fast_rtf / scale, errors=args.fast_errors)
+        truth = FakeEngine(0.0)
+    configs = {
+        # Одна модель на всё: ModelSet с единственным движком отвечает на любой repo.
+        "large": (ModelSet({MODEL_REPO: large}), ""),
+        "fast": (ModelSet({MODEL_REPO: fast}), ""),
+        "cascade": (ModelSet({MODEL_REPO: large, fast_repo: fast}), fast_repo),
+    }
+
+    refs = {}
+    for path in files:
+        sidecar = path.with_suffix(".txt")
+        if sidecar.exists():
+            refs[path.name] = sidecar.read_text(encoding="utf-8")
+        elif truth is not None:
+            refs[path.name] = truth.transcribe(_read_wav_mono16k(path))["text"]
+
+    report = {}
+    print(f"{'конфиг':<10}{'stop→text p50':>15}{'p95':>9}{'WER':>8}{'RTF':>8}{'final':>7}{'ремонт':>8}")
+    try:
+        for name in [c.strip() for c in args.configs.split(",") if c.strip() in configs]:
+            engine, session_fast = configs[name]
+            rows = []
+            for path in files:
+                session, audio_sec = _replay_feed(path, engine, use_groq=False, speed=args.speed,
+                                                  fast_repo=session_fast)
+                row = _replay_result(path, session, audio_sec)
+                row["repaired"] = session.trace.meta.get("repaired", 0)
+                if path.name in refs:
+                    row["wer"] = round(_word_error_rate(refs[path.name], row["text"]), 4)
+                rows.append(row)
+            summary = _bench_summary(rows)
+            wers = [r["wer"] for r in rows if "wer" in r]
+            summary["wer"] = round(sum(wers) / len(wers), 4) if wers else None
+            summary["repaired"] = sum(r["repaired"] for r in rows)
+            report[name] = {"summary": summary, "files": rows}
+            wer = f"{summary['wer'] * 100:.1f}%" if summary["wer"] is not None else "—"
+            print(f"{name:<10}{summary['stop_to_text_p50_ms']:>13.0f}ms{summary['stop_to_text_p95_ms']:>7.0f}ms"
+                  f"{wer:>8}{summary['rtf_mean']:>8.3f}{summary['final_pass_rate']:>7.2f}{summary['repaired']:>8}")
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+# ── Спекулятивное декодирование: python whisper_mac.py bench-speculative ──
+
+class _ToyDecoderState:
+    """
+    Игрушечная LM для bench-speculative без mlx: логиты — функция позиции и
+    двух последних токенов, у черновика (noise > 0) — с шумом. Проход стоит
+    call_ms + token_ms на токен: как у большой модели, упирающейся в веса,
+    проверка K+1 токенов почти не дороже одного.
+    """
+
+    VOCAB = 64
+    EOT = 0
+
+    def __init__(self, seed: int, n_tokens: int, *, call_ms: float, token_ms: float,
+                 noise: float = 0.0):
+        self.seed = seed
+        self.n_tokens = n_tokens
+        self.call_ms = call_ms
+        self.token_ms = token_ms
+        self.noise = noise
+        self.tokens = []
+        self.length = 0
+        self.prompt = None
+
+    def _row(self) -> np.ndarray:
+        pos = len(self.tokens)
+        h = zlib.crc32(np.array([self.seed, pos, *self.tokens[-2:]], dtype=np.int64).tobytes())
+        row = np.random.default_rng(h).standard_normal(self.VOCAB)
+        if self.noise:
+            row = row + self.noise * np.random.default_rng(h ^ 0x5EED).standard_normal(self.VOCAB)
+        row[self.EOT] = 10.0 if pos - self.prompt >= self.n_tokens else -10.0
+        return row
+
+    def feed(self, tokens: list) -> np.ndarray:
+        time.sleep((self.call_ms + self.token_ms * len(tokens)) / 1000.0)
+        if self.prompt is None:
+            self.prompt = len(tokens)
+        rows = []
+        for t in tokens:
+            self.tokens.append(t)
+            rows.append(self._row())
+        self.length = len(self.tokens)
+        return np.stack(rows)
+
+    def rollback(self, n: int):
+        del self.tokens[n:]
+        self.length = n
+
+
+def _toy_pick(row: np.ndarray, i: int) -> tuple:
+    if i == 0:
+        row = row.copy()
+        row[_ToyDecoderState.EOT] = -np.inf
+    token = int(np.argmax(row))
+    return token, _log_softmax_at(row, token)
+
+
+def bench_speculative_main(argv: list) -> int:
+    """Жадное декодирование против спекулятивного по окнам корпуса: токены/с и совпадение с k=0."""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="whisper_mac.py bench-speculative",
+        description="токенов в секунду и совпадение с жадным проходом того же декодера (k=0)",
+    )
+    parser.add_argument("inputs", nargs="*", help="WAV-файлы/каталоги; без аргументов — синтетический корпус")
+    parser.add_argument("--engine", choices=("fake", "mlx"), default="fake")
+    parser.add_argument("--draft-repo", default=SPECULATIVE_DRAFT_REPO or "distil-whisper/distil-large-v3")
+    parser.add_argument("--k", type=int, default=SPECULATIVE_K)
+    parser.add_argument("--target-ms", type=float, default=25.0, help="fake: проход большой модели")
+    parser.add_argument("--draft-ms", type=float, default=3.0, help="fake: проход черновика")
+    parser.add_argument("--draft-noise", type=float, default=0.15, help="fake: расхождение черновика")
+    args = parser.parse_args(argv)
+
+    _quiet_logs(False)
+    tmp = None
+    files = _bench_inputs(args.inputs)
+    if not args.inputs:
+        tmp = Path(tempfile.mkdtemp(prefix="whispermac-spec-"))
+        files = _synthetic_corpus(tmp)
+    if not files:
+        print("Нет WAV-файлов для реплея")
+        return 2
+
+    engine = None
+    if args.engine == "mlx":
+        mlx = _lazy_import("mlx_whisper")
+        if mlx is None:
+            print("mlx_whisper недоступен на этой машине")
+            return 2
+        warm_local_model(mlx)
+        engine = SpeculativeEngine(mlx, args.draft_repo, k=args.k)
+        engine.load_draft()
+
+    window = int(CHUNK_SEC * SAMPLE_RATE)
+    totals = {"plain": [0, 0.0], "spec": [0, 0.0]}
+    proposed = accepted = mismatches = windows = 0
+    try:
+        for path in files:
+            audio = _read_wav_mono16k(path)
+            for off in range(0, len(audio), window):
+                piece = audio[off:off + window]
+                if len(piece) < SAMPLE_RATE * MIN_DURATION:
+                    continue
+                windows += 1
+                runs = {}
+                for name, k in (("plain", 0), ("spec", args.k)):
+                    started = time.perf_counter()
+                    if engine is not None:
+                        res = engine.decode(piece, prompt=HOTWORDS_PROMPT, k=k)
+                        tokens = res["segments"][0]["tokens"] if res["segments"] else []
+                        stats = res.get("speculative", {})
+                    else:
+                        seed = zlib.crc32(np.round(piece[::160] * 1000.0).astype(np.int16).tobytes())
+                        n_tokens = max(1, int(len(FakeEngine(0.0).transcribe(piece)["text"].split()) * 1.4))
+                        target = _ToyDecoderState(seed, n_tokens, call_ms=args.target_ms, token_ms=1.0)
+                        draft = _ToyDecoderState(seed, n_tokens, call_ms=args.draft_ms, token_ms=0.3,
+                                                 noise=args.draft_noise)
+                        tokens, _, stats = speculative_greedy(
+                            target, draft, [1, 2, 3], k=k, pick=_toy_pick, eot=_ToyDecoderState.EOT,
+                        )
+                    elapsed = time.perf_counter() - started
+                    totals[name][0] += len(tokens)
+                    totals[name][1] += elapsed
+                    runs[name] = tokens
+                    if k:
+                        proposed += stats.get("proposed", 0)
+                        accepted += stats.get("accepted", 0)
+                if runs["plain"] != runs["spec"]:
+                    mismatches += 1
+                    print(f"  расхождение с k=0: {path.name} @ {off / SAMPLE_RATE:.0f}s")
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    for name, (tokens, sec) in totals.items():
+        label = "жадно" if name == "plain" else f"спекулятивно (k={args.k})"
+        print(f"{label:<24}{tokens:>8} токенов  {sec:>7.2f}s  {tokens / max(sec, 1e-9):>8.1f} ток/с")
+    speedup = (totals["spec"][0] / max(totals["spec"][1], 1e-9)) / max(
+        totals["plain"][0] / max(totals["plain"][1], 1e-9), 1e-9)
+    print(f"ускорение x{speedup:.2f}, принято черновых {accepted}/{proposed} "
+          f"({accepted / max(proposed, 1) * 100:.0f}%), окон {windows}, расхождений с k=0 {mismatches}")
+    return 1 if mismatches else 0
+
+
+# ── Лимиты Groq: python whisper_mac.py bench-groq ──
+
+def bench_groq_main(argv: list) -> int:
+    """Сценарии 429/5xx/квот против mock-Groq: сколько запросов, где текст, уложились ли в бюджет."""
+    import argparse
+    import socket
+    parser = argparse.ArgumentParser(
+        prog="whisper_mac.py bench-groq",
+        description="повторы 429/5xx с Retry-After и упреждающий уход в локальную модель у лимита",
+    )
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--budget", type=float, default=4.0, help="бюджет повторов, сек")
+    parser.add_argument("--verbose", action="store_true", help="печатать лог groq_transcribe")
+    args = parser.parse_args(argv)
+
+    _quiet_logs(args.verbose)
+    wm.GROQ_API_KEY = "bench"
+    wm.GROQ_RETRIES = max(0, args.retries)
+    wm.GROQ_RETRY_BUDGET_SEC = args.budget
+    rng = np.random.default_rng(3)
+    audio = (rng.standard_normal(6 * SAMPLE_RATE) * 0.05).astype(np.float32)
+    engine = FakeEngine(rtf=0.0)
+    tries = wm.GROQ_RETRIES + 1
+
+    def closed_port_url() -> str:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        return f"http://127.0.0.1:{port}/openai/v1/audio/transcriptions"
+
+    # (название, аргументы mock, аргументы GroqQuota, вызовов, ожидание: [groq|local...], запросов)
+    scenarios = [
+        ("200", {}, {}, 1, ["groq"], 1),
+        ("429, Retry-After 0.3s", {"script": [(429, {"retry-after": "0.3"})]}, {}, 1,
+         ["groq" if tries > 1 else "local"], min(2, tries)),
+        ("429, Retry-After 30s", {"script": [(429, {"retry-after": "30"})]}, {}, 2,
+         ["local", "local"], 1),
+        ("503 ×2, потом 200", {"script": [(503, {}), (503, {})]}, {}, 1,
+         ["groq" if tries > 2 else "local"], min(3, tries)),
+        ("500 всегда", {"script": [(500, {})] * 10}, {}, 1, ["local"], tries),
+        ("400", {"script": [(400, {})]}, {}, 1, ["local"], 1),
+        ("remaining-requests 0", {"script": [
+            (429, {"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "45s"})]},
+         {}, 2, ["local", "local"], 1),
+        ("audio-seconds на исходе", {"audio_limit": 15.0}, {}, 3, ["groq", "groq", "local"], 2),
+        ("клиентский лимит 2 запроса/мин", {}, {"req_per_min": 2}, 3,
+         ["groq", "groq", "local"], 2),
+        ("соединение отклонено", None, {}, 1, ["local"], None),
+    ]
+
+    failed = 0
+    print(f"{'сценарий':<34}{'итог':<20}{'запросов':>9}{'мс':>9}")
+    for name, mock_kw, quota_kw, calls, expect, expect_requests in scenarios:
+        mock = MockGroqServer(engine, **mock_kw) if mock_kw is not None else None
+        wm.GROQ_API_URL = mock.url if mock is not None else closed_port_url()
+        quota = GroqQuota(**quota_kw)
+        outcome = []
+        worst = 0.0
+        try:
+            for _ in range(calls):
+                trace = UtteranceTrace("groq", persist=False)
+                started = time.perf_counter()
+                text = groq_transcribe(audio, api_key=wm.GROQ_API_KEY, trace=trace, quota=quota)
+                worst = max(worst, time.perf_counter() - started)
+                outcome.append("groq" if text else "local")
+            requests_made = mock.requests if mock is not None else None
+        finally:
+            if mock is not None:
+                mock.close()
+        ok = outcome == expect and worst <= wm.GROQ_RETRY_BUDGET_SEC + 1.0
+        if expect_requests is not None:
+            ok = ok and requests_made == expect_requests
+        failed += not ok
+        shown = "-" if requests_made is None else str(requests_made)
+        print(f"{name:<34}{'/'.join(outcome):<20}{shown:>9}{worst * 1000:>9.0f}  "
+              f"{'ok' if ok else 'ОЖИДАЛОСЬ ' + '/'.join(expect)}")
+    print(f"сценариев {len(scenarios)}, провалено {failed}, бюджет повторов {wm.GROQ_RETRY_BUDGET_SEC:.1f}s")
+    return 1 if failed else 0
+
+
+# ── Формат загрузки: python whisper_mac.py bench-upload ──
+
+def bench_upload_main(argv: list) -> int:
+    """Mock-Groq с ограниченной полосой: выбор UploadPlanner против лучшего кодека по факту."""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="whisper_mac.py bench-upload",
+        description="прогноз и факт «кодирование + отправка» по кодекам на медленном и быстром канале",
+    )
+    parser.add_argument("--links", default="512,4000,32000,0",
+                        help="полоса mock-сервера, кбит/с через запятую; 0 — без ограничения")
+    parser.add_argument("--durations", default="3,15", help="длительности записей, сек")
+    parser.add_argument("--codecs", default=",".join(_UPLOAD_CODECS),
+                        help="кандидаты; по умолчанию все, включая не входящие в GROQ_UPLOAD_CODECS")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="допустимый проигрыш выбора лучшему кодеку (доля) сверх 50 ms")
+    parser.add_argument("--verbose", action="store_true", help="печатать лог groq_transcribe")
+    args = parser.parse_args(argv)
+
+    _quiet_logs(args.verbose)
+    wm.GROQ_API_KEY = "bench"
+    codecs = [c.strip() for c in args.codecs.split(",") if c.strip()]
+    links = [float(x) for x in args.links.split(",")]
+    durations = [float(x) for x in args.durations.split(",")]
+    engine = FakeEngine(rtf=0.0)
+    rng = np.random.default_rng(5)
+    unlimited = {"audio_sec_per_hour": 0, "req_per_min": 0}
+
+    def clip(sec: float) -> np.ndarray:
+        return (rng.standard_normal(int(sec * SAMPLE_RATE)) * 0.05).astype(np.float32)
+
+    def run(planner, audio, codec=None) -> dict:
+        trace = UtteranceTrace("groq", persist=False)
+        text = groq_transcribe(audio, api_key=wm.GROQ_API_KEY, trace=trace,
+                               quota=GroqQuota(**unlimited), planner=planner, codec=codec)
+        actual = trace.meta.get("upload_actual") or {}
+        return {"ok": bool(text), "plan": trace.meta.get("upload_plan", {}),
+                "actual": actual.get("encode_sec", 0.0) + actual.get("upload_sec", 0.0)}
+
+    available = list(UploadPlanner(codecs).model)
+    print(f"кодеки: {', '.join(available)}" + (
+        "" if len(available) == len(codecs) else "  (остальным нужен afconvert/ffmpeg)"))
+    failed = 0
+    for kbps in links:
+        mock = MockGroqServer(engine, bandwidth_kbps=kbps)
+        wm.GROQ_API_URL = mock.url
+        link = f"{kbps:.0f} кбит/с" if kbps else "без ограничения"
+        try:
+            planner = UploadPlanner(codecs)
+            for _ in range(2):   # прогрев оценки канала
+                run(planner, clip(durations[-1]))
+            for sec in durations:
+                audio = clip(sec)
+                chosen = run(planner, audio)
+                forced = {c: run(UploadPlanner(codecs), audio, codec=c)["actual"] for c in available}
+                best = min(forced, key=forced.get)
+                ok = chosen["ok"] and chosen["actual"] <= forced[best] * (1.0 + args.tolerance) + 0.05
+                failed += not ok
+                plan = chosen["plan"]
+                others = "  ".join(f"{c} {t:.2f}" for c, t in forced.items())
+                print(f"{link:<18}{sec:>5.0f}s  выбор {plan.get('codec', '?'):<6} прогноз {plan.get('total_sec', 0):>6.2f}s "
+                      f"факт {chosen['actual']:>6.2f}s | {others} | лучший {best}  {'ok' if ok else 'ПРОМАХ'}")
+            print(f"{'':<18}оценка канала ~{planner.uplink_kbps():.0f} кбит/с")
+        finally:
+            mock.close()
+    print(f"промахов выбора: {failed}")
+    return 1 if failed else 0
+
+
+# ── Потоковая загрузка: python whisper_mac.py bench-stream ──
+
+def _stream_probe(mode: str, codec: str, seconds: float, spill_sec: float, url: str) -> dict:
+    """Запись длиной seconds → groq_transcribe на url целиком (sized) или потоком (chunked); пиковый RSS."""
+    wm.GROQ_API_URL, wm.GROQ_CHUNKED = url, mode == "chunked"
+    rng = np.random.default_rng(0)
+    noise = (rng.standard_normal(SAMPLE_RATE) * 0.05).astype(np.float32)
+    store = AudioStore(spill_sec=spill_sec)
+    for i in range(int(seconds * SAMPLE_RATE) // CAPTURE_BLOCK):
+        off = (i * CAPTURE_BLOCK) % (SAMPLE_RATE - CAPTURE_BLOCK)
+        store.append(noise[off:off + CAPTURE_BLOCK].reshape(-1, 1).copy())
+    base_mb = _peak_rss_mb()
+    trace = UtteranceTrace("groq", persist=False)
+    started = time.perf_counter()
+    text = groq_transcribe(store, api_key="bench", trace=trace, codec=codec,
+                           quota=GroqQuota(audio_sec_per_hour=0, req_per_min=0))
+    total = time.perf_counter() - started
+    actual = trace.meta.get("upload_actual") or {}
+    store.close()
+    return {
+        "mode": mode, "codec": codec, "ok": bool(text), "audio_sec": round(len(store) / SAMPLE_RATE, 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1), "base_rss_mb": round(base_mb, 1),
+        "to_server_ms": round((actual.get("encode_sec", 0.0) + actual.get("upload_sec", 0.0)) * 1000.0, 1),
+        "total_ms": round(total * 1000.0, 1), "body_mb": round(actual.get("kb", 0.0) / 1024, 1),
+    }
+
+
+def bench_stream_main(argv: list) -> int:
+    """Тело целиком с Content-Length против потока chunked: пиковая память клиента и время до сервера."""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="whisper_mac.py bench-stream",
+        description="пиковый RSS и «стоп → тело у сервера» для длинной записи: sized vs chunked",
+    )
+    parser.add_argument("--minutes", type=float, default=30.0)
+    parser.add_argument("--codecs", default="wav,ulaw")
+    parser.add_argument("--link-kbps", type=float, default=400000.0, help="полоса mock-сервера; 0 — без ограничения")
+    parser.add_argument("--spill-sec", type=float, default=0.0,
+                        help="перелив AudioStore на диск; 0 — вся запись в RAM")
+    args = parser.parse_args(argv)
+
+    _quiet_logs(False)
+    # Сервер и каждый клиент — в своих процессах: ru_maxrss наследуется через fork/exec,
+    # и клиент не должен унаследовать пик процесса, который держал и декодировал тела.
+    server = subprocess.Popen(
+        [sys.executable, "-c",
+         "import sys, json, whisper_mac as w, whisper_bench as b; w._quiet_logs(False); "
+         f"m = b.MockGroqServer(b.FakeEngine(rtf=0.0), bandwidth_kbps={args.link_kbps}); "
+         "print(m.url, flush=True); sys.stdin.read(); "
+         "print(json.dumps({'requests': m.requests, 'chunked': m.chunked}), flush=True)"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+        cwd=str(Path(__file__).resolve().parent),
+    )
+    url = server.stdout.readline().strip()
+    code = (
+        "import json, whisper_mac as w, whisper_bench as b; w._quiet_logs(False); "
+        "print(json.dumps(b._stream_probe({mode!r}, {codec!r}, {seconds}, {spill}, {url!r})))"
+    )
+    print(f"{'режим':<9}{'кодек':<7}{'аудио':>7}{'пик RSS, МБ':>13}{'(база)':>9}"
+          f"{'до сервера, мс':>16}{'всего, мс':>11}{'тело, МБ':>10}")
+    failed = 0
+    try:
+        for codec in [c.strip() for c in args.codecs.split(",") if c.strip()]:
+            for mode in ("sized", "chunked"):
+                proc = subprocess.run(
+                    [sys.executable, "-c", code.format(mode=mode, codec=codec, seconds=args.minutes * 60,
+                                                       spill=args.spill_sec, url=url)],
+                    capture_output=True, text=True, cwd=str(Path(__file__).resolve().parent),
+                )
+                lines = proc.stdout.strip().splitlines()
+                if proc.returncode != 0 or not lines:
+                    print(f"{mode}/{codec}: ошибка\n{proc.stderr[-400:]}")
+                    return 1
+                r = json.loads(lines[-1])
+                failed += not r["ok"]
+                print(f"{r['mode']:<9}{r['codec']:<7}{r['audio_sec'] / 60:>6.0f}m{r['peak_rss_mb']:>13.0f}"
+                      f"{r['base_rss_mb']:>9.0f}{r['to_server_ms']:>16.0f}{r['total_ms']:>11.0f}"
+                      f"{r['body_mb']:>10.0f}{'' if r['ok'] else '  нет текста'}")
+    finally:
+        out, _ = server.communicate("", timeout=30)
+    counts = json.loads(out.strip().splitlines()[-1]) if out.strip() else {}
+    print(f"chunked-запросов на сервере: {counts.get('chunked', '?')} из {counts.get('requests', '?')}")
+    return 1 if failed else 0
+
+
+# ═══════════════════════════════════════════════════
+# Командная строка: python whisper_bench.py <команда> (или через whisper_mac.py)
+
+COMMANDS = {
+    "bench": bench_main,
+    "bench-imports": bench_imports_main,
+    "bench-warmup": bench_warmup_main,
+    "bench-ui": bench_ui_main,
+    "bench-paste": bench_paste_main,
+    "bench-render": bench_render_main,
+    "bench-capture": bench_capture_main,
+    "bench-endpoint": bench_endpoint_main,
+    "bench-memory": bench_memory_main,
+    "bench-meeting": bench_meeting_main,
+    "bench-cascade": bench_cascade_main,
+    "bench-speculative": bench_speculative_main,
+    "bench-groq": bench_groq_main,
+    "bench-upload": bench_upload_main,
+    "bench-stream": bench_stream_main,
+}
+
+
+def main(argv: list) -> int:
+    if not argv or argv[0] not in COMMANDS:
+        print("команды: " + ", ".join(COMMANDS), file=sys.stderr)
+        return 2
+    return COMMANDS[argv[0]](argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
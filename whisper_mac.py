@@ -5,9 +5,11 @@ WhisperMac — голосовой ввод для macOS (streaming + real-time E
 
 import math
 import os
+import importlib
 import subprocess
 import threading
 import time
+_PROCESS_T0 = time.perf_counter()   # точка отсчёта StartupTimeline
 import sys
 import atexit
 from pathlib import Path
@@ -16,34 +18,80 @@ import io
 import wave
 import shutil
 import tempfile
+import gzip
+import json
+import queue
+import socket
+import uuid
+import contextlib
+import collections
+import zlib
+from datetime import date, datetime
 
 import numpy as np
-import sounddevice as sd
-import mlx_whisper
-import tkinter as tk
-from ApplicationServices import (
-    AXIsProcessTrusted,
-    AXIsProcessTrustedWithOptions,
-    AXUIElementCopyAttributeValue,
-    AXUIElementCreateApplication,
-    AXUIElementIsAttributeSettable,
-    AXUIElementSetAttributeValue,
-    AXUIElementSetMessagingTimeout,
-    kAXFocusedUIElementAttribute,
-    kAXRoleAttribute,
-    kAXSelectedTextAttribute,
-    kAXTrustedCheckOptionPrompt,
-)
 
-from Quartz import (
-    CGEventCreateKeyboardEvent,
-    CGEventPost,
-    CGEventSetFlags,
-    kCGEventFlagMaskCommand,
-    kCGHIDEventTap,
-    kCGSessionEventTap,
+# Тяжёлое и платформенное грузится по требованию (_lazy_import/_load_macos):
+# окно показывается сразу, sounddevice и pyobjc догружаются в фоне, а mlx —
+# только когда действительно нужен локальный движок. Без них модуль
+# импортируется для headless-режимов (bench/report/serve) на любой машине.
+try:
+    import tkinter as tk
+except ImportError:
+    tk = None
+
+_LAZY_MODULES = {}
+
+
+def _lazy_import(name: str):
+    """Модуль или None, если недоступен (результат кэшируется, в т.ч. неудача)."""
+    if name not in _LAZY_MODULES:
+        try:
+            _LAZY_MODULES[name] = importlib.import_module(name)
+        except Exception:  # sounddevice без PortAudio кидает OSError
+            _LAZY_MODULES[name] = None
+    return _LAZY_MODULES[name]
+
+
+_MACOS_NAMES = (
+    ("ApplicationServices", (
+        "AXIsProcessTrusted",
+        "AXIsProcessTrustedWithOptions",
+        "AXUIElementCopyAttributeValue",
+        "AXUIElementCreateApplication",
+        "AXUIElementIsAttributeSettable",
+        "AXUIElementSetAttributeValue",
+        "AXUIElementSetMessagingTimeout",
+        "kAXFocusedUIElementAttribute",
+        "kAXRoleAttribute",
+        "kAXSelectedTextAttribute",
+        "kAXTrustedCheckOptionPrompt",
+    )),
+    ("Quartz", (
+        "CGEventCreateKeyboardEvent",
+        "CGEventPost",
+        "CGEventSetFlags",
+        "kCGEventFlagMaskCommand",
+        "kCGHIDEventTap",
+        "kCGSessionEventTap",
+    )),
+    ("AppKit", ("NSWorkspace", "NSPasteboard", "NSPasteboardTypeString")),
 )
-from AppKit import NSWorkspace, NSPasteboard, NSPasteboardTypeString
+HAS_MACOS = None   # None — мосты ещё не загружались
+
+
+def _load_macos() -> bool:
+    """pyobjc-мосты по требованию: имена попадают в globals(), как при from-импорте."""
+    global HAS_MACOS
+    if HAS_MACOS is None:
+        ok = True
+        for mod_name, names in _MACOS_NAMES:
+            mod = _lazy_import(mod_name)
+            if mod is None:
+                ok = False
+                break
+            globals().update({name: getattr(mod, name) for name in names})
+        HAS_MACOS = ok
+    return HAS_MACOS
 
 
 # ═══════════════════════════════════════════════════
@@ -75,11 +123,31 @@ if STRICT_LOCAL_MODE:
     os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
 
 MODEL_REPO   = os.getenv("WHISPERMAC_MODEL_REPO", "mlx-community/whisper-large-v3-mlx-4bit")
+# Каскад: быстрая модель декодирует чанки во время записи, MODEL_REPO
+# перепроверяет неуверенные чанки и делает final-pass. Пусто — одна модель.
+CASCADE_FAST_REPO = os.getenv("WHISPERMAC_CASCADE_FAST_REPO", "").strip()
+# Спекулятивное декодирование: черновая модель с тем же словарём
+# (distil-large-v3, large-v3-turbo) предлагает токены, MODEL_REPO проверяет.
+SPECULATIVE_DRAFT_REPO = os.getenv("WHISPERMAC_SPECULATIVE_DRAFT_REPO", "").strip()
+SPECULATIVE_K = int(max(1, _env_float("WHISPERMAC_SPECULATIVE_K", 4)))
 LANGUAGE     = os.getenv("WHISPERMAC_LANGUAGE", "ru")
 SAMPLE_RATE  = 16000
 MIN_DURATION = 0.3
 SAVE_TRANSCRIPTS = _env_bool("WHISPERMAC_SAVE_TRANSCRIPTS", True)
 SAVE_PERF_LOG = _env_bool("WHISPERMAC_SAVE_PERF_LOG", True)
+RUNTIME_LOG = _env_bool("WHISPERMAC_RUNTIME_LOG", True)
+
+TRANSCRIPT_LOG_PATH = Path.home() / "whisper_log.txt"
+PERF_LOG_PATH       = Path.home() / "whisper_perf.log"
+PERF_SPANS_PATH     = Path.home() / "whisper_perf.jsonl"
+RUNTIME_LOG_PATH    = Path.home() / "whisper_runtime.log"
+
+# Фоновая запись логов: очередь, пачки, ротация со сжатием архивов.
+LOG_QUEUE_SIZE   = int(max(64, _env_float("WHISPERMAC_LOG_QUEUE_SIZE", 4096)))
+LOG_FLUSH_SEC    = max(0.02, _env_float("WHISPERMAC_LOG_FLUSH_SEC", 0.25))
+LOG_MAX_BYTES    = int(max(0.0, _env_float("WHISPERMAC_LOG_MAX_MB", 5.0)) * 1024 * 1024)
+LOG_ROTATE_DAILY = _env_bool("WHISPERMAC_LOG_ROTATE_DAILY", False)
+LOG_KEEP_ARCHIVES = int(max(1, _env_float("WHISPERMAC_LOG_KEEP", 5)))
 
 CHUNK_SEC    = max(5.0, _env_float("WHISPERMAC_CHUNK_SEC", 10.0))
 WORKER_POLL_SEC = max(0.05, _env_float("WHISPERMAC_WORKER_POLL_SEC", 0.20))
@@ -89,6 +157,8 @@ FINAL_PASS_MAX_SEC = max(
     _env_float("WHISPERMAC_FINAL_PASS_MAX_SEC", 95.0),
 )
 LOW_CONF_LOGPROB = _env_float("WHISPERMAC_LOW_CONF_LOGPROB", -1.15)
+# Чанк быстрой модели с avg_logprob не выше порога перекодируется большой.
+CASCADE_REPAIR_LOGPROB = _env_float("WHISPERMAC_CASCADE_REPAIR_LOGPROB", LOW_CONF_LOGPROB)
 SILENCE_SKIP_NO_SPEECH = min(
     0.99,
     max(0.5, _env_float("WHISPERMAC_SILENCE_SKIP_NO_SPEECH", 0.83)),
@@ -96,6 +166,14 @@ SILENCE_SKIP_NO_SPEECH = min(
 SILENCE_SKIP_MAX_CHARS = int(max(8, _env_float("WHISPERMAC_SILENCE_SKIP_MAX_CHARS", 36)))
 FINAL_TEMPERATURES = (0.0, 0.2, 0.4, 0.6)
 HOTWORDS_PROMPT = "WhisperMac, Whisper Flow, Miro, Zoom, Claude Code, ChatGPT."
+
+# Локальный OpenAI-совместимый сервер (serve): "127.0.0.1:8787" или "unix:/path".
+SERVE_ADDR        = os.getenv("WHISPERMAC_SERVE", "").strip()
+SERVE_WORKERS     = int(max(1, _env_float("WHISPERMAC_SERVE_WORKERS", 1)))
+SERVE_QUEUE_SIZE  = int(max(1, _env_float("WHISPERMAC_SERVE_QUEUE", 16)))
+SERVE_BATCH_MS    = max(0.0, _env_float("WHISPERMAC_SERVE_BATCH_MS", 30.0))
+SERVE_MAX_BATCH   = int(max(1, _env_float("WHISPERMAC_SERVE_MAX_BATCH", 8)))
+SERVE_MAX_UPLOAD_MB = max(1.0, _env_float("WHISPERMAC_SERVE_MAX_UPLOAD_MB", 100.0))
 PASTE_SHORTCUT_MODE = os.getenv("WHISPERMAC_PASTE_SHORTCUT_MODE", "auto").strip().lower()
 
 # ── Движок транскрипции ─────────────────────────────
@@ -110,6 +188,32 @@ GROQ_API_URL = os.getenv(
     "WHISPERMAC_GROQ_URL",
     "https://api.groq.com/openai/v1/audio/transcriptions",
 )
+# Лимиты Groq (бесплатный тариф: 7200 аудио-секунд в час, 20 запросов в минуту).
+# Близко к лимиту запись сразу уходит в локальную модель; 429/5xx повторяются,
+# пока ожидание укладывается в GROQ_RETRY_BUDGET_SEC от первой попытки.
+GROQ_AUDIO_SEC_PER_HOUR = max(0.0, _env_float("WHISPERMAC_GROQ_AUDIO_SEC_PER_HOUR", 7200.0))
+GROQ_REQ_PER_MIN = max(0.0, _env_float("WHISPERMAC_GROQ_REQ_PER_MIN", 20.0))
+GROQ_QUOTA_RESERVE = min(0.5, max(0.0, _env_float("WHISPERMAC_GROQ_QUOTA_RESERVE", 0.05)))
+GROQ_RETRIES = int(max(0, _env_float("WHISPERMAC_GROQ_RETRIES", 2)))
+GROQ_RETRY_BUDGET_SEC = max(0.0, _env_float("WHISPERMAC_GROQ_RETRY_BUDGET_SEC", 4.0))
+# Формат загрузки выбирается под канал: из кандидатов берётся тот, у которого
+# прогноз «кодирование + отправка» меньше. Пропускная способность оценивается
+# по последним запросам; до первого — GROQ_UPLINK_KBPS. По умолчанию — только
+# проверенный AAC 48k и форматы без потерь; ulaw и aac32 меньше, но их влияние
+# на точность Groq не измерено — включаются явно.
+GROQ_UPLOAD_CODECS = [c.strip() for c in os.getenv(
+    "WHISPERMAC_GROQ_UPLOAD_CODECS", "aac48,flac,wav").split(",") if c.strip()]
+GROQ_UPLINK_KBPS = max(64.0, _env_float("WHISPERMAC_GROQ_UPLINK_KBPS", 8000.0))
+# Лимит Groq на размер файла (бесплатный тариф — 25 МБ): больше — 413 и сразу
+# локальный фоллбэк, поэтому кандидаты с прогнозом выше лимита не выбираются.
+GROQ_MAX_UPLOAD_MB = max(1.0, _env_float("WHISPERMAC_GROQ_MAX_UPLOAD_MB", 25.0))
+# Тело запроса потоком (Transfer-Encoding: chunked): отправка идёт параллельно с
+# кодированием, в памяти — один блок. Проверено только на локальном mock/serve,
+# поэтому выключено по умолчанию: запись кодируется целиком и уходит с
+# Content-Length. Если chunked-попытка получила 4xx (кроме 429) или обрыв
+# соединения, запрос повторяется с Content-Length, а при успехе поток
+# выключается до перезапуска.
+GROQ_CHUNKED = _env_bool("WHISPERMAC_GROQ_CHUNKED", False)
 # strict_local относится только к загрузке ЛОКАЛЬНОЙ модели (offline от HuggingFace)
 # и НЕ отключает Groq. Чтобы работать полностью локально — задай WHISPERMAC_ENGINE=local.
 
@@ -132,93 +236,783 @@ def _load_groq_key() -> str:
 GROQ_API_KEY = _load_groq_key()
 
 
-def _audio_to_wav_bytes(audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> bytes:
-    """float32 [-1..1] → 16-bit PCM WAV в памяти (для отправки в Groq)."""
-    clipped = np.clip(audio.astype(np.float32), -1.0, 1.0)
-    pcm16 = (clipped * 32767.0).astype("<i2")
-    buf = io.BytesIO()
-    with wave.open(buf, "wb") as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)
-        wf.setframerate(sample_rate)
-        wf.writeframes(pcm16.tobytes())
-    return buf.getvalue()
+def _wav_header(n_samples: int, sample_rate: int = SAMPLE_RATE) -> bytes:
+    """44-байтный заголовок 16-bit PCM моно WAV на n_samples сэмплов."""
+    import struct
+    data_len = n_samples * 2
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + data_len, b"WAVE", b"fmt ", 16, 1, 1,
+        sample_rate, sample_rate * 2, 2, 16, b"data", data_len,
+    )
 
 
-def _encode_for_groq(audio: np.ndarray) -> tuple:
+def _wav_pieces(audio) -> list:
     """
-    Готовит payload для Groq. Длинные записи в несжатом WAV грузятся долго
-    и упираются в таймаут, поэтому сжимаем речь в AAC/m4a нативным afconvert
-    (всегда есть в macOS): ~6 МБ WAV → ~1 МБ. При любой ошибке — обычный WAV.
-    Возвращает (filename, bytes, mime).
+    float32-массив или AudioStore → куски 16-bit PCM WAV: заголовок + PCM.
+    Для перелитой на диск записи PCM — срез memmap, без копии в RAM.
     """
-    wav = _audio_to_wav_bytes(audio)
-    afconvert = shutil.which("afconvert")
-    if not afconvert:
-        return "audio.wav", wav, "audio/wav"
+    if isinstance(audio, AudioStore):
+        pcm16 = audio.pcm16()
+    else:
+        pcm16 = _to_pcm16(np.asarray(audio, dtype=np.float32).reshape(-1))
+    return [_wav_header(len(pcm16)), memoryview(pcm16).cast("B")]
+
+
+def _pcm16_blocks(audio, step: int = SAMPLE_RATE * 10):
+    """int16-блоки записи по step сэмплов — без PCM-копии всей записи."""
+    if isinstance(audio, AudioStore):
+        for start in range(0, len(audio), step):
+            yield audio.pcm16(start, start + step)
+        return
+    audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+    for start in range(0, len(audio), step):
+        yield _to_pcm16(audio[start:start + step])
+
+
+def _ulaw_header(n_samples: int) -> bytes:
+    """Заголовок WAV G.711 μ-law (format tag 7, 8 бит, fact-чанк) на n_samples сэмплов."""
+    import struct
+    return struct.pack(
+        "<4sI4s4sIHHIIHHH4sII4sI", b"RIFF", 4 + 26 + 12 + 8 + n_samples, b"WAVE",
+        b"fmt ", 18, 7, 1, SAMPLE_RATE, SAMPLE_RATE, 1, 8, 0,
+        b"fact", 4, n_samples, b"data", n_samples,
+    )
+
+
+def _ulaw_encode(pcm16) -> np.ndarray:
+    """int16 → байты G.711 μ-law (побитно как audioop.lin2ulaw)."""
+    x = np.asarray(pcm16, dtype=np.int32) >> 2   # 14 бит, как в G.711
+    mag = np.minimum(np.where(x < 0, -x, x), 0x1FDF) + 0x21
+    segment = np.floor(np.log2(mag)).astype(np.int32) - 5
+    mantissa = (mag >> (segment + 1)) & 0x0F
+    code = np.where(segment > 7, 0x7F, (segment << 4) | mantissa)   # за пределом шкалы — максимум
+    return (code ^ np.where(x < 0, 0x7F, 0xFF)).astype(np.uint8)
+
+
+def _ulaw_pieces(audio) -> list:
+    """
+    float32-массив или AudioStore → WAV G.711 μ-law (8 бит на сэмпл, 16 кГц):
+    вдвое меньше PCM16 при почти нулевой цене кодирования, частота та же.
+    """
+    return [_ulaw_header(len(audio)), *(_ulaw_encode(b) for b in _pcm16_blocks(audio))]
+
+
+def _ulaw_to_float(data: bytes) -> np.ndarray:
+    """WAV μ-law (format tag 7) → float32; модуль wave такие файлы не читает."""
+    import struct
+    pos, raw = 12, b""
+    while pos + 8 <= len(data):
+        cid, size = struct.unpack_from("<4sI", data, pos)
+        if cid == b"data":
+            raw = data[pos + 8:pos + 8 + size]
+            break
+        pos += 8 + size + (size & 1)
+    u = ~np.frombuffer(raw, dtype=np.uint8).astype(np.int32) & 0xFF
+    mag = (((u & 0x0F) << 3) + 0x84) << ((u >> 4) & 0x07)
+    pcm = np.where(u & 0x80, 0x84 - mag, mag - 0x84)
+    return (pcm / 32768.0).astype(np.float32)
+
+
+# Кандидаты формата загрузки: (имя файла, mime, формат afconvert, аргументы ffmpeg,
+# формат ffmpeg для вывода в pipe — без перемотки, поэтому mp4 фрагментированный) и
+# априорная модель: накладные расходы запуска (s), кодирование (s на секунду аудио),
+# размер (байт на секунду аудио). Последние две UploadPlanner уточняет по факту.
+_UPLOAD_CODECS = {
+    "wav":   {"file": "audio.wav", "mime": "audio/wav", "tool": None,
+              "overhead": 0.0, "sec_per_sec": 0.0003, "bytes_per_sec": 32000.0},
+    "ulaw":  {"file": "audio.wav", "mime": "audio/wav", "tool": None,
+              "overhead": 0.0, "sec_per_sec": 0.002, "bytes_per_sec": 16000.0},
+    "flac":  {"file": "audio.flac", "mime": "audio/flac",
+              "tool": (["-f", "flac", "-d", "flac"], ["-c:a", "flac"]), "pipe": ["-f", "flac"],
+              "overhead": 0.06, "sec_per_sec": 0.004, "bytes_per_sec": 20000.0},
+    "aac48": {"file": "audio.m4a", "mime": "audio/mp4",
+              "tool": (["-f", "m4af", "-d", "aac", "-b", "48000"], ["-c:a", "aac", "-b:a", "48k"]),
+              "pipe": ["-f", "mp4", "-movflags", "frag_keyframe+empty_moov"],
+              "overhead": 0.08, "sec_per_sec": 0.02, "bytes_per_sec": 6200.0},
+    "aac32": {"file": "audio.m4a", "mime": "audio/mp4",
+              "tool": (["-f", "m4af", "-d", "aac", "-b", "32000"], ["-c:a", "aac", "-b:a", "32k"]),
+              "pipe": ["-f", "mp4", "-movflags", "frag_keyframe+empty_moov"],
+              "overhead": 0.08, "sec_per_sec": 0.02, "bytes_per_sec": 4200.0},
+}
+
+
+def _encode_to_file(audio, codec: str, td: Path) -> Path:
+    """WAV → codec внешним кодеком в файл внутри td: afconvert (macOS), иначе ffmpeg. None — не вышло."""
+    spec = _UPLOAD_CODECS[codec]
+    afconvert, ffmpeg = shutil.which("afconvert"), shutil.which("ffmpeg")
+    if not (afconvert or ffmpeg):
+        return None
+    src = Path(td) / "in.wav"
+    dst = Path(td) / spec["file"]
+    with open(src, "wb") as f:
+        f.write(_wav_header(len(audio)))
+        for block in _pcm16_blocks(audio):
+            f.write(block)
+    if afconvert:
+        cmd = [afconvert, *spec["tool"][0], str(src), str(dst)]
+    else:
+        cmd = [ffmpeg, "-nostdin", "-loglevel", "error", "-y", "-i", str(src),
+               *spec["tool"][1], str(dst)]
+    proc = subprocess.run(cmd, capture_output=True, timeout=30)
+    src.unlink()
+    if proc.returncode == 0 and dst.exists() and dst.stat().st_size > 0:
+        return dst
+    log(f"[groq] {Path(cmd[0]).name} {codec} rc={proc.returncode} — шлю WAV")
+    return None
+
+
+def _encode_with_tool(audio, codec: str) -> list:
+    """Payload кодека целиком в памяти (для тела с Content-Length). None — не вышло."""
+    with tempfile.TemporaryDirectory() as td:
+        dst = _encode_to_file(audio, codec, Path(td))
+        return [dst.read_bytes()] if dst else None
+
+
+def _encode_for_groq(audio, codec: str = "aac48") -> tuple:
+    """
+    Готовит payload для Groq в формате codec (см. _UPLOAD_CODECS; какой
+    выгоднее для канала, решает UploadPlanner). Сжатые форматы — нативным
+    afconvert (всегда есть в macOS) или ffmpeg; при любой ошибке — обычный WAV.
+    audio — float32-массив или AudioStore.
+    Возвращает (filename, [куски payload], mime).
+    """
+    if codec == "ulaw":
+        return "audio.wav", _ulaw_pieces(audio), "audio/wav"
+    spec = _UPLOAD_CODECS.get(codec)
+    if spec and spec["tool"]:
+        try:
+            payload = _encode_with_tool(audio, codec)
+            if payload:
+                return spec["file"], payload, spec["mime"]
+        except Exception as ex:  # noqa: BLE001
+            log(f"[groq] сжатие не удалось ({ex}) — шлю WAV")
+    return "audio.wav", _wav_pieces(audio), "audio/wav"
+
+
+def _file_blocks(path: Path, td, size: int = 64 * 1024):
+    """Файл блоками; временный каталог td убирается, когда поток дочитан или закрыт."""
     try:
-        with tempfile.TemporaryDirectory() as td:
-            src = Path(td) / "in.wav"
-            dst = Path(td) / "out.m4a"
-            src.write_bytes(wav)
-            proc = subprocess.run(
-                [afconvert, "-f", "m4af", "-d", "aac", "-b", "48000",
-                 str(src), str(dst)],
-                capture_output=True, timeout=30,
-            )
-            if proc.returncode == 0 and dst.exists() and dst.stat().st_size > 0:
-                return "audio.m4a", dst.read_bytes(), "audio/mp4"
-            log(f"[groq] afconvert rc={proc.returncode} — шлю WAV")
-    except Exception as ex:  # noqa: BLE001
-        log(f"[groq] сжатие не удалось ({ex}) — шлю WAV")
-    return "audio.wav", wav, "audio/wav"
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(size)
+                if not block:
+                    return
+                yield block
+    finally:
+        td.cleanup()
+
+
+def _ffmpeg_blocks(audio, codec: str, ffmpeg: str, size: int = 64 * 1024):
+    """
+    Кодирование ffmpeg'ом через pipe: WAV пишется в stdin из отдельного потока,
+    сжатые кадры читаются из stdout по мере готовности. Ошибка ffmpeg на середине
+    прерывает запрос (RuntimeError) — groq_transcribe уйдёт в фоллбэк.
+    """
+    spec = _UPLOAD_CODECS[codec]
+    proc = subprocess.Popen(
+        [ffmpeg, "-loglevel", "error", "-f", "wav", "-i", "pipe:0",
+         *spec["tool"][1], *spec["pipe"], "pipe:1"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+
+    def feed():
+        try:
+            proc.stdin.write(_wav_header(len(audio)))
+            for block in _pcm16_blocks(audio):
+                proc.stdin.write(block)
+        except (BrokenPipeError, ValueError):
+            pass   # ffmpeg упал или поток закрыт — причину покажет код возврата
+        finally:
+            with contextlib.suppress(OSError):
+                proc.stdin.close()
+
+    threading.Thread(target=feed, daemon=True, name="groq-encode").start()
+    try:
+        while True:
+            block = os.read(proc.stdout.fileno(), size)
+            if not block:
+                break
+            yield block
+        if proc.wait(timeout=30) != 0:
+            err = proc.stderr.read().decode("utf-8", "replace").strip()[-200:]
+            raise RuntimeError(f"ffmpeg {codec} rc={proc.returncode}: {err}")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        for pipe in (proc.stdout, proc.stderr):
+            pipe.close()
+
+
+def _stream_for_groq(audio, codec: str) -> tuple:
+    """
+    Как _encode_for_groq, но payload — генератор блоков, которые кодируются по
+    мере того, как их забирает сокет: отправка идёт параллельно с кодированием,
+    в памяти — один блок. WAV и μ-law кодируются numpy поблочно, AAC/FLAC —
+    ffmpeg через pipe. afconvert умеет только файлы: он кодирует заранее во
+    временный файл (при ошибке — WAV, пока заголовок multipart ещё не ушёл),
+    а файл отдаётся блоками.
+    Возвращает (filename, mime, итератор блоков, prepared): prepared — (начало,
+    конец) кодирования, выполненного до запроса (afconvert), иначе None.
+    """
+    if codec == "ulaw":
+        def ulaw():
+            yield _ulaw_header(len(audio))
+            for block in _pcm16_blocks(audio):
+                yield _ulaw_encode(block)
+        return "audio.wav", "audio/wav", ulaw(), None
+    spec = _UPLOAD_CODECS.get(codec)
+    if spec and spec["tool"]:
+        if shutil.which("afconvert"):
+            td = tempfile.TemporaryDirectory(prefix="whispermac-upload-")
+            enc_started = time.perf_counter()
+            try:
+                dst = _encode_to_file(audio, codec, Path(td.name))
+            except Exception as ex:  # noqa: BLE001
+                log(f"[groq] сжатие не удалось ({ex}) — шлю WAV")
+                dst = None
+            if dst:
+                prepared = (enc_started, time.perf_counter())
+                return spec["file"], spec["mime"], _file_blocks(dst, td), prepared
+            td.cleanup()
+        elif shutil.which("ffmpeg"):
+            return spec["file"], spec["mime"], _ffmpeg_blocks(audio, codec, shutil.which("ffmpeg")), None
+
+    def wav():
+        yield _wav_header(len(audio))
+        yield from _pcm16_blocks(audio)
+    return "audio.wav", "audio/wav", wav(), None
+
+
+class UploadPlanner:
+    """
+    Выбор формата загрузки под канал. Прогноз для кодека:
+        кодирование (накладные + s/с · длительность) + байты / пропускная способность.
+    Пропускная способность — EWMA по завершённым запросам: байты тела, делённые на
+    время запроса за вычетом времени обработки на сервере (заголовок
+    x-processing-ms / openai-processing-ms, если сервер его шлёт). Время отправки
+    на клиенте не годится: сокетные буферы проглатывают мегабайты мгновенно.
+    Скорость кодирования и размер на секунду аудио тоже уточняются по факту.
+    Кандидаты, чей прогноз размера не влезает в max_upload_mb, отбрасываются.
+    """
+
+    ALPHA = 0.35
+    SIZE_MARGIN = 0.95       # запас на рамку multipart и ошибку прогноза размера
+    MIN_TRANSFER_SEC = 0.1   # короче — отправка тонет в RTT: оценку можно только поднять
+
+    def __init__(self, codecs=None, *, uplink_kbps: float = GROQ_UPLINK_KBPS,
+                 max_upload_mb: float = GROQ_MAX_UPLOAD_MB):
+        have_tool = bool(shutil.which("afconvert") or shutil.which("ffmpeg"))
+        names = GROQ_UPLOAD_CODECS if codecs is None else codecs
+        self.model = {
+            name: dict(_UPLOAD_CODECS[name]) for name in names
+            if name in _UPLOAD_CODECS and (have_tool or not _UPLOAD_CODECS[name]["tool"])
+        } or {"wav": dict(_UPLOAD_CODECS["wav"])}
+        self.bytes_per_sec = uplink_kbps * 1000.0 / 8.0
+        self.max_kb = max_upload_mb * 1024.0 * self.SIZE_MARGIN
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def predict(self, codec: str, audio_sec: float) -> dict:
+        m = self.model[codec]
+        encode = m["overhead"] + m["sec_per_sec"] * audio_sec
+        size = m["bytes_per_sec"] * audio_sec
+        upload = size / self.bytes_per_sec
+        return {"codec": codec, "encode_sec": round(encode, 3), "upload_sec": round(upload, 3),
+                "total_sec": round(encode + upload, 3), "kb": round(size / 1024, 1)}
+
+    def choose(self, audio_sec: float) -> dict:
+        """
+        Прогноз лучшего кодека: {"codec", "encode_sec", "upload_sec", "total_sec", "kb"}.
+        Если в лимит размера не влезает ни один — самый компактный (Groq, скорее
+        всего, ответит 413, и запись уйдёт в локальную модель).
+        """
+        with self._lock:
+            plans = [self.predict(name, audio_sec) for name in self.model]
+        fits = [p for p in plans if p["kb"] <= self.max_kb]
+        if not fits:
+            return min(plans, key=lambda p: p["kb"])
+        return min(fits, key=lambda p: p["total_sec"])
+
+    def record_encode(self, codec: str, audio_sec: float, sec: float, nbytes: int):
+        if codec not in self.model or audio_sec < 1.0:
+            return
+        with self._lock:
+            m = self.model[codec]
+            rate = max(0.0, sec - m["overhead"]) / audio_sec
+            m["sec_per_sec"] += self.ALPHA * (rate - m["sec_per_sec"])
+            m["bytes_per_sec"] += self.ALPHA * (nbytes / audio_sec - m["bytes_per_sec"])
+
+    def record_transfer(self, nbytes: int, request_sec: float, headers=None) -> float:
+        """Учесть завершённый запрос; возвращает оценку времени самой отправки, s."""
+        processing = 0.0
+        for name in ("x-processing-ms", "openai-processing-ms"):
+            raw = headers.get(name) if headers else None
+            if raw:
+                try:
+                    processing = float(raw) / 1000.0
+                except ValueError:
+                    pass
+                break
+        transfer = max(0.0, request_sec - processing)
+        with self._lock:
+            if transfer >= self.MIN_TRANSFER_SEC:
+                sample = nbytes / transfer
+                self.bytes_per_sec = sample if not self.samples else \
+                    self.bytes_per_sec + self.ALPHA * (sample - self.bytes_per_sec)
+                self.samples += 1
+            else:
+                self.bytes_per_sec = max(self.bytes_per_sec, nbytes / max(transfer, 1e-3))
+        return transfer
+
+    def uplink_kbps(self) -> float:
+        return self.bytes_per_sec * 8.0 / 1000.0
+
+
+GROQ_UPLOADS = UploadPlanner()
+
+
+class _TimedBody:
+    """
+    Тело запроса из готовых кусков без склейки в один bytes. Отдаётся
+    http.client блоками через read(); момент, когда отдан последний блок,
+    считаем концом upload (с точностью до буфера сокета).
+    """
+
+    def __init__(self, pieces: list):
+        self._pieces = [p for p in pieces if p]
+        self._len = sum(len(p) for p in self._pieces)
+        self._idx = 0
+        self._pos = 0
+        self.started_at = None
+        self.done_at = None
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        while True:
+            block = self.read(64 * 1024)
+            if not block:
+                return
+            yield block
+
+    def read(self, size: int = -1) -> bytes:
+        if self.started_at is None:
+            self.started_at = time.perf_counter()
+        if self._idx >= len(self._pieces):
+            if self.done_at is None:
+                self.done_at = time.perf_counter()
+            return b""
+        piece = self._pieces[self._idx]
+        if size is None or size < 0:
+            size = len(piece) - self._pos
+        block = piece[self._pos:self._pos + size]
+        self._pos += len(block)
+        if self._pos >= len(piece):
+            self._idx += 1
+            self._pos = 0
+            if self._idx >= len(self._pieces):
+                self.done_at = time.perf_counter()
+        return bytes(block)
+
+
+def _multipart_frame(fields: dict, fname: str, mime: str) -> tuple:
+    """Рамка multipart/form-data вокруг байтов файла: (content_type, head, tail)."""
+    boundary = f"whispermac-{uuid.uuid4().hex}"
+    head = []
+    for name, value in fields.items():
+        head.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+            f"{value}\r\n"
+        )
+    head.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+        f'filename="{fname}"\r\nContent-Type: {mime}\r\n\r\n'
+    )
+    tail = f"\r\n--{boundary}--\r\n"
+    return (f"multipart/form-data; boundary={boundary}",
+            "".join(head).encode("utf-8"), tail.encode("ascii"))
+
+
+def _multipart_pieces(fields: dict, fname: str, payload: list, mime: str) -> tuple:
+    """multipart/form-data для OpenAI-совместимого /audio/transcriptions."""
+    content_type, head, tail = _multipart_frame(fields, fname, mime)
+    return content_type, [head, *(memoryview(p) for p in payload), tail]
+
+
+class _StreamBody:
+    """
+    Тело multipart потоком: head, блоки кодека по мере выработки, tail. Длины у
+    него нет, поэтому requests шлёт Transfer-Encoding: chunked. encode —
+    (начало, конец, секунд кодирования, байт payload); кодирование до запроса
+    (prepared, afconvert) входит в него, но не в inline_sec — время выработки
+    блоков внутри запроса. Остальное время запроса — сеть и сервер.
+    """
+
+    def __init__(self, head: bytes, blocks, tail: bytes, prepared: tuple = None):
+        self._head, self._blocks, self._tail = head, blocks, tail
+        self.prepared = prepared
+        self.sent = 0
+        self.started_at = None
+        self.done_at = None
+        self.inline_sec = 0.0
+        pre_sec = prepared[1] - prepared[0] if prepared else 0.0
+        self.encode = (prepared[0] if prepared else None, prepared[1] if prepared else None, pre_sec, 0)
+
+    def __iter__(self):
+        self.started_at = time.perf_counter()
+        yield self._take(self._head)
+        start = self.prepared[0] if self.prepared else self.started_at
+        pre_sec = self.prepared[1] - self.prepared[0] if self.prepared else 0.0
+        payload = 0
+        blocks = iter(self._blocks)
+        while True:
+            t0 = time.perf_counter()
+            block = next(blocks, None)
+            self.inline_sec += time.perf_counter() - t0
+            if block is None:
+                break
+            data = self._take(memoryview(block).cast("B"))
+            payload += len(data)
+            self.encode = (start, time.perf_counter(), pre_sec + self.inline_sec, payload)
+            if data:
+                yield data
+        self.encode = (start, time.perf_counter(), pre_sec + self.inline_sec, payload)
+        yield self._take(self._tail)
+        self.done_at = time.perf_counter()
+
+    def _take(self, block) -> bytes:
+        data = bytes(block)
+        self.sent += len(data)
+        return data
+
+    def close(self):
+        close = getattr(self._blocks, "close", None)
+        if close is not None:
+            close()   # генератор кодека: finally убирает ffmpeg/временные файлы
+
+
+# ── Квоты Groq ──────────────────────────────────────
+
+def _parse_duration(raw) -> float:
+    """'2m59.56s', '7.66s', '120ms', '1h2m', '12' → секунды (None, если не разобрать)."""
+    import re
+    if raw is None:
+        return None
+    raw = str(raw).strip()
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        pass
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", raw)
+    if not parts:
+        return None
+    return sum(float(n) * units[u] for n, u in parts)
+
+
+def _retry_after(headers) -> float:
+    """Retry-After: секунды или HTTP-дата."""
+    raw = headers.get("retry-after") if headers else None
+    if raw is None:
+        return None
+    seconds = _parse_duration(raw)
+    if seconds is not None:
+        return seconds
+    try:
+        from email.utils import parsedate_to_datetime
+        return max(0.0, parsedate_to_datetime(raw).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _Bucket:
+    """Token bucket: capacity единиц, пополнение capacity/period в секунду. capacity 0 — без лимита."""
+
+    def __init__(self, capacity: float, period_sec: float, clock):
+        self.capacity = capacity
+        self.rate = capacity / period_sec if capacity else 0.0
+        self.clock = clock
+        self._level = capacity
+        self._at = clock()
+
+    def level(self) -> float:
+        now = self.clock()
+        self._level = min(self.capacity, self._level + (now - self._at) * self.rate)
+        self._at = now
+        return self._level
+
+    def take(self, amount: float):
+        if self.capacity:
+            self._level = self.level() - amount
+
+    def sync(self, remaining: float, limit: float = None):
+        if limit and limit != self.capacity:
+            # Сервер знает тариф лучше настроек: подстраиваем ёмкость и скорость пополнения.
+            period = self.capacity / self.rate if self.rate else 3600.0
+            self.capacity, self.rate = limit, limit / period
+        if self.capacity:
+            self.level()
+            self._level = min(self.capacity, remaining)
+
+
+class GroqQuota:
+    """
+    Клиентский учёт лимитов Groq: ведро аудио-секунд в час и ведро запросов
+    в минуту. Ответы сервера (x-ratelimit-remaining-*/reset-*, Retry-After)
+    уточняют состояние: исчерпанный лимит или длинный Retry-After блокируют
+    Groq до сброса. admit() — пускать ли запись в Groq прямо сейчас.
+    """
 
+    def __init__(self, *, audio_sec_per_hour: float = GROQ_AUDIO_SEC_PER_HOUR,
+                 req_per_min: float = GROQ_REQ_PER_MIN, reserve: float = GROQ_QUOTA_RESERVE,
+                 clock=time.monotonic):
+        self.clock = clock
+        self.audio = _Bucket(audio_sec_per_hour, 3600.0, clock)
+        self.requests = _Bucket(req_per_min, 60.0, clock)
+        self.reserve = reserve
+        self.blocked_until = 0.0
+        self.block_reason = ""
+        self._lock = threading.Lock()
+
+    def admit(self, audio_sec: float) -> str:
+        """"" — можно в Groq; иначе причина, по которой запись лучше сразу отдать локальной модели."""
+        with self._lock:
+            wait = self.blocked_until - self.clock()
+            if wait > 0:
+                return f"{self.block_reason}, ещё {wait:.0f}s"
+            if self.requests.capacity and self.requests.level() < 1.0:
+                return "лимит запросов в минуту"
+            if self.audio.capacity:
+                need = audio_sec + self.reserve * self.audio.capacity
+                left = self.audio.level()
+                if left < need:
+                    return f"осталось {left:.0f} аудио-секунд из {self.audio.capacity:.0f} в час"
+            return ""
+
+    def spend(self, *, audio_sec: float = 0.0, requests: int = 0):
+        with self._lock:
+            self.audio.take(audio_sec)
+            self.requests.take(requests)
+
+    def block(self, seconds: float, reason: str):
+        with self._lock:
+            until = self.clock() + seconds
+            if until > self.blocked_until:
+                self.blocked_until, self.block_reason = until, reason
+
+    def observe(self, headers):
+        """Сверка с заголовками ответа (если сервер их присылает)."""
+        if not headers:
+            return
+        for kind, bucket in (("requests", self.requests), ("audio-seconds", self.audio)):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is None:
+                continue
+            try:
+                remaining = float(remaining)
+                limit = float(headers.get(f"x-ratelimit-limit-{kind}") or 0)
+            except ValueError:
+                continue
+            with self._lock:
+                bucket.sync(remaining, limit)
+            reset = _parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if remaining <= 0 and reset:
+                self.block(reset, f"лимит {kind} исчерпан")
 
-def groq_transcribe(audio: np.ndarray, *, prompt: str = "", api_key: str = "") -> str:
+    def blocked_for(self) -> float:
+        with self._lock:
+            return max(0.0, self.blocked_until - self.clock())
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "audio_sec_left": round(self.audio.level(), 1) if self.audio.capacity else None,
+                "requests_left": round(self.requests.level(), 1) if self.requests.capacity else None,
+                "blocked_sec": round(max(0.0, self.blocked_until - self.clock()), 1),
+            }
+
+
+GROQ_QUOTA = GroqQuota()
+
+
+def _groq_backoff(attempt: int) -> float:
+    """Короткий экспоненциальный backoff с полным jitter: 0..0.25·2^attempt s."""
+    import random
+    return random.uniform(0.0, 0.25 * (2 ** attempt))
+
+
+def groq_transcribe(audio: np.ndarray, *, prompt: str = "", api_key: str = "",
+                    trace=None, quota: GroqQuota = None, planner: UploadPlanner = None,
+                    codec: str = None) -> str:
     """
     Одним запросом отправляет всю запись в Groq и возвращает текст.
     При любой ошибке возвращает "" — вызывающий код падает на локальный фоллбэк.
+    Близко к лимиту quota (по умолчанию GROQ_QUOTA) запрос не отправляется;
+    429/5xx/обрыв соединения повторяются, если ожидание укладывается в бюджет.
+    Формат выбирает planner (по умолчанию GROQ_UPLOADS), codec — принудительно.
+    С GROQ_CHUNKED тело уходит потоком, пока запись ещё кодируется; повтор
+    кодирует заново (держать закодированное ради повтора — та же память).
+    Если chunked-попытка получила 4xx (кроме 429) или обрыв, повтор идёт с
+    Content-Length.
+    Если передан trace, пишет в него фазы encode/upload/server/retry.
     """
+    global GROQ_CHUNKED
     key = api_key or GROQ_API_KEY
     if not key:
         log("[groq] ключ не найден — фоллбэк на локальную модель")
         return ""
+    quota = quota or GROQ_QUOTA
+    audio_sec = len(audio) / SAMPLE_RATE
+    why = quota.admit(audio_sec)
+    if why:
+        log(f"[groq] {why} — сразу локальная модель")
+        if trace is not None:
+            trace.meta["groq_skip"] = why
+        return ""
     try:
         import requests  # ленивый импорт: локальный режим не требует requests
     except Exception as ex:  # noqa: BLE001
         log(f"[groq] requests недоступен ({ex}) — фоллбэк")
         return ""
-    try:
-        fname, payload, mime = _encode_for_groq(audio)
-        files = {"file": (fname, payload, mime)}
-        data = {
-            "model": GROQ_MODEL,
-            "language": LANGUAGE,
-            "response_format": "json",
-            "temperature": "0",
-        }
-        if prompt:
-            data["prompt"] = prompt
+    planner = planner or GROQ_UPLOADS
+    plan = planner.predict(codec, audio_sec) if codec in planner.model else planner.choose(audio_sec)
+    if trace is not None:
+        trace.meta["upload_plan"] = plan
+    data = {
+        "model": GROQ_MODEL,
+        "language": LANGUAGE,
+        "response_format": "json",
+        "temperature": "0",
+    }
+    if prompt:
+        data["prompt"] = prompt
+    sized = {}   # тело с Content-Length кодируется один раз на все попытки
+    chunked = GROQ_CHUNKED
+    chunked_failed = False
+
+    def prepare() -> tuple:
+        if chunked:
+            fname, mime, blocks, prepared = _stream_for_groq(audio, plan["codec"])
+            content_type, head, tail = _multipart_frame(data, fname, mime)
+            return fname, content_type, _StreamBody(head, blocks, tail, prepared)
+        if not sized:
+            enc_started = time.perf_counter()
+            fname, payload, mime = _encode_for_groq(audio, plan["codec"])
+            enc_done = time.perf_counter()
+            sized.update(fname=fname, parts=_multipart_pieces(data, fname, payload, mime),
+                         encode=(enc_started, enc_done, enc_done - enc_started, sum(len(p) for p in payload)))
+        body = _TimedBody(sized["parts"][1])
+        body.encode = sized["encode"]
+        return sized["fname"], sized["parts"][0], body
+
+    first_started = time.perf_counter()
+    for attempt in range(GROQ_RETRIES + 1):
+        try:
+            fname, content_type, body = prepare()
+        except Exception as ex:  # noqa: BLE001
+            log(f"[groq] ошибка подготовки запроса ({ex}) — фоллбэк на локальную модель")
+            return ""
+        streamed = isinstance(body, _StreamBody)
+        rejected = None   # причина, по которой chunked-тело не прошло
         started = time.perf_counter()
-        resp = requests.post(
-            GROQ_API_URL,
-            headers={"Authorization": f"Bearer {key}"},
-            files=files,
-            data=data,
-            timeout=(GROQ_CONNECT_TIMEOUT, GROQ_TIMEOUT),
-        )
-        elapsed = time.perf_counter() - started
-        if resp.status_code != 200:
-            log(f"[groq] HTTP {resp.status_code}: {resp.text[:160]} — фоллбэк")
+        quota.spend(requests=1)
+        try:
+            resp = requests.post(
+                GROQ_API_URL,
+                headers={"Authorization": f"Bearer {key}", "Content-Type": content_type},
+                data=body,
+                timeout=(GROQ_CONNECT_TIMEOUT, GROQ_TIMEOUT),
+            )
+        except requests.ConnectionError as ex:
+            # Отказ/обрыв соединения (и ConnectTimeout) — повторяем. Таймаут чтения
+            # сюда не попадает: он уже съел бюджет, сразу фоллбэк.
+            status, resp, wait, reason = None, None, _groq_backoff(attempt), f"соединение: {ex}"
+            if streamed:
+                body.close()
+                rejected = reason
+        except Exception as ex:  # noqa: BLE001
+            if streamed:
+                body.close()
+            log(f"[groq] ошибка запроса ({ex}) — фоллбэк на локальную модель")
             return ""
-        text = (resp.json().get("text") or "").strip()
-        audio_sec = len(audio) / SAMPLE_RATE
-        kb = len(payload) / 1024
-        log(f"[groq] {audio_sec:.1f}s аудио ({fname}, {kb:.0f}КБ) → {elapsed:.2f}s: {text}")
-        return text
-    except Exception as ex:  # noqa: BLE001
-        log(f"[groq] ошибка запроса ({ex}) — фоллбэк на локальную модель")
-        return ""
+        else:
+            done = time.perf_counter()
+            status = resp.status_code
+            enc_started, enc_done, enc_sec, payload_bytes = body.encode
+            if status == 200:
+                quota.spend(audio_sec=audio_sec)
+                # В потоке кодирование шло внутри запроса — его время к каналу не относится.
+                transfer = planner.record_transfer(
+                    body.sent if streamed else len(body),
+                    done - started - (body.inline_sec if streamed else 0.0), resp.headers)
+                if fname == _UPLOAD_CODECS[plan["codec"]]["file"]:   # иначе кодек упал и ушёл WAV
+                    planner.record_encode(plan["codec"], audio_sec, enc_sec, payload_bytes)
+            quota.observe(resp.headers)   # заголовки сервера точнее нашего учёта — после spend
+            if trace is not None:
+                if enc_started is not None and (streamed or attempt == 0):
+                    trace.add("encode", enc_started, enc_done or done, format=plan["codec"],
+                              kb=round(payload_bytes / 1024, 1), busy_ms=round(enc_sec * 1000.0, 1),
+                              streamed=streamed)
+                upload_done = body.done_at or done
+                trace.add("upload", started, upload_done, status=status, attempt=attempt)
+                trace.add("server", upload_done, done)
+            if status == 200:
+                try:
+                    text = (resp.json().get("text") or "").strip()
+                except ValueError as ex:
+                    log(f"[groq] неразборчивый ответ ({ex}) — фоллбэк")
+                    return ""
+                if chunked_failed and GROQ_CHUNKED:
+                    GROQ_CHUNKED = False
+                    log("[groq] сервер принял тело с Content-Length после отказа chunked — поток выключен")
+                kb = payload_bytes / 1024
+                retried = f", попытка {attempt + 1}" if attempt else ""
+                log(f"[groq] {plan['codec']}: прогноз {plan['total_sec']:.2f}s "
+                    f"({plan['encode_sec']:.2f} кодирование + {plan['upload_sec']:.2f} отправка, {plan['kb']:.0f}КБ), "
+                    f"факт {enc_sec + transfer:.2f}s ({enc_sec:.2f} + {transfer:.2f}, "
+                    f"{kb:.0f}КБ{', поток' if streamed else ''}); канал ~{planner.uplink_kbps():.0f} кбит/с")
+                if trace is not None:
+                    trace.meta["upload_actual"] = {"encode_sec": round(enc_sec, 3),
+                                                   "upload_sec": round(transfer, 3), "kb": round(kb, 1)}
+                log(f"[groq] {audio_sec:.1f}s аудио ({fname}, {kb:.0f}КБ) → {done - started:.2f}s{retried}: {text}")
+                return text
+            if streamed and status != 429 and status < 500:
+                rejected = f"HTTP {status}"
+            elif status != 429 and status < 500:
+                log(f"[groq] HTTP {status}: {resp.text[:160]} — фоллбэк")
+                return ""
+            hinted = _retry_after(resp.headers)
+            wait = hinted if hinted is not None else _groq_backoff(attempt)
+            reason = f"HTTP {status}"
+            if status == 429:
+                # Лимит на стороне Groq: следующие записи тоже не слать, пока не истечёт.
+                # Без Retry-After срок берём из x-ratelimit-reset-*, если observe его видел.
+                wait = max(wait, quota.blocked_for())
+                quota.block(wait, "Groq вернул 429")
+        if rejected:
+            # chunked-тело не прошло (4xx или обрыв): сразу повтор с Content-Length.
+            chunked, chunked_failed = False, True
+            log(f"[groq] chunked-тело не прошло ({rejected}) — повтор с Content-Length")
+            if attempt < GROQ_RETRIES:
+                continue
+            if resp is not None:
+                log(f"[groq] {rejected}: {resp.text[:160]} — фоллбэк")
+                return ""
+        spent = time.perf_counter() - first_started
+        if attempt >= GROQ_RETRIES or spent + wait > GROQ_RETRY_BUDGET_SEC:
+            log(f"[groq] {reason}, повтор через {wait:.1f}s не укладывается "
+                f"в бюджет {GROQ_RETRY_BUDGET_SEC:.1f}s — фоллбэк")
+            if trace is not None:
+                trace.meta["groq_fail"] = reason
+            return ""
+        log(f"[groq] {reason} — повтор через {wait:.2f}s")
+        wait_started = time.perf_counter()
+        time.sleep(wait)
+        if trace is not None:
+            trace.add("retry", wait_started, time.perf_counter(), reason=reason)
+    return ""
 
 
 # ═══════════════════════════════════════════════════
@@ -249,6 +1043,7 @@ BAR_STEP  = 7
 BARS_X    = 74
 BAR_MIN   = 2.0
 BAR_MAX   = 18.0
+BAR_DAMAGE_PX = 0.75   # сдвиг полоски меньше этого (в px) не перерисовывается
 
 # EQ smoothing
 EQ_ATTACK        = 0.86
@@ -259,22 +1054,315 @@ EQ_RMS_FULL      = 0.028   # rms, при котором бары считают
 EQ_VISUAL_GAMMA  = 0.62    # усиливает видимую реакцию на среднюю громкость
 EQ_WOBBLE_MAX    = 0.16    # добавляет "живость" баров при речи
 
+# Окно логов: в Listbox живёт только "окно" из первых строк, остальное
+# догружается страницами при прокрутке к низу.
+LOGS_PAGE_ROWS   = 200
+LOGS_LOAD_MORE_AT = 0.96   # доля прокрутки, после которой догружаем страницу
+# С диска при открытии читается только хвост лога; более старые записи —
+# такими же порциями (с конца файла к началу), когда до них докрутили.
+LOGS_TAIL_RECORDS = 1000
+LOGS_TAIL_BLOCK   = 64 * 1024
+
 V_KEY = 9
 COMMAND_KEY = 55
 INSTANCE_LOCK_PATH = os.getenv("WHISPERMAC_INSTANCE_LOCK", "/tmp/whispermac-app.lock")
 
 
+class LogWriter:
+    """
+    Единый фоновый писатель для runtime/transcript/perf логов.
+
+    Горячие пути (аудио-коллбэк, воркеры, Tk) только кладут запись в
+    ограниченную очередь без блокировки. Поток-писатель собирает пачку
+    за LOG_FLUSH_SEC, пишет её одним open() на файл, при необходимости
+    ротирует файл (по размеру или по смене дня) и сжимает архив в .gz.
+    Старые архивы удаляются сверх keep, кроме логов из keep_all (история
+    диктовок: её архивы остаются все и видны в окне логов).
+    Если очередь переполнена, запись отбрасывается и учитывается в счётчике.
+    """
+
+    _STOP = object()
+
+    def __init__(self, *, maxsize: int, flush_sec: float, max_bytes: int,
+                 rotate_daily: bool, keep: int, keep_all=()):
+        self._q = queue.Queue(maxsize)
+        self._flush_sec = flush_sec
+        self._max_bytes = max_bytes
+        self._rotate_daily = rotate_daily
+        self._keep = keep
+        self._keep_all = {Path(p) for p in keep_all}
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+        self._dropped_lock = threading.Lock()   # write() зовут из разных потоков
+        self.dropped = 0
+        self._dropped_reported = 0
+
+    def write(self, path, text: str, *, stamp: bool = True, echo: bool = False,
+              on_written=None) -> bool:
+        """Неблокирующая постановка строки в очередь. path=None — только консоль."""
+        item = (path, time.time(), text, stamp, echo, on_written)
+        if self._closed:
+            # После close() (выход) пишем синхронно, чтобы ничего не потерять.
+            self._write_batch([item])
+            return True
+        self._ensure_started()
+        try:
+            self._q.put_nowait(item)
+            return True
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+            return False
+
+    def close(self, timeout: float = 2.0):
+        """Гарантированный сброс очереди при выходе."""
+        if self._closed:
+            return
+        self._closed = True
+        thread = self._thread
+        if thread is None:
+            return
+        try:
+            self._q.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        thread.join(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name="whispermac-log", daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def _run(self):
+        while True:
+            first = self._q.get()
+            stop = first is self._STOP
+            batch = [] if stop else [first]
+            deadline = time.monotonic() + self._flush_sec
+            while not stop:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            if stop:
+                # Дочитываем всё, что успели положить до close().
+                while True:
+                    try:
+                        item = self._q.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not self._STOP:
+                        batch.append(item)
+            self._write_batch(batch)
+            if stop:
+                return
+
+    def _write_batch(self, batch: list):
+        with self._dropped_lock:
+            lost = self.dropped - self._dropped_reported
+            self._dropped_reported = self.dropped
+        if lost and RUNTIME_LOG:
+            batch.append((RUNTIME_LOG_PATH, time.time(),
+                          f"[log] очередь переполнена: отброшено {lost} записей",
+                          True, False, None))
+        by_path = {}
+        echo_lines = []
+        callbacks = []
+        for path, ts, text, stamp, echo, on_written in batch:
+            if echo:
+                echo_lines.append(f"  {text}\n")
+            if path is not None:
+                line = f"[{datetime.fromtimestamp(ts):%Y-%m-%d %H:%M:%S}] {text}\n" if stamp else f"{text}\n"
+                by_path.setdefault(path, []).append(line)
+            if on_written is not None:
+                callbacks.append(on_written)
+        if echo_lines:
+            try:
+                sys.stdout.write("".join(echo_lines))
+                sys.stdout.flush()
+            except Exception:
+                pass
+        for path, lines in by_path.items():
+            data = "".join(lines)
+            try:
+                self._maybe_rotate(Path(path), len(data.encode("utf-8")))
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(data)
+            except Exception:
+                pass
+        for cb in callbacks:
+            try:
+                cb()
+            except Exception:
+                pass
+
+    def _maybe_rotate(self, path: Path, incoming: int):
+        try:
+            st = path.stat()
+        except OSError:
+            return
+        if st.st_size <= 0:
+            return
+        too_big = self._max_bytes and st.st_size + incoming > self._max_bytes
+        new_day = self._rotate_daily and date.fromtimestamp(st.st_mtime) != date.today()
+        if not (too_big or new_day):
+            return
+        stamp = datetime.fromtimestamp(st.st_mtime).strftime("%Y%m%d-%H%M%S")
+        rotated = path.with_name(f"{path.name}.{stamp}")
+        n = 1
+        while rotated.exists() or Path(f"{rotated}.gz").exists():
+            rotated = path.with_name(f"{path.name}.{stamp}-{n}")
+            n += 1
+        os.replace(path, rotated)
+        try:
+            with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            rotated.unlink()
+        except Exception:
+            # Не удалось сжать — оставляем несжатый архив.
+            pass
+        if path in self._keep_all:
+            return
+        for old in log_archives(path)[self._keep:]:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+
+
+def log_archives(path: Path) -> list:
+    """Архивы лога path (path.<время>[.gz]), от новых к старым."""
+    path = Path(path)
+    found = []
+    for p in path.parent.glob(f"{path.name}.*"):
+        try:
+            found.append((p.stat().st_mtime, p))
+        except OSError:
+            pass
+    return [p for _, p in sorted(found, reverse=True)]
+
+
+_LOG_WRITER = LogWriter(
+    maxsize=LOG_QUEUE_SIZE,
+    flush_sec=LOG_FLUSH_SEC,
+    max_bytes=LOG_MAX_BYTES,
+    rotate_daily=LOG_ROTATE_DAILY,
+    keep=LOG_KEEP_ARCHIVES,
+    keep_all=(TRANSCRIPT_LOG_PATH,),
+)
+atexit.register(_LOG_WRITER.close)
+
+
+LOG_ECHO = True   # дублировать log() в stdout
+
+
 def log(msg):
-    line = f"  {msg}"
-    print(line, flush=True)
-    if not _env_bool("WHISPERMAC_RUNTIME_LOG", True):
-        return
-    try:
-        from datetime import datetime
-        with open(Path.home() / "whisper_runtime.log", "a", encoding="utf-8") as f:
-            f.write(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {msg}\n")
-    except Exception:
-        pass
+    _LOG_WRITER.write(RUNTIME_LOG_PATH if RUNTIME_LOG else None, str(msg), echo=LOG_ECHO)
+
+
+class UtteranceTrace:
+    """
+    Span'ы одной диктовки: фаза + начало/конец (unix-время) + длительность.
+    Сохраняется одной JSONL-строкой в ~/whisper_perf.jsonl; сводку по
+    истории печатает `whisper_mac.py report`.
+    """
+
+    def __init__(self, engine: str, *, persist: bool = True):
+        self.id = uuid.uuid4().hex[:12]
+        self.engine = engine
+        self.persist = persist
+        self.meta = {}
+        self.spans = []
+        self._t0 = time.perf_counter()
+        self._wall0 = time.time()
+        self._lock = threading.Lock()
+        self._saved = False
+
+    def _wall(self, t: float) -> float:
+        return round(self._wall0 + (t - self._t0), 4)
+
+    def add(self, phase: str, start: float, end: float, **extra):
+        """start/end — значения time.perf_counter()."""
+        span = {
+            "phase": phase,
+            "start": self._wall(start),
+            "end": self._wall(end),
+            "ms": round((end - start) * 1000.0, 2),
+        }
+        span.update(extra)
+        with self._lock:
+            self.spans.append(span)
+
+    @contextlib.contextmanager
+    def span(self, phase: str, **extra):
+        """Замер блока кода; в выданный dict можно дописать поля span'а."""
+        started = time.perf_counter()
+        try:
+            yield extra
+        finally:
+            self.add(phase, started, time.perf_counter(), **extra)
+
+    def save(self):
+        if self._saved:
+            return
+        self._saved = True
+        if not (SAVE_PERF_LOG and self.persist):
+            return
+        with self._lock:
+            record = {
+                "utt": self.id,
+                "engine": self.engine,
+                "ts": round(self._wall0, 3),
+                **self.meta,
+                "spans": list(self.spans),
+            }
+        _LOG_WRITER.write(PERF_SPANS_PATH, json.dumps(record, ensure_ascii=False), stamp=False)
+
+
+class StartupTimeline:
+    """
+    Вехи холодного старта в мс от начала импорта модуля. Каждая веха — строка
+    в runtime-лог; когда пройдены все STAGES, сводка уходит и в perf-лог.
+    """
+
+    STAGES = ("import", "window", "audio", "engine")
+
+    def __init__(self, t0: float):
+        self.t0 = t0
+        self.marks = {}
+        self._lock = threading.Lock()
+        self._reported = False
+
+    def mark(self, name: str):
+        ms = (time.perf_counter() - self.t0) * 1000.0
+        with self._lock:
+            if name in self.marks:
+                return
+            self.marks[name] = ms
+            complete = not self._reported and all(s in self.marks for s in self.STAGES)
+            if complete:
+                self._reported = True
+        log(f"[startup] {name}: {ms:.0f}ms")
+        if complete:
+            line = "[startup] " + ", ".join(f"{k}={v:.0f}ms" for k, v in self.marks.items())
+            log(line)
+            if SAVE_PERF_LOG:
+                _LOG_WRITER.write(PERF_LOG_PATH, line)
+
+
+STARTUP = StartupTimeline(_PROCESS_T0)
 
 
 _PYNPUT_TSM_PATCHED = False
@@ -346,23 +1434,24 @@ def acquire_instance_lock():
 
 
 def frontmost_bundle():
+    _load_macos()
     app = NSWorkspace.sharedWorkspace().frontmostApplication()
     return app.bundleIdentifier() if app else None
 
 
 def activate_bundle(bid):
+    _load_macos()
     NSApplicationActivateAllWindows = 1
     NSApplicationActivateIgnoringOtherApps = 2
     options = NSApplicationActivateAllWindows | NSApplicationActivateIgnoringOtherApps
-    for app in NSWorkspace.sharedWorkspace().runningApplications():
-        if app.bundleIdentifier() == bid:
-            try:
-                app.activateWithOptions_(options)
-                if _wait_for_frontmost_bundle(bid):
-                    return True
-            except Exception as ex:
-                log(f"NSWorkspace activate failed for {bid}: {ex}")
-            break
+    app = running_app_for_bundle(bid)
+    if app is not None:
+        try:
+            app.activateWithOptions_(options)
+            if _wait_for_frontmost_bundle(bid):
+                return True
+        except Exception as ex:
+            log(f"NSWorkspace activate failed for {bid}: {ex}")
     return activate_bundle_osascript(bid)
 
 
@@ -403,15 +1492,158 @@ def activate_bundle_osascript(bid) -> bool:
 
 
 def running_app_for_bundle(bid):
+    _load_macos()
     if not bid:
         return None
+    if FOCUS is not None:
+        app = FOCUS.app_for(bid)
+        if app is not None:
+            return app
     for app in NSWorkspace.sharedWorkspace().runningApplications():
         if app.bundleIdentifier() == bid:
             return app
     return None
 
 
+# ── Отслеживание активного приложения ───────────────
+# Вместо опроса frontmost_bundle() каждые 300 мс и перебора runningApplications()
+# на каждой вставке: подписка на уведомления NSWorkspace (activate/launch/terminate)
+# и индекс bundle id → NSRunningApplication.
+
+class FocusSource:
+    """Источник событий фокуса: running()/frontmost() для начального состояния + подписка."""
+
+    def running(self) -> list:
+        return []
+
+    def frontmost(self):
+        return None, None
+
+    def subscribe(self, on_activate, on_launch, on_terminate):
+        pass
+
+    def close(self):
+        pass
+
+
+class WorkspaceFocusSource(FocusSource):
+    """Уведомления NSWorkspace; блоки вызываются в главном потоке (run loop Tk)."""
+
+    _NOTES = (
+        ("NSWorkspaceDidActivateApplicationNotification", 0),
+        ("NSWorkspaceDidLaunchApplicationNotification", 1),
+        ("NSWorkspaceDidTerminateApplicationNotification", 2),
+    )
+
+    def __init__(self):
+        self._observers = []
+        self._center = None
+
+    def running(self) -> list:
+        _load_macos()
+        return [(app.bundleIdentifier(), app)
+                for app in NSWorkspace.sharedWorkspace().runningApplications()]
+
+    def frontmost(self):
+        _load_macos()
+        app = NSWorkspace.sharedWorkspace().frontmostApplication()
+        return (app.bundleIdentifier() if app else None), app
+
+    def subscribe(self, on_activate, on_launch, on_terminate):
+        appkit = _lazy_import("AppKit")
+        if appkit is None:
+            return
+        self._center = appkit.NSWorkspace.sharedWorkspace().notificationCenter()
+        handlers = (on_activate, on_launch, on_terminate)
+        for name, idx in self._NOTES:
+            def block(note, handler=handlers[idx]):
+                app = note.userInfo().get(appkit.NSWorkspaceApplicationKey)
+                if app is not None:
+                    handler(app.bundleIdentifier(), app)
+            self._observers.append(self._center.addObserverForName_object_queue_usingBlock_(
+                getattr(appkit, name), None, None, block
+            ))
+
+    def close(self):
+        for obs in self._observers:
+            with contextlib.suppress(Exception):
+                self._center.removeObserver_(obs)
+        self._observers.clear()
+
+
+class FocusTracker:
+    """Текущее активное приложение, последняя внешняя цель и индекс запущенных приложений."""
+
+    def __init__(self, source: FocusSource, *, excluded=lambda bid: not bid, on_change=None):
+        self.source = source
+        self.excluded = excluded
+        self.on_change = on_change   # (bid) при смене активного внешнего приложения
+        self._lock = threading.Lock()
+        self._apps = {}
+        self._front = None
+        self._last_external = (None, 0.0)
+
+    def start(self) -> "FocusTracker":
+        try:
+            with self._lock:
+                self._apps = {bid: app for bid, app in self.source.running() if bid}
+            bid, app = self.source.frontmost()
+            if bid:
+                self._on_activate(bid, app)
+            self.source.subscribe(self._on_activate, self._on_launch, self._on_terminate)
+        except Exception as ex:
+            log(f"[focus] подписка не удалась: {ex}")
+        return self
+
+    def close(self):
+        self.source.close()
+
+    def _on_activate(self, bid, app):
+        if not bid:
+            return
+        with self._lock:
+            self._front = bid
+            if app is not None:
+                self._apps[bid] = app
+            external = not self.excluded(bid)
+            if external:
+                self._last_external = (bid, time.time())
+        if external and self.on_change is not None:
+            self.on_change(bid)
+
+    def _on_launch(self, bid, app):
+        if bid and app is not None:
+            with self._lock:
+                self._apps[bid] = app
+
+    def _on_terminate(self, bid, app):
+        with self._lock:
+            if self._apps.get(bid) is app or app is None:
+                self._apps.pop(bid, None)
+            if self._last_external[0] == bid:
+                self._last_external = (None, 0.0)
+
+    @property
+    def frontmost(self):
+        with self._lock:
+            return self._front
+
+    def last_external(self) -> tuple:
+        """(bundle id, unix-время активации) последнего не исключённого приложения."""
+        with self._lock:
+            return self._last_external
+
+    def app_for(self, bid):
+        with self._lock:
+            return self._apps.get(bid)
+
+
+FOCUS = None   # FocusTracker приложения (App._on_macos_ready)
+
+
 def request_accessibility_permission(prompt: bool = False) -> bool:
+    if not _load_macos():
+        return False
     try:
         if prompt:
             return bool(
@@ -477,13 +1709,19 @@ def ax_insert_text(text: str, target_bid: str = "") -> bool:
         return False
 
 
-def _post_key(key_code: int, pressed: bool, flags: int = 0, tap: int = kCGHIDEventTap):
+def _post_key(key_code: int, pressed: bool, flags: int = 0, tap: int = None):
+    _load_macos()
+    if tap is None:
+        tap = kCGHIDEventTap
     event = CGEventCreateKeyboardEvent(None, key_code, pressed)
     CGEventSetFlags(event, flags)
     CGEventPost(tap, event)
 
 
-def cmd_v(tap: int = kCGHIDEventTap):
+def cmd_v(tap: int = None):
+    _load_macos()
+    if tap is None:
+        tap = kCGHIDEventTap
     _post_key(COMMAND_KEY, True, kCGEventFlagMaskCommand, tap)
     time.sleep(0.015)
     _post_key(V_KEY, True, kCGEventFlagMaskCommand, tap)
@@ -578,26 +1816,321 @@ def cmd_v_pynput() -> bool:
         return False
 
 
-def _clean_chunk(text: str) -> str:
-    """Убирает артефакты Whisper на границах чанков."""
-    import re
-    text = text.strip()
-    # Убираем ведущие/замыкающие точки, многоточия, пробелы
-    text = re.sub(r'^[\s\.…]+', '', text)
-    text = re.sub(r'[\s\.…]+$', '', text)
-    return text.strip()
-
-
-def _join_chunks(parts: list) -> str:
-    cleaned = [_clean_chunk(p) for p in parts]
-    cleaned = [p for p in cleaned if p]
-    return " ".join(cleaned)
+# ═══════════════════════════════════════════════════
+# Стратегия вставки
+#
+# auto-режим раньше каждый раз шёл одной цепочкой: AX → osascript keycode →
+# osascript → pynput → session CGEvent → HID CGEvent, и у osascript-веток
+# таймаут 1.5 с. Какой способ срабатывает, зависит от приложения, поэтому
+# результаты копятся по bundle id в ~/.cache/whispermac/paste_strategy.json:
+# первым пробуется самый быстрый из сработавших, а способ, который падает
+# несколько раз подряд, уходит в конец цепочки.
+
+PASTE_METHODS = ("ax", "osascript-keycode", "osascript", "pynput", "session", "cgevent")
+# Этим способам нужен Accessibility-доступ заранее, без него и пробовать нечего.
+PASTE_NEEDS_AX = frozenset({"pynput", "session", "cgevent"})
+PASTE_MODE_ALIASES = {"keycode": "osascript-keycode"}
+PASTE_CACHE = _env_bool("WHISPERMAC_PASTE_CACHE", True)
+PASTE_CACHE_PATH = Path.home() / ".cache" / "whispermac" / "paste_strategy.json"
+PASTE_DEMOTE_AFTER = int(max(1, _env_float("WHISPERMAC_PASTE_DEMOTE_AFTER", 3)))
+
+
+class PasteBackend:
+    """
+    Платформенные вызовы вставки. Логика выбора способа от них не зависит.
+    Без платформы ни один способ не срабатывает: вставка честно не удаётся.
+    """
 
+    def accessibility_ok(self) -> bool:
+        return False
 
-def _prompt_from_parts(parts: list) -> str:
-    """Короткий prompt для смешанной русско-английской речи."""
-    tail = _join_chunks(parts)[-180:] if parts else ""
-    return f"{HOTWORDS_PROMPT}\n{tail}" if tail else HOTWORDS_PROMPT
+    def send(self, method: str, target: str, text: str) -> bool:
+        return False
+
+
+class MacPasteBackend(PasteBackend):
+    def accessibility_ok(self) -> bool:
+        return request_accessibility_permission(prompt=False)
+
+    def send(self, method: str, target: str, text: str) -> bool:
+        _load_macos()
+        if method == "ax":
+            return ax_insert_text(text, target)
+        if method == "osascript-keycode":
+            return cmd_v_osascript_keycode(target)
+        if method == "osascript":
+            return cmd_v_osascript(target)
+        if method == "pynput":
+            return cmd_v_pynput()
+        if method in ("session", "cgevent"):
+            try:
+                cmd_v(kCGSessionEventTap if method == "session" else kCGHIDEventTap)
+                return True
+            except Exception as ex:
+                log(f"CGEvent Cmd+V failed: {ex}")
+                return False
+        return False
+
+
+class PasteStrategyCache:
+    """Статистика способов вставки по bundle id, переживает перезапуск."""
+
+    def __init__(self, path: Path = PASTE_CACHE_PATH, *, demote_after: int = PASTE_DEMOTE_AFTER):
+        self.path = Path(path) if path else None
+        self.demote_after = demote_after
+        self._lock = threading.Lock()
+        self._data = self._load()
+
+    def _load(self) -> dict:
+        if self.path is None:
+            return {}
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        if self.path is None:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self._data, ensure_ascii=False, indent=1), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError as ex:
+            log(f"[paste] кэш стратегий не сохранён: {ex}")
+
+    def order(self, bundle: str, methods=PASTE_METHODS) -> list:
+        """Сработавшие — по средней задержке, потом неопробованные, разжалованные — в конце."""
+        with self._lock:
+            stats = dict(self._data.get(bundle or "-", {}))
+
+        def rank(item):
+            idx, method = item
+            st = stats.get(method)
+            if not st:
+                return (1, 0.0, idx)
+            if st.get("streak", 0) >= self.demote_after:
+                return (2, float(st.get("streak", 0)), idx)
+            if st.get("ok", 0) > 0:
+                return (0, float(st.get("ms", 0.0)), idx)
+            return (1, 0.0, idx)
+
+        return [m for _, m in sorted(enumerate(methods), key=rank)]
+
+    def record(self, bundle: str, method: str, ok: bool, ms: float):
+        with self._lock:
+            st = self._data.setdefault(bundle or "-", {}).setdefault(
+                method, {"ok": 0, "fail": 0, "streak": 0, "ms": 0.0}
+            )
+            if ok:
+                # Скользящее среднее: задержка приложения со временем меняется.
+                st["ms"] = round(ms if not st["ok"] else st["ms"] * 0.7 + ms * 0.3, 1)
+                st["ok"] += 1
+                st["streak"] = 0
+            else:
+                st["fail"] += 1
+                st["streak"] += 1
+            st["last"] = round(time.time(), 1)
+            self._save()
+
+    def stats(self, bundle: str) -> dict:
+        with self._lock:
+            return json.loads(json.dumps(self._data.get(bundle or "-", {})))
+
+
+def paste_with_strategy(backend: PasteBackend, cache, target: str, text: str,
+                        mode: str = PASTE_SHORTCUT_MODE) -> tuple:
+    """Отправляет вставку; возвращает (ok, способ, попытки [(способ, ok, мс)])."""
+    mode = PASTE_MODE_ALIASES.get(mode, mode)
+    if mode in PASTE_METHODS:
+        methods = [mode]
+    elif cache is not None:
+        methods = cache.order(target)
+    else:
+        methods = list(PASTE_METHODS)
+    attempts = []
+    ax_ok = None
+    for method in methods:
+        if method in PASTE_NEEDS_AX:
+            if ax_ok is None:
+                ax_ok = backend.accessibility_ok()
+            if not ax_ok:
+                log("Accessibility permission missing for simulated paste")
+                continue
+        started = time.perf_counter()
+        ok = bool(backend.send(method, target, text))
+        ms = (time.perf_counter() - started) * 1000.0
+        attempts.append((method, ok, round(ms, 1)))
+        if cache is not None:
+            cache.record(target, method, ok, ms)
+        if ok:
+            log(f"Paste sent via {method} ({ms:.0f}ms, попытка {len(attempts)})")
+            return True, method, attempts
+    return False, "", attempts
+
+
+# ── Конвейер вставки ────────────────────────────────
+# Раньше вся вставка шла в Tk-потоке: activate_bundle ждал фокуса до 0.45 с,
+# потом мог запустить osascript с таймаутом 1.5 с, плюс фиксированный sleep(0.08)
+# и pbcopy/pbpaste — окно всё это время стояло. Теперь вставки идут по одной
+# в своём потоке через явные состояния, а UI узнаёт о них из очереди событий.
+
+PASTE_STATES = ("clipboard", "activate", "verify", "send", "restore")
+PASTE_FOCUS_TIMEOUT = max(0.05, _env_float("WHISPERMAC_PASTE_FOCUS_TIMEOUT", 0.3))
+
+
+def wait_focus_settled(bid: str, frontmost, timeout: float = PASTE_FOCUS_TIMEOUT,
+                       interval: float = 0.02) -> bool:
+    """Ждёт, пока bid дважды подряд окажется frontmost: окно уже приняло фокус."""
+    deadline = time.perf_counter() + timeout
+    hits = 0
+    while True:
+        hits = hits + 1 if frontmost() == bid else 0
+        if hits >= 2:
+            return True
+        if time.perf_counter() >= deadline:
+            return False
+        time.sleep(interval)
+
+
+class PasteJob:
+    __slots__ = ("seq", "text", "target", "trace")
+
+    def __init__(self, seq: int, text: str, target: str, trace):
+        self.seq = seq
+        self.text = text
+        self.target = target or ""
+        self.trace = trace
+
+
+class PasteWorker:
+    """
+    Вставки по одной в отдельном потоке: clipboard → activate → verify → send → restore.
+    Все платформенные шаги передаются снаружи; о каждом переходе сообщается
+    emit(seq, состояние, info) (по умолчанию — очередь events), UI-поток разбирает её сам.
+    Финальные состояния: "done", "skipped", "failed".
+    """
+
+    def __init__(self, *, copy, frontmost, activate, send, excluded, settle=wait_focus_settled,
+                 emit=None):
+        self.copy = copy
+        self.frontmost = frontmost
+        self.activate = activate
+        self.send = send
+        self.excluded = excluded
+        self.settle = settle
+        self.events = queue.Queue()
+        # emit(seq, состояние, info) — куда сообщать; по умолчанию в self.events.
+        self.emit = emit or (lambda seq, state, info: self.events.put((seq, state, info)))
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="paste", daemon=True)
+        self._thread.start()
+
+    def submit(self, job: PasteJob):
+        self._jobs.put(job)
+
+    def close(self, timeout: float = 2.0):
+        self._jobs.put(None)
+        self._thread.join(timeout=timeout)
+
+    def _emit(self, job: PasteJob, state: str, **info):
+        self.emit(job.seq, state, info)
+
+    def call_ui(self, fn, timeout: float = 1.0):
+        """Выполнить fn в UI-потоке (событие "ui") и дождаться результата."""
+        done = threading.Event()
+        box = []
+
+        def run():
+            try:
+                box.append(fn())
+            finally:
+                done.set()
+
+        self.emit(None, "ui", {"run": run})
+        return box[0] if done.wait(timeout) and box else None
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            try:
+                state, info = self._paste(job)
+            except Exception as ex:
+                log(f"[paste] #{job.seq} ошибка: {ex}")
+                state, info = "failed", {"reason": str(ex)}
+            if info.pop("restore", False):
+                self._emit(job, "restore")
+            job.trace.meta["paste_state"] = state
+            job.trace.save()
+            self._emit(job, state, **info)
+
+    def _paste(self, job: PasteJob) -> tuple:
+        trace = job.trace
+        self._emit(job, "clipboard")
+        with trace.span("clipboard") as sp:
+            sp["ok"] = self.copy(job.text)
+        if not sp["ok"]:
+            return "failed", {"reason": "clipboard"}
+
+        target = job.target
+        if self.excluded(target):
+            target = ""
+        front = self.frontmost() or ""
+        if not target and front and not self.excluded(front):
+            target = front
+        if not target:
+            log("Paste skipped: no external target; text is in clipboard")
+            return "skipped", {"reason": "no-target"}
+
+        self._emit(job, "activate", target=target)
+        with trace.span("activate", target=target) as sp:
+            # Цель уже впереди (обычный случай) — активировать нечего.
+            sp["ok"] = front == target or self.activate(target)
+            if not sp["ok"]:
+                log(f"Target activate failed: {target}")
+
+        self._emit(job, "verify", target=target)
+        with trace.span("verify", target=target) as sp:
+            sp["ok"] = self.settle(target, self.frontmost)
+            front = self.frontmost() or ""
+        paste_target = target
+        if front and not self.excluded(front) and front != paste_target:
+            log(f"Paste target changed: saved={paste_target} actual={front}")
+            paste_target = front
+        log(f"Paste target={paste_target} frontmost={front or '-'} mode={PASTE_SHORTCUT_MODE or 'auto'}")
+
+        self._emit(job, "send", target=paste_target)
+        with trace.span("paste", target=paste_target) as sp:
+            sp["ok"], sp["method"], sp["attempts"] = self.send(paste_target, job.text)
+        if not sp["ok"]:
+            return "failed", {"reason": "send", "restore": True}
+        return "done", {"method": sp["method"], "restore": True}
+
+
+def _clean_chunk(text: str) -> str:
+    """Убирает артефакты Whisper на границах чанков."""
+    import re
+    text = text.strip()
+    # Убираем ведущие/замыкающие точки, многоточия, пробелы
+    text = re.sub(r'^[\s\.…]+', '', text)
+    text = re.sub(r'[\s\.…]+$', '', text)
+    return text.strip()
+
+
+def _join_chunks(parts: list) -> str:
+    cleaned = [_clean_chunk(p) for p in parts]
+    cleaned = [p for p in cleaned if p]
+    return " ".join(cleaned)
+
+
+def _prompt_from_parts(parts: list, base: str = HOTWORDS_PROMPT) -> str:
+    """Короткий prompt для смешанной русско-английской речи."""
+    tail = _join_chunks(parts)[-180:] if parts else ""
+    return f"{base}\n{tail}" if tail else base
 
 
 def _is_repetition_loop(text: str) -> bool:
@@ -685,15 +2218,2121 @@ def _likely_silence_hallucination(text: str, avg_no_speech: float) -> bool:
     return avg_no_speech >= SILENCE_SKIP_NO_SPEECH and len(text.strip()) <= SILENCE_SKIP_MAX_CHARS
 
 
-def pill_points(x1, y1, x2, y2, r):
-    return [
-        x1+r, y1,   x2-r, y1,
-        x2,   y1,   x2,   y1+r,
-        x2,   y2-r, x2,   y2,
-        x2-r, y2,   x1+r, y2,
-        x1,   y2,   x1,   y2-r,
-        x1,   y1+r, x1,   y1,
-    ]
+# ═══════════════════════════════════════════════════
+# Прогрев локальной модели
+#
+# Раньше прогрев был полным mlx_whisper.transcribe по секунде нулей: mel,
+# энкодер и цикл декодера на сколько угодно токенов (на нулях модель охотно
+# галлюцинирует до конца окна). По умолчанию теперь прогреваются только
+# реально используемые формы: энкодер на 3000 кадрах (Whisper всегда
+# дополняет сегмент до 30 с) и prefill/шаг декодера на двух длинах prompt'а
+# (первый чанк — только hotwords, дальше — hotwords + хвост текста). Веса
+# читаются один раз и сразу кладутся в ModelHolder. Ничего на диск не пишется.
+# WHISPERMAC_WARMUP_SHAPES=0 — старый прогрев через transcribe.
+
+WARMUP_SHAPES = _env_bool("WHISPERMAC_WARMUP_SHAPES", True)
+# Типичный хвост из _prompt_from_parts (180 символов русского текста).
+_WARMUP_TAIL_SAMPLE = (
+    "Привет, сегодня обсуждаем релиз и задачи на неделю, проверить логи и метрики, "
+    "созвон в три часа, доска в Miro уже готова, после этого напишу итоги в чат "
+    "и распределю задачи по команде."
+)[:180]
+
+
+class ModelWarmup:
+    """Загрузка модели и прогрев только тех форм, что встречаются при диктовке."""
+
+    def __init__(self, repo: str = MODEL_REPO):
+        self.repo = repo
+        self.timings = {}
+
+    def _prompt_tokens(self, model) -> dict:
+        from mlx_whisper.tokenizer import get_tokenizer
+        tokenizer = get_tokenizer(
+            model.is_multilingual, num_languages=model.num_languages,
+            language=LANGUAGE, task="transcribe",
+        )
+        # transcribe() кодирует initial_prompt как " " + prompt.strip().
+        hot = tokenizer.encode(" " + HOTWORDS_PROMPT.strip())
+        tail = tokenizer.encode(" " + f"{HOTWORDS_PROMPT}\n{_WARMUP_TAIL_SAMPLE}".strip())
+        return {
+            "hotwords": hot,
+            "with_tail": tail,
+            "sot_prev": tokenizer.sot_prev,
+            "sot_sequence": list(tokenizer.sot_sequence),
+        }
+
+    def _warm_shapes(self, model, prompt_tokens: dict):
+        import mlx.core as mx
+        from mlx_whisper.audio import N_FRAMES
+
+        started = time.perf_counter()
+        mel = mx.zeros((1, N_FRAMES, model.dims.n_mels), dtype=mx.float16)
+        features = model.encoder(mel)
+        mx.eval(features)
+        self.timings["encoder_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+
+        started = time.perf_counter()
+        max_prompt = model.dims.n_text_ctx // 2 - 1   # как в DecodingTask._get_initial_tokens
+        for key in ("hotwords", "with_tail"):
+            tokens = (
+                [prompt_tokens["sot_prev"]]
+                + prompt_tokens[key][-max_prompt:]
+                + prompt_tokens["sot_sequence"]
+            )
+            logits, kv_cache, _ = model.decoder(mx.array([tokens]), features, kv_cache=None)
+            step = mx.array([[int(mx.argmax(logits[0, -1]).item())]])
+            logits, _, _ = model.decoder(step, features, kv_cache=kv_cache)
+            mx.eval(logits)
+        self.timings["decoder_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+
+    def run(self, install: bool = True):
+        """Модель (в ModelHolder mlx_whisper, если install) + прогретые формы; возвращает модель."""
+        import mlx.core as mx
+        from mlx_whisper.load_models import load_model
+
+        started = time.perf_counter()
+        model = load_model(self.repo, dtype=mx.float16)
+        self.timings["load_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+
+        # transcribe() берёт модель из ModelHolder по (path_or_hf_repo) — кладём туда
+        # уже загруженную, чтобы первый вызов не грузил веса повторно.
+        if install:
+            holder = importlib.import_module("mlx_whisper.transcribe").ModelHolder
+            holder.model = model
+            holder.model_path = self.repo
+
+        self._warm_shapes(model, self._prompt_tokens(model))
+        self.timings["total_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+        return model
+
+
+# ── Каскад моделей ──────────────────────────────────
+# ModelHolder в mlx_whisper держит одну модель и перечитывает веса с диска,
+# как только path_or_hf_repo меняется. Для каскада обе модели грузятся один
+# раз (тем же ModelWarmup) и перед каждым вызовом подставляются в holder.
+
+
+class _MlxModel:
+    """Одна резидентная модель mlx_whisper внутри ModelSet."""
+
+    _lock = threading.Lock()   # holder общий: подстановка и декодирование — под одним замком
+
+    def __init__(self, mlx, repo: str):
+        self.mlx = mlx
+        self.repo = repo
+        self.model = None
+
+    def transcribe(self, audio, **opts):
+        holder = importlib.import_module("mlx_whisper.transcribe").ModelHolder
+        with self._lock:
+            if self.model is not None:
+                holder.model, holder.model_path = self.model, self.repo
+            result = self.mlx.transcribe(audio, **{**opts, "path_or_hf_repo": self.repo})
+            if self.model is None and holder.model_path == self.repo:
+                self.model = holder.model   # загрузил сам transcribe (обычный прогрев)
+            return result
+
+
+class ModelSet:
+    """
+    Движок из нескольких моделей: transcribe() выбирает модель по
+    path_or_hf_repo, неизвестный repo — модель по умолчанию (MODEL_REPO).
+    """
+
+    def __init__(self, engines: dict, default: str = MODEL_REPO):
+        self.engines = dict(engines)
+        self.default = default if default in self.engines else next(iter(self.engines))
+
+    @classmethod
+    def mlx(cls, mlx, repos) -> "ModelSet":
+        return cls({repo: _MlxModel(mlx, repo) for repo in repos})
+
+    def transcribe(self, audio, **opts):
+        engine = self.engines.get(opts.get("path_or_hf_repo")) or self.engines[self.default]
+        return engine.transcribe(audio, **opts)
+
+
+def _cascade_repo(repo: str) -> str:
+    """Быстрая модель каскада или "" (каскад выключен)."""
+    repo = (repo or "").strip()
+    return repo if repo and repo != MODEL_REPO else ""
+
+
+def _speculative_repo() -> str:
+    """Черновая модель спекулятивного декодирования или "" (выключено)."""
+    repo = SPECULATIVE_DRAFT_REPO
+    return repo if repo and repo != MODEL_REPO else ""
+
+
+def local_engine(mlx):
+    """
+    mlx_whisper как есть, ModelSet [MODEL_REPO, CASCADE_FAST_REPO] в режиме
+    каскада, поверх — SpeculativeEngine, если задана черновая модель.
+    """
+    if mlx is None:
+        return None
+    fast = _cascade_repo(CASCADE_FAST_REPO)
+    engine = ModelSet.mlx(mlx, (MODEL_REPO, fast)) if fast else mlx
+    if _speculative_repo():
+        engine = SpeculativeEngine(engine, _speculative_repo())
+    return engine
+
+
+def describe_engine(engine) -> dict:
+    """Что на самом деле декодирует engine: для /health и логов."""
+    desc = {}
+    if isinstance(engine, InferenceClient):
+        desc["process"] = engine.worker_pid
+        if engine.engine_spec != "mlx":
+            return {"engine": engine.engine_spec, **desc}
+        # Процесс собирает local_engine() по тем же настройкам, что видны здесь.
+        desc.update(engine="mlx_whisper", model=MODEL_REPO)
+        fast = _cascade_repo(CASCADE_FAST_REPO)
+        if fast:
+            desc["cascade"] = [fast]
+        if _speculative_repo():
+            desc["draft"] = _speculative_repo()
+        return {"engine": desc.pop("engine"), **desc}
+    if isinstance(engine, SpeculativeEngine):
+        desc["draft"] = engine.draft_repo
+        engine = engine.inner
+    if isinstance(engine, ModelSet):
+        desc["engine"] = "mlx_whisper"
+        desc["model"] = engine.default
+        desc["cascade"] = [repo for repo in engine.engines if repo != engine.default]
+    elif engine is None or getattr(engine, "__name__", "") == "mlx_whisper":
+        desc["engine"] = "mlx_whisper"
+        desc["model"] = MODEL_REPO
+    else:
+        desc["engine"] = type(engine).__name__
+    return {"engine": desc.pop("engine"), **desc}
+
+
+def load_local_engine():
+    """
+    Локальный движок как в приложении: процесс инференса (INFERENCE_PROCESS)
+    или local_engine() в этом процессе, прогретый. None — модель недоступна.
+    """
+    if INFERENCE_PROCESS:
+        # Модель живёт в отдельном процессе: mlx не делит GIL с UI и захватом.
+        engine = InferenceClient("mlx").start()
+        if not engine.wait_ready():
+            log("[inference] процесс не поднялся — локальная модель недоступна")
+            engine.close()
+            return None
+        log("[warmup] " + ", ".join(f"{k}={v}" for k, v in engine.warmup.items()))
+        return engine
+    engine = local_engine(_lazy_import("mlx_whisper"))
+    STARTUP.mark("mlx_import")
+    if engine is None:
+        log("mlx_whisper недоступен: локальная модель не загружена")
+        return None
+    warm_local_model(engine)
+    return engine
+
+
+def _warm_repo(engine, repo: str, targeted: bool) -> dict:
+    timings = {"mode": "legacy"}
+    if targeted:
+        try:
+            warmup = ModelWarmup(repo)
+            model = warmup.run()
+            if isinstance(engine, _MlxModel):
+                engine.model = model
+            timings = {"mode": "shapes", **warmup.timings}
+        except Exception as ex:  # noqa: BLE001
+            log(f"[warmup] прогрев форм не удался, обычный прогрев: {ex}")
+            timings = {"mode": "legacy"}
+    if timings["mode"] == "legacy":
+        TranscriptionSession(engine)._transcribe_audio(
+            np.zeros(SAMPLE_RATE, dtype=np.float32), prompt=HOTWORDS_PROMPT, final=False,
+            repo=repo,
+        )
+    return timings
+
+
+def warm_local_model(engine, *, targeted: bool = WARMUP_SHAPES) -> dict:
+    """Прогрев локального движка; {"mode", ...тайминги, "ready_ms"} для лога и бенчмарка."""
+    started = time.perf_counter()
+    if isinstance(engine, SpeculativeEngine):
+        timings = warm_local_model(engine.inner, targeted=targeted)
+        engine.load_draft(targeted=targeted)
+        timings.update({f"draft_{k}": v for k, v in engine.load_timings.items()})
+        log("[warmup] " + ", ".join(f"{k}={v}" for k, v in timings.items() if k.startswith("draft_")))
+        return timings
+    if isinstance(engine, ModelSet):
+        # Каскад: обе модели резидентны; тайминги быстрой — с префиксом fast_.
+        timings = {}
+        for repo, member in engine.engines.items():
+            part = _warm_repo(member, repo, targeted)
+            prefix = "" if repo == engine.default else "fast_"
+            timings.update({prefix + k: v for k, v in part.items()})
+    else:
+        timings = _warm_repo(engine, MODEL_REPO, targeted)
+    timings["ready_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+    log("[warmup] " + ", ".join(f"{k}={v}" for k, v in timings.items()))
+    return timings
+
+
+# ═══════════════════════════════════════════════════
+# Спекулятивное декодирование
+#
+# Локально декодирование жадное (temperature 0.0; beam search в mlx_whisper
+# нет), и каждый токен большой 4-битной модели — полный проход декодера,
+# упирающийся в чтение весов. Черновая модель с тем же словарём жадно
+# предлагает K токенов, большая проверяет их одним проходом по K+1 позициям
+# (по времени почти как один токен) и принимает совпавший префикс плюс свой
+# следующий токен. Результат — жадный вывод большой модели в этом же декодере
+# (k=0): черновик влияет только на скорость, с точностью до float16 при проходе
+# по K+1 позициям вместо одной. KV-кэш откатывается срезом до принятой длины.
+#
+# Это отдельный декодер, а не mlx_whisper.transcribe: он повторяет только
+# DecodingTask с temperature 0 и without_timestamps=True на одном окне до 30 s
+# (те же фильтры SuppressBlank/SuppressTokens, sample_len и пропуск тишины).
+# Поэтому SpeculativeEngine берёт себе лишь вызовы ровно с такими опциями, а
+# чанки при включённом черновике декодируются без временных меток (см.
+# _transcribe_audio); всё остальное уходит в inner.transcribe.
+# tests/test_speculative.py сверяет токены с mlx_whisper на Mac.
+#
+# Маска TextDecoder в mlx_whisper рассчитана на prefill без кэша, поэтому
+# проход декодера с кэшем по нескольким токенам собран здесь из слоёв блоков.
+# Если у черновика такой же размер энкодера (distil-large-v3 — замороженный
+# энкодер large-v3), он берёт признаки энкодера большой модели.
+
+_SPEC_MAX_TOKENS = 224   # sample_len mlx_whisper: n_text_ctx // 2
+
+
+def _log_softmax_at(row: np.ndarray, token: int) -> float:
+    top = float(np.max(row))
+    return float(row[token] - top - np.log(np.sum(np.exp(row - top))))
+
+
+def speculative_greedy(target, draft, prompt: list, *, k: int, pick, eot: int,
+                       max_tokens: int = _SPEC_MAX_TOKENS) -> tuple:
+    """
+    Жадное декодирование target с черновиком draft (None или k=0 — обычный
+    жадный проход). target/draft: feed(tokens) → логиты по каждой позиции
+    (токены дописываются в кэш), rollback(n), length. pick(row, i) → (токен,
+    logprob) для i-го генерируемого токена — одинаковые фильтры для обоих.
+    Вернёт (токены, сумма logprob, статистика).
+    """
+    stats = {"target_calls": 1, "draft_calls": 0, "proposed": 0, "accepted": 0}
+    token, logprob = pick(target.feed(prompt)[-1], 0)
+    out = [token]
+    use_draft = draft is not None and k > 0
+    lag = []   # принятые токены, которых ещё нет в кэше черновика
+    if use_draft:
+        draft.feed(prompt)
+        stats["draft_calls"] += 1
+    while out[-1] != eot and len(out) < max_tokens:
+        pending = out[-1]
+        if not use_draft:
+            token, lp = pick(target.feed([pending])[-1], len(out))
+            stats["target_calls"] += 1
+            out.append(token)
+            logprob += lp
+            continue
+
+        n = min(k, max_tokens - len(out))
+        draft_base = draft.length
+        rows = draft.feed(lag + [pending])
+        fed = len(lag) + 1
+        proposal = []
+        while True:
+            d, _ = pick(rows[-1], len(out) + len(proposal))
+            proposal.append(d)
+            stats["draft_calls"] += 1
+            if d == eot or len(proposal) >= n:
+                break
+            rows = draft.feed([d])
+            fed += 1
+        stats["proposed"] += len(proposal)
+
+        base = target.length
+        rows = target.feed([pending] + proposal)
+        stats["target_calls"] += 1
+        accepted = 0
+        for i, d in enumerate(proposal):
+            token, lp = pick(rows[i], len(out))
+            out.append(token)
+            logprob += lp
+            if token != d:
+                break
+            accepted += 1
+            if token == eot or len(out) >= max_tokens:
+                break
+        else:
+            # Весь черновик принят: следующий токен большой модели — бесплатно.
+            token, lp = pick(rows[len(proposal)], len(out))
+            out.append(token)
+            logprob += lp
+        stats["accepted"] += accepted
+        target.rollback(base + 1 + accepted)
+        # В кэше черновика — pending и proposal[:-1]; лишнее отрезаем, недостающее догонит lag.
+        keep = min(accepted, len(proposal) - 1)
+        draft.rollback(draft_base + fed - (len(proposal) - 1 - keep))
+        lag = proposal[keep:accepted]
+    if out[-1] == eot:
+        out.pop()
+    return out, logprob, stats
+
+
+class _MlxDecoderState:
+    """KV-кэш декодера одной модели mlx_whisper с откатом (для speculative_greedy)."""
+
+    def __init__(self, model, features):
+        import mlx.core as mx
+        self.mx = mx
+        self.decoder = model.decoder
+        self.cross = [
+            (blk.cross_attn.key(features), blk.cross_attn.value(features))
+            for blk in self.decoder.blocks
+        ]
+        self.kv = None
+        self.length = 0
+
+    @staticmethod
+    def _attend(mx, attn, x, k, v, mask):
+        # Как MultiHeadAttention.qkv_attention, но маска (n, длина кэша + n).
+        q = attn.query(x)
+        n_batch, n_ctx, n_state = q.shape
+        scale = (n_state // attn.n_head) ** -0.25
+        q = q.reshape(n_batch, n_ctx, attn.n_head, -1).transpose(0, 2, 1, 3) * scale
+        k = k.reshape(n_batch, k.shape[1], attn.n_head, -1).transpose(0, 2, 3, 1) * scale
+        v = v.reshape(n_batch, v.shape[1], attn.n_head, -1).transpose(0, 2, 1, 3)
+        qk = q @ k
+        if mask is not None:
+            qk = qk + mask
+        w = mx.softmax(qk.astype(mx.float32), axis=-1).astype(q.dtype)
+        out = (w @ v).transpose(0, 2, 1, 3).reshape(n_batch, n_ctx, n_state)
+        return attn.out(out)
+
+    def feed(self, tokens: list) -> np.ndarray:
+        import mlx.nn as nn
+        mx = self.mx
+        dec = self.decoder
+        n, offset = len(tokens), self.length
+        x = dec.token_embedding(mx.array([tokens])) + dec.positional_embedding[offset:offset + n]
+        mask = mx.triu(mx.full((n, offset + n), -mx.inf), k=offset + 1).astype(x.dtype)
+        kv = []
+        for e, blk in enumerate(dec.blocks):
+            h = blk.attn_ln(x)
+            k, v = blk.attn.key(h), blk.attn.value(h)
+            if self.kv is not None:
+                k = mx.concatenate([self.kv[e][0], k], axis=1)
+                v = mx.concatenate([self.kv[e][1], v], axis=1)
+            x = x + self._attend(mx, blk.attn, h, k, v, mask)
+            x = x + self._attend(mx, blk.cross_attn, blk.cross_attn_ln(x), *self.cross[e], None)
+            x = x + blk.mlp2(nn.gelu(blk.mlp1(blk.mlp_ln(x))))
+            kv.append((k, v))
+        self.kv = kv
+        self.length = offset + n
+        logits = dec.token_embedding.as_linear(dec.ln(x))[0].astype(mx.float32)
+        return np.array(logits)
+
+    def rollback(self, n: int):
+        if n < self.length:
+            self.kv = [(k[:, :n], v[:, :n]) for k, v in self.kv]
+            self.length = n
+
+
+class SpeculativeEngine:
+    """
+    Движок-обёртка: вызовы MODEL_REPO на окно до 30 s с temperature 0 и
+    without_timestamps=True декодирует speculative_greedy с черновой моделью,
+    остальное (final-pass с температурами, временные метки, длинные записи,
+    быстрая модель каскада, незнакомые опции) — inner.transcribe.
+    """
+
+    # Опции transcribe(), которые decode() воспроизводит. condition_on_previous_text
+    # влияет только на следующие окна, а окно здесь одно.
+    _OPTIONS = frozenset((
+        "path_or_hf_repo", "language", "initial_prompt", "temperature",
+        "without_timestamps", "condition_on_previous_text", "verbose",
+    ))
+
+    def __init__(self, inner, draft_repo: str, *, k: int = SPECULATIVE_K):
+        self.inner = inner
+        self.draft_repo = draft_repo
+        self.k = k
+        self.draft = None
+        self.load_timings = {}
+        self.stats = {"calls": 0, "tokens": 0, "decode_sec": 0.0, "proposed": 0, "accepted": 0}
+        self._tokenizers = {}
+
+    def load_draft(self, targeted: bool = WARMUP_SHAPES):
+        started = time.perf_counter()
+        if targeted:
+            warmup = ModelWarmup(self.draft_repo)
+            self.draft = warmup.run(install=False)
+            self.load_timings = dict(warmup.timings)
+        else:
+            from mlx_whisper.load_models import load_model
+            import mlx.core as mx
+            self.draft = load_model(self.draft_repo, dtype=mx.float16)
+        self.load_timings["ready_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+
+    def _target(self):
+        inner = self.inner
+        if isinstance(inner, ModelSet):
+            inner = inner.engines[inner.default]
+        if isinstance(inner, _MlxModel) and inner.model is not None:
+            return inner.model
+        import mlx.core as mx
+        holder = importlib.import_module("mlx_whisper.transcribe").ModelHolder
+        return holder.get_model(MODEL_REPO, mx.float16)
+
+    def _tokenizer(self, model, language: str):
+        key = (language, model.num_languages)
+        if key not in self._tokenizers:
+            from mlx_whisper.tokenizer import get_tokenizer
+            self._tokenizers[key] = get_tokenizer(
+                model.is_multilingual, num_languages=model.num_languages,
+                language=language, task="transcribe",
+            )
+        return self._tokenizers[key]
+
+    def _eligible(self, audio, opts: dict) -> bool:
+        temperature = opts.get("temperature", 0.0)
+        greedy = temperature == 0.0 or tuple(np.atleast_1d(temperature)) == (0.0,)
+        return (
+            self.draft is not None and greedy
+            and opts.get("without_timestamps") is True
+            and opts.keys() <= self._OPTIONS
+            and opts.get("path_or_hf_repo", MODEL_REPO) == MODEL_REPO
+            and len(audio) <= 30 * SAMPLE_RATE
+        )
+
+    def transcribe(self, audio, **opts):
+        audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+        if not self._eligible(audio, opts):
+            return self.inner.transcribe(audio, **opts)
+        with _MlxModel._lock:
+            return self.decode(audio, prompt=opts.get("initial_prompt"),
+                               language=opts.get("language") or LANGUAGE)
+
+    def decode(self, audio: np.ndarray, *, prompt=None, language: str = LANGUAGE, k: int = None) -> dict:
+        """Одно окно ≤ 30 s; k=0 — обычный жадный проход той же моделью (эталон)."""
+        import mlx.core as mx
+        from mlx_whisper.audio import N_FRAMES, N_SAMPLES, log_mel_spectrogram, pad_or_trim
+
+        k = self.k if k is None else k
+        started = time.perf_counter()
+        target = self._target()
+        tok = self._tokenizer(target, language)
+
+        def features_for(model):
+            mel = log_mel_spectrogram(audio, n_mels=model.dims.n_mels, padding=N_SAMPLES)
+            content = mel.shape[-2] - N_FRAMES
+            mel = pad_or_trim(mel[:content], N_FRAMES, axis=-2).astype(mx.float16)
+            return model.encoder(mel[None])
+
+        features = features_for(target)
+        draft_state = None
+        if k > 0:
+            d = self.draft.dims
+            shared = (d.n_audio_state, d.n_audio_ctx) == (target.dims.n_audio_state, target.dims.n_audio_ctx)
+            draft_state = _MlxDecoderState(self.draft, features if shared else features_for(self.draft))
+
+        initial = list(tok.sot_sequence_including_notimestamps)
+        if prompt:
+            max_prompt = target.dims.n_text_ctx // 2 - 1
+            initial = [tok.sot_prev] + tok.encode(" " + prompt.strip())[-max_prompt:] + initial
+        sot_index = initial.index(tok.sot)
+        blank = set(tok.encode(" ") + [tok.eot])
+        suppress = np.array(sorted(set(
+            list(tok.non_speech_tokens)
+            + [tok.transcribe, tok.translate, tok.sot, tok.sot_prev, tok.sot_lm, tok.no_speech]
+        )), dtype=np.int64)
+        no_speech = [0.0]
+
+        def pick(row, i):
+            row = row.copy()
+            row[suppress] = -np.inf   # без ApplyTimestampRules, как при without_timestamps
+            if i == 0:
+                row[list(blank)] = -np.inf
+            token = int(np.argmax(row))
+            return token, _log_softmax_at(row, token)
+
+        class _Target(_MlxDecoderState):
+            def feed(self_, tokens):
+                rows = super().feed(tokens)
+                if self_.length == len(tokens):   # prefill: вероятность «тишины» на SOT
+                    no_speech[0] = float(np.exp(_log_softmax_at(rows[sot_index], tok.no_speech)))
+                return rows
+
+        tokens, sum_logprob, stats = speculative_greedy(
+            _Target(target, features), draft_state, initial,
+            k=k, pick=pick, eot=tok.eot,
+        )
+        elapsed = time.perf_counter() - started
+        self.stats["calls"] += 1
+        self.stats["tokens"] += len(tokens)
+        self.stats["decode_sec"] += elapsed
+        self.stats["proposed"] += stats["proposed"]
+        self.stats["accepted"] += stats["accepted"]
+
+        text = tok.decode(tokens).strip()
+        avg_logprob = sum_logprob / (len(tokens) + 1)
+        segment = {
+            "start": 0.0, "end": round(len(audio) / SAMPLE_RATE, 2), "text": text,
+            "tokens": tokens, "avg_logprob": avg_logprob, "no_speech_prob": no_speech[0],
+            "temperature": 0.0, "compression_ratio": 0.0,
+        }
+        # Как transcribe(): тихий сегмент с низкой уверенностью пропускается.
+        if no_speech[0] > 0.6 and avg_logprob <= -1.0:
+            return {"text": "", "segments": [], "language": language}
+        return {"text": text, "segments": [segment], "language": language, "speculative": stats}
+
+
+# ═══════════════════════════════════════════════════
+# Процесс инференса
+#
+# mlx-декодирование, FFT в аудио-коллбэке, слушатель pynput и _tick делят
+# один GIL: под нагрузкой анимация дёргается, а блоки PortAudio опаздывают.
+# InferenceClient держит модель в отдельном процессе (spawn): аудио уходит
+# через кольцевой буфер в SharedMemory, по очереди — только (offset, длина,
+# опции), обратно — текст и метрики качества сегментов. Снаружи это обычный
+# движок с transcribe(audio, **opts), поэтому TranscriptionSession не меняется.
+
+INFERENCE_PROCESS = _env_bool("WHISPERMAC_INFERENCE_PROCESS", True)
+# Один замок на все вызовы движка в этом процессе (см. TranscriptionSession._transcribe_audio).
+_ENGINE_LOCK = threading.Lock()
+INFERENCE_RING_SEC = max(30.0, _env_float("WHISPERMAC_INFERENCE_RING_SEC", 300.0))
+INFERENCE_START_TIMEOUT = max(10.0, _env_float("WHISPERMAC_INFERENCE_START_TIMEOUT", 600.0))
+_SEGMENT_KEYS = (
+    "start", "end", "text", "avg_logprob", "no_speech_prob",
+    "compression_ratio", "temperature",
+)
+
+
+def _worker_python() -> str:
+    """
+    Интерпретатор для spawn. Из .app sys.executable — бинарь лаунчера, а не
+    python: без set_executable дочерний процесс запустил бы второй WhisperMac.
+    """
+    candidates = [os.getenv("WHISPERMAC_WORKER_PYTHON", "")]
+    if os.getenv("VIRTUAL_ENV"):
+        candidates.append(str(Path(os.environ["VIRTUAL_ENV"]) / "bin" / "python"))
+    candidates.append(str(Path(__file__).resolve().parent / "venv" / "bin" / "python"))
+    for path in candidates:
+        if path and os.access(path, os.X_OK):
+            return path
+    return sys.executable
+
+
+def _spawn_context():
+    import multiprocessing
+    ctx = multiprocessing.get_context("spawn")   # Metal/mlx не переживает fork
+    ctx.set_executable(_worker_python())
+    return ctx
+
+
+def _make_engine(spec: str):
+    """'mlx' | 'fake[:rtf]' | 'gil[:rtf[:hold_ms]]' → объект с transcribe()."""
+    name, *params = spec.split(":")
+    if name == "fake":
+        return _bench_module().FakeEngine(*(float(p) for p in params))
+    if name == "gil":
+        return _bench_module().GilBoundEngine(*(float(p) for p in params))
+    engine = _lazy_import("mlx_whisper")
+    if engine is None:
+        raise RuntimeError("mlx_whisper недоступен")
+    return local_engine(engine)
+
+
+def _lite_result(result: dict) -> dict:
+    """Только текст и метрики качества: токены и прочее в очередь не тащим."""
+    return {
+        "text": result.get("text", ""),
+        "language": result.get("language"),
+        "segments": [
+            {k: seg[k] for k in _SEGMENT_KEYS if k in seg}
+            for seg in result.get("segments") or []
+        ],
+    }
+
+
+def _attach_shm(name: str):
+    from multiprocessing import shared_memory
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: spawn-потомок делит resource_tracker с родителем,
+        # повторная регистрация — no-op, а unlink остаётся за родителем.
+        return shared_memory.SharedMemory(name=name)
+
+
+def _inference_worker_main(engine_spec: str, shm_name: str, capacity: int, req_q, res_q):
+    """Точка входа процесса инференса: модель, прогрев, цикл запросов."""
+    global RUNTIME_LOG, SAVE_TRANSCRIPTS, LOG_ECHO
+    # Логи пишет родитель: два процесса, ротирующие один файл, — гонка.
+    RUNTIME_LOG = False
+    SAVE_TRANSCRIPTS = False
+    LOG_ECHO = False
+    shm = _attach_shm(shm_name)
+    ring = np.ndarray((capacity,), dtype=np.float32, buffer=shm.buf)
+    try:
+        engine = _make_engine(engine_spec)
+        warm = warm_local_model(engine) if engine_spec == "mlx" else {}
+        res_q.put(("ready", os.getpid(), warm))
+        while True:
+            item = req_q.get()
+            if item is None:
+                break
+            req_id, offset, length, opts = item
+            if isinstance(length, np.ndarray):   # не влезло в кольцо — пришло копией
+                audio = length
+            elif offset + length <= capacity:
+                audio = ring[offset:offset + length].copy()
+            else:
+                head = capacity - offset
+                audio = np.concatenate([ring[offset:], ring[:length - head]])
+            started = time.perf_counter()
+            try:
+                result = _lite_result(engine.transcribe(audio, **opts))
+                error = None
+            except Exception as ex:  # noqa: BLE001
+                result, error = None, f"{type(ex).__name__}: {ex}"
+            decode_ms = (time.perf_counter() - started) * 1000.0
+            res_q.put((req_id, result, error, decode_ms))
+    finally:
+        del ring
+        shm.close()
+
+
+class _InferenceRequest:
+    __slots__ = ("offset", "length", "done", "result", "error", "crashed", "decode_ms")
+
+    def __init__(self, offset, length):
+        self.offset = offset
+        self.length = length
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.crashed = False
+        self.decode_ms = 0.0
+
+
+class InferenceClient:
+    """
+    Движок-прокси: transcribe() кладёт аудио в кольцо SharedMemory и ждёт ответа
+    процесса инференса. Запросы обрабатываются по порядку; место в кольце
+    освобождается по мере ответов. Упавший процесс перезапускается, а запрос,
+    попавший под падение, повторяется один раз.
+    """
+
+    def __init__(self, engine_spec: str = "mlx", *, ring_sec: float = INFERENCE_RING_SEC):
+        self.engine_spec = engine_spec
+        self.capacity = int(ring_sec * SAMPLE_RATE)
+        self.restarts = 0
+        self.failed = False     # процесс не поднимается — перезапуски прекращены
+        self._boot_failures = 0
+        self.worker_pid = None
+        self.warmup = {}
+        self._ctx = _spawn_context()
+        self._shm = None
+        self._ring = None
+        self._head = 0          # куда пишем следующий запрос
+        self._used = 0          # сэмплов занято запросами в полёте
+        self._pending = {}      # req_id → _InferenceRequest (в порядке отправки)
+        self._next_id = 0
+        self._cv = threading.Condition()
+        self._ready = threading.Event()
+        self._closing = False
+        self._proc = None
+        self._req_q = None
+        self._res_q = None
+
+    # ── Жизненный цикл ─────────────────────────────────────────
+    def start(self):
+        from multiprocessing import shared_memory
+        self._shm = shared_memory.SharedMemory(create=True, size=self.capacity * 4)
+        self._ring = np.ndarray((self.capacity,), dtype=np.float32, buffer=self._shm.buf)
+        self._spawn()
+        threading.Thread(target=self._collector, daemon=True, name="inference-results").start()
+        return self
+
+    def _spawn(self):
+        self._ready.clear()
+        self._req_q = self._ctx.Queue()
+        self._res_q = self._ctx.Queue()
+        self._proc = self._ctx.Process(
+            target=_inference_worker_main,
+            args=(self.engine_spec, self._shm.name, self.capacity, self._req_q, self._res_q),
+            daemon=True,
+            name="whispermac-inference",
+        )
+        self._proc.start()
+
+    def wait_ready(self, timeout: float = INFERENCE_START_TIMEOUT) -> bool:
+        return self._ready.wait(timeout) and not self.failed
+
+    def close(self):
+        self._closing = True
+        with contextlib.suppress(Exception):
+            self._req_q.put(None)
+        if self._proc is not None:
+            self._proc.join(timeout=2.0)
+            if self._proc.is_alive():
+                self._proc.kill()
+        with self._cv:
+            self._fail_pending(crashed=False, error="процесс инференса остановлен")
+        if self._shm is not None:
+            self._ring = None
+            with contextlib.suppress(Exception):
+                self._shm.close()
+                self._shm.unlink()
+            self._shm = None
+
+    # ── Движок ─────────────────────────────────────────────────
+    def transcribe(self, audio, **opts) -> dict:
+        audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+        for attempt in (1, 2):
+            req = self._submit(audio, opts)
+            req.done.wait()
+            if req.crashed and attempt == 1 and not self._closing:
+                log("[inference] процесс упал во время запроса — повторяю после перезапуска")
+                continue
+            if req.error:
+                raise RuntimeError(req.error)
+            return req.result
+        raise RuntimeError("процесс инференса упал повторно")
+
+    def _submit(self, audio: np.ndarray, opts: dict) -> _InferenceRequest:
+        length = len(audio)
+        with self._cv:
+            if self.failed:
+                req = _InferenceRequest(None, 0)
+                req.error = "процесс инференса не запускается"
+                req.done.set()
+                return req
+            if length > self.capacity:
+                # Длиннее кольца (например, final-pass очень длинной записи) — копией.
+                req, payload, offset = _InferenceRequest(None, 0), audio, None
+            else:
+                while self.capacity - self._used < length and not self._closing:
+                    self._cv.wait(0.5)
+                offset = self._head
+                first = min(length, self.capacity - offset)
+                self._ring[offset:offset + first] = audio[:first]
+                if first < length:
+                    self._ring[:length - first] = audio[first:]
+                self._head = (offset + length) % self.capacity
+                self._used += length
+                req, payload = _InferenceRequest(offset, length), length
+            req_id = self._next_id
+            self._next_id += 1
+            self._pending[req_id] = req
+            self._req_q.put((req_id, offset, payload, opts))
+        return req
+
+    def _release(self, req: _InferenceRequest):
+        self._used -= req.length
+        if not self._pending:
+            self._head = 0
+            self._used = 0
+        self._cv.notify_all()
+
+    def _fail_pending(self, *, crashed: bool, error: str):
+        for req in self._pending.values():
+            req.crashed = crashed
+            req.error = error
+            req.done.set()
+        self._pending.clear()
+        self._head = 0
+        self._used = 0
+        self._cv.notify_all()
+
+    def _collector(self):
+        while not self._closing:
+            try:
+                msg = self._res_q.get(timeout=0.5)
+            except queue.Empty:
+                if self._proc is not None and not self._proc.is_alive() and not self._closing:
+                    self._on_crash()
+                continue
+            except (EOFError, OSError):
+                if not self._closing:
+                    self._on_crash()
+                continue
+            if msg[0] == "ready":
+                _, self.worker_pid, self.warmup = msg
+                self._boot_failures = 0
+                log(f"[inference] процесс {self.worker_pid} готов ({self.engine_spec})")
+                self._ready.set()
+                continue
+            req_id, result, error, decode_ms = msg
+            with self._cv:
+                req = self._pending.pop(req_id, None)
+                if req is None:
+                    continue
+                req.result, req.error, req.decode_ms = result, error, decode_ms
+                self._release(req)
+            req.done.set()
+
+    def _on_crash(self):
+        code = self._proc.exitcode if self._proc is not None else None
+        if not self._ready.is_set():
+            self._boot_failures += 1
+        if self._boot_failures >= 3:
+            log(f"[inference] процесс падает при старте (код {code}) — перезапуски остановлены")
+            with self._cv:
+                self.failed = True
+                self._fail_pending(crashed=False, error=f"процесс инференса не запускается (код {code})")
+            self._proc = None
+            self._ready.set()   # разбудить wait_ready(); готовность проверяется по failed
+            return
+        self.restarts += 1
+        log(f"[inference] процесс завершился (код {code}) — перезапуск #{self.restarts}")
+        time.sleep(min(5.0, 0.5 * self._boot_failures))
+        with self._cv:
+            # Сначала новые очереди, потом будим ждущих: повтор уйдёт уже в новый процесс.
+            self._spawn()
+            self._fail_pending(crashed=True, error=f"процесс инференса упал (код {code})")
+
+
+# ═══════════════════════════════════════════════════
+# Захват звука
+#
+# По умолчанию поток PortAudio открывается на каждую диктовку и закрывается
+# после неё: каждая запись платит за открытие устройства, а первый слог после
+# нажатия горячей клавиши часто обрезается. С WHISPERMAC_CAPTURE_PERSISTENT=1
+# поток открыт всё время, в покое блоки идут в небольшое кольцо pre-roll, а
+# старт записи — это «последние N мс из кольца + дальше блоки в сессию».
+# Стоп — просто переключение приёмника, без закрытия потока.
+# Цена: индикатор микрофона macOS горит постоянно, пока приложение запущено.
+
+CAPTURE_PERSISTENT = _env_bool("WHISPERMAC_CAPTURE_PERSISTENT", False)
+CAPTURE_PREROLL_MS = max(0.0, _env_float("WHISPERMAC_CAPTURE_PREROLL_MS", 300.0))
+CAPTURE_BLOCK = 1024
+
+
+class PreRollBuffer:
+    """Кольцо последних сэмплов (float32, 16 кГц), пока запись не идёт."""
+
+    def __init__(self, ms: float = CAPTURE_PREROLL_MS):
+        self.size = int(SAMPLE_RATE * ms / 1000.0)
+        self._buf = np.zeros(max(1, self.size), dtype=np.float32)
+        self._pos = 0
+        self._filled = 0
+
+    def write(self, block: np.ndarray):
+        data = block.reshape(-1)
+        if self.size == 0:
+            return
+        if len(data) >= self.size:
+            self._buf[:] = data[-self.size:]
+            self._pos, self._filled = 0, self.size
+            return
+        end = self._pos + len(data)
+        if end <= self.size:
+            self._buf[self._pos:end] = data
+        else:
+            cut = self.size - self._pos
+            self._buf[self._pos:] = data[:cut]
+            self._buf[:end - self.size] = data[cut:]
+        self._pos = end % self.size
+        self._filled = min(self.size, self._filled + len(data))
+
+    def take(self) -> np.ndarray:
+        """Содержимое в порядке записи; кольцо очищается."""
+        filled, self._filled = self._filled, 0
+        if filled == 0:
+            return np.zeros(0, dtype=np.float32)
+        start = (self._pos - filled) % self.size
+        if start + filled <= self.size:
+            return self._buf[start:start + filled].copy()
+        return np.concatenate([self._buf[start:], self._buf[:self._pos]])
+
+
+# ── Хранение записи ─────────────────────────────────
+# Раньше вся запись жила в RAM списком float32-блоков, а на стопе склеивалась
+# ещё одной полной копией (и третьей — int16 WAV для Groq): час диктовки —
+# сотни МБ и подвисание на склейке. AudioStore держит первые AUDIO_SPILL_SEC
+# в RAM, дальше переливает запись в memory-mapped int16-файл; читатели
+# получают срезы без склейки, а файл удаляется вместе с сессией.
+
+AUDIO_SPILL_SEC = max(0.0, _env_float("WHISPERMAC_AUDIO_SPILL_SEC", 300.0))
+AUDIO_SPILL_DIR = Path(os.getenv("WHISPERMAC_AUDIO_SPILL_DIR") or Path(tempfile.gettempdir()) / "whispermac")
+AUDIO_SPILL_KEEP = _env_bool("WHISPERMAC_AUDIO_SPILL_KEEP", False)
+_SPILL_GROW_SEC = 600.0   # файл растёт кусками по 10 минут
+
+
+class AudioStore:
+    """
+    Аудио одной записи (16 кГц, моно). До spill_sec — float32-блоки в RAM,
+    дальше — int16 в memmap-файле. Не потокобезопасен: синхронизирует владелец.
+    """
+
+    def __init__(self, *, spill_sec: float = AUDIO_SPILL_SEC, spill_dir: Path = AUDIO_SPILL_DIR,
+                 keep: bool = AUDIO_SPILL_KEEP):
+        self.spill_at = int(spill_sec * SAMPLE_RATE) if spill_sec > 0 else None
+        self.spill_dir = Path(spill_dir)
+        self.keep = keep
+        self.peak = 0.0
+        self.path = None
+        self._blocks = []
+        self._offsets = []   # начало каждого блока в сэмплах
+        self._len = 0
+        self._mm = None
+        self._fd = None
+
+    def __len__(self) -> int:
+        return self._len
+
+    @property
+    def spilled(self) -> bool:
+        return self._mm is not None
+
+    def append(self, block: np.ndarray):
+        data = np.asarray(block, dtype=np.float32).reshape(-1)
+        if not len(data):
+            return
+        self.peak = max(self.peak, float(np.max(np.abs(data))))
+        if self._mm is None and self.spill_at is not None and self._len + len(data) > self.spill_at:
+            self._spill()
+        if self._mm is None:
+            self._offsets.append(self._len)
+            self._blocks.append(data)
+        else:
+            self._ensure_capacity(self._len + len(data))
+            self._mm[self._len:self._len + len(data)] = _to_pcm16(data)
+        self._len += len(data)
+
+    def _spill(self):
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix="rec-", suffix=".pcm", dir=str(self.spill_dir))
+        os.fchmod(fd, 0o600)
+        self._fd, self.path = fd, Path(path)
+        self._mm = np.zeros(0, dtype="<i2")
+        self._ensure_capacity(self._len + int(_SPILL_GROW_SEC * SAMPLE_RATE))
+        pos = 0
+        for data in self._blocks:
+            self._mm[pos:pos + len(data)] = _to_pcm16(data)
+            pos += len(data)
+        self._blocks, self._offsets = [], []
+        log(f"[audio] запись длиннее {self.spill_at / SAMPLE_RATE:.0f}s — перелив на диск: {self.path}")
+
+    def _ensure_capacity(self, samples: int):
+        if samples <= len(self._mm):
+            return
+        grow = int(_SPILL_GROW_SEC * SAMPLE_RATE)
+        capacity = max(samples, len(self._mm) + grow)
+        os.ftruncate(self._fd, capacity * 2)
+        # Старые срезы остаются валидными: их отображение живёт, пока на него есть ссылки.
+        self._mm = np.memmap(self.path, dtype="<i2", mode="r+", shape=(capacity,))
+
+    def read(self, start: int = 0, end: int = None) -> np.ndarray:
+        """float32 [start:end] — копия (для декодера)."""
+        start, end = self._clamp(start, end)
+        if self._mm is not None:
+            return self._mm[start:end].astype(np.float32) / 32767.0
+        return self._ram_slice(start, end)
+
+    def pcm16(self, start: int = 0, end: int = None) -> np.ndarray:
+        """int16 [start:end]: после перелива — срез memmap без копирования."""
+        start, end = self._clamp(start, end)
+        if self._mm is not None:
+            return self._mm[start:end]
+        # Поблочно, без промежуточной float32-копии всей записи; с первого нужного
+        # блока, чтобы чтение записи срезами (потоковая отправка) не было квадратичным.
+        import bisect
+        out = np.empty(end - start, dtype="<i2")
+        pos = 0
+        first = max(0, bisect.bisect_right(self._offsets, start) - 1)
+        for i in range(first, len(self._blocks)):
+            off, data = self._offsets[i], self._blocks[i]
+            if off >= end:
+                break
+            lo, hi = max(start, off), min(end, off + len(data))
+            if lo < hi:
+                out[pos:pos + hi - lo] = _to_pcm16(data[lo - off:hi - off])
+                pos += hi - lo
+        return out
+
+    def discard(self, samples: int):
+        """
+        Отпустить RAM-блоки целиком до позиции samples (режим встречи: декодер
+        их уже забрал). Позиции не сдвигаются, len() по-прежнему — вся запись.
+        """
+        if self._mm is not None:
+            return
+        drop = 0
+        while drop < len(self._blocks) and self._offsets[drop] + len(self._blocks[drop]) <= samples:
+            drop += 1
+        if drop:
+            del self._blocks[:drop], self._offsets[:drop]
+
+    def truncate(self, samples: int):
+        samples = max(0, min(int(samples), self._len))
+        if self._mm is None:
+            while self._blocks and self._offsets[-1] >= samples:
+                self._blocks.pop()
+                self._offsets.pop()
+            if self._blocks:
+                cut = samples - self._offsets[-1]
+                self._blocks[-1] = self._blocks[-1][:cut]
+        self._len = samples
+
+    def close(self):
+        self._blocks, self._offsets = [], []
+        if self._mm is None:
+            return
+        mm, self._mm = self._mm, None
+        with contextlib.suppress(Exception):
+            mm.flush()
+        del mm
+        with contextlib.suppress(OSError):
+            os.ftruncate(self._fd, self._len * 2)
+            os.close(self._fd)
+        if self.keep:
+            log(f"[audio] запись сохранена: {self.path} (int16, {SAMPLE_RATE} Гц, {self._len / SAMPLE_RATE:.0f}s)")
+        else:
+            with contextlib.suppress(OSError):
+                self.path.unlink()
+
+    def _clamp(self, start: int, end: int) -> tuple:
+        end = self._len if end is None else max(0, min(int(end), self._len))
+        return max(0, min(int(start), end)), end
+
+    def _ram_slice(self, start: int, end: int) -> np.ndarray:
+        import bisect
+        if start >= end:
+            return np.zeros(0, dtype=np.float32)
+        first = max(0, bisect.bisect_right(self._offsets, start) - 1)
+        out = []
+        for i in range(first, len(self._blocks)):
+            off = self._offsets[i]
+            if off >= end:
+                break
+            data = self._blocks[i]
+            out.append(data[max(0, start - off):min(len(data), end - off)])
+        return out[0].copy() if len(out) == 1 else np.concatenate(out)
+
+
+def _to_pcm16(audio: np.ndarray) -> np.ndarray:
+    return (np.clip(audio, -1.0, 1.0) * 32767.0).astype("<i2")
+
+
+def _sounddevice_stream(callback):
+    sd = _lazy_import("sounddevice")
+    if sd is None:
+        raise RuntimeError("sounddevice/PortAudio недоступен")
+    return sd.InputStream(
+        samplerate=SAMPLE_RATE, channels=1, dtype="float32",
+        blocksize=CAPTURE_BLOCK, latency="low", callback=callback,
+    )
+
+
+class CaptureStream:
+    """
+    Микрофон → сессия. begin(session) начинает отдавать блоки в session.feed(),
+    end() перестаёт. persistent=False — поток открывается в begin() и
+    закрывается в end(); persistent=True — открыт с open() до close(), а
+    begin() подкладывает в сессию pre-roll.
+    on_block(block) — для эквалайзера, только пока идёт запись.
+    """
+
+    def __init__(self, *, persistent: bool = CAPTURE_PERSISTENT,
+                 preroll_ms: float = CAPTURE_PREROLL_MS, on_block=None,
+                 stream_factory=_sounddevice_stream):
+        self.persistent = persistent
+        self.on_block = on_block
+        self.stream_factory = stream_factory
+        self.preroll = PreRollBuffer(preroll_ms) if persistent else None
+        self._stream = None
+        self._sink = None
+        self._lock = threading.Lock()
+        self.begin_at = None
+        self.first_block_ms = None   # begin() → первый живой блок в сессии
+        self.preroll_ms = 0.0        # сколько аудио до begin() подложено из кольца
+
+    @property
+    def is_open(self) -> bool:
+        return self._stream is not None
+
+    def open(self):
+        """Persistent-режим: открыть поток заранее (при старте приложения)."""
+        if self._stream is None:
+            self._stream = self.stream_factory(self._callback)
+            self._stream.start()
+
+    def close(self):
+        with self._lock:
+            self._sink = None
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            stream.stop()
+            stream.close()
+
+    def begin(self, session):
+        self.first_block_ms = None
+        self.begin_at = time.perf_counter()
+        if self.persistent and self._stream is not None:
+            with self._lock:
+                pre = self.preroll.take()
+                if len(pre):
+                    session.feed(pre.reshape(-1, 1))
+                self.preroll_ms = len(pre) * 1000.0 / SAMPLE_RATE
+                self._sink = session
+            return
+        self.preroll_ms = 0.0
+        with self._lock:
+            self._sink = session
+        if self._stream is None:
+            try:
+                self.open()
+            except Exception:
+                with self._lock:
+                    self._sink = None
+                raise
+
+    def end(self):
+        with self._lock:
+            self._sink = None
+        if not self.persistent:
+            self.close()
+
+    def _callback(self, indata, frames, time_info, status):
+        block = indata.copy()
+        with self._lock:
+            sink = self._sink
+            if sink is None:
+                if self.preroll is not None:
+                    self.preroll.write(block)
+                return
+            if self.first_block_ms is None:
+                self.first_block_ms = (time.perf_counter() - self.begin_at) * 1000.0
+            sink.feed(block)
+        if self.on_block is not None:
+            self.on_block(block)
+
+
+# ── Автостоп по тишине ──────────────────────────────
+# В режиме клика запись идёт, пока не кликнут ещё раз: хвост тишины до клика
+# тоже пишется и отправляется, а время реакции пользователя входит в
+# stop→paste. С WHISPERMAC_ENDPOINT=1 запись, начатая кликом, сама
+# завершается после ENDPOINT_SILENCE_MS тишины (по тому же сглаженному RMS,
+# что и эквалайзер); тишина отрезается, остаётся ENDPOINT_KEEP_MS.
+
+ENDPOINT = _env_bool("WHISPERMAC_ENDPOINT", False)
+ENDPOINT_SILENCE_MS = max(200.0, _env_float("WHISPERMAC_ENDPOINT_SILENCE_MS", 900.0))
+ENDPOINT_MIN_SPEECH_MS = max(0.0, _env_float("WHISPERMAC_ENDPOINT_MIN_SPEECH_MS", 300.0))
+ENDPOINT_KEEP_MS = max(0.0, _env_float("WHISPERMAC_ENDPOINT_KEEP_MS", 200.0))
+ENDPOINT_RMS = max(1e-5, _env_float("WHISPERMAC_ENDPOINT_RMS", EQ_RMS_THRESHOLD))
+
+
+class Endpointer:
+    """
+    Конец фразы по сглаженному RMS с hangover: feed(block) вернёт True один раз,
+    когда после хотя бы min_speech_ms речи набралось silence_ms тишины подряд.
+    """
+
+    def __init__(self, *, silence_ms: float = ENDPOINT_SILENCE_MS,
+                 min_speech_ms: float = ENDPOINT_MIN_SPEECH_MS,
+                 keep_ms: float = ENDPOINT_KEEP_MS, threshold: float = ENDPOINT_RMS):
+        self.silence_need = int(SAMPLE_RATE * silence_ms / 1000.0)
+        self.speech_need = int(SAMPLE_RATE * min_speech_ms / 1000.0)
+        self.keep = int(SAMPLE_RATE * keep_ms / 1000.0)
+        self.threshold = threshold
+        self.rms = 0.0
+        self.speech = 0      # сэмплов речи всего
+        self.silence = 0     # сэмплов тишины подряд в конце
+        self.total = 0
+        self.fired_at = None  # позиция (в сэмплах), где сработал
+
+    def feed(self, block: np.ndarray) -> bool:
+        frame = block.reshape(-1)
+        if not len(frame):
+            return False
+        rms = float(np.sqrt(np.mean(frame * frame)))
+        self.rms = (1.0 - EQ_RMS_ALPHA) * self.rms + EQ_RMS_ALPHA * rms
+        self.total += len(frame)
+        if self.rms > self.threshold:
+            self.speech += len(frame)
+            self.silence = 0
+        else:
+            self.silence += len(frame)
+        if (self.fired_at is None and self.speech >= self.speech_need
+                and self.silence >= self.silence_need):
+            self.fired_at = self.total
+            return True
+        return False
+
+    @property
+    def trim_samples(self) -> int:
+        """Сколько хвостовой тишины отрезать (кроме keep_ms после речи)."""
+        return max(0, self.silence - self.keep)
+
+
+# ── Режим встречи ───────────────────────────────────
+# Диктовка заканчивается вставкой: весь текст копится до стопа, запись
+# целиком лежит в AudioStore. Встреча идёт часами и не вставляется: каждый
+# декодированный чанк сразу дописывается в файл стенограммы с отметкой
+# времени, забранное декодером аудио отпускается, для prompt остаются
+# последние MEETING_CONTEXT_CHUNKS чанков. Если декодер отстаёт больше чем
+# на MEETING_MAX_LAG_SEC, старое аудио пропускается с пометкой в файле —
+# память и отставание не растут с длиной встречи.
+
+MEETING = _env_bool("WHISPERMAC_MEETING", False)
+MEETING_DIR = Path(os.getenv("WHISPERMAC_MEETING_DIR") or Path.home() / "whisper_meetings")
+MEETING_CONTEXT_CHUNKS = int(max(1, _env_float("WHISPERMAC_MEETING_CONTEXT_CHUNKS", 3)))
+MEETING_MAX_LAG_SEC = max(2 * CHUNK_SEC, _env_float("WHISPERMAC_MEETING_MAX_LAG_SEC", 120.0))
+
+
+def _clock(sec: float) -> str:
+    sec = int(sec)
+    return f"{sec // 3600:02d}:{sec // 60 % 60:02d}:{sec % 60:02d}"
+
+
+class MeetingTranscript:
+    """
+    Файл стенограммы одной встречи. Открывается при первой записи;
+    append() пишет строку «[чч:мм:сс–чч:мм:сс] текст» и сразу сбрасывает её
+    на диск (вызывается из воркера сессии, не из UI).
+    """
+
+    def __init__(self, path: Path = None, *, directory: Path = MEETING_DIR):
+        self.started = datetime.now()
+        self.path = Path(path) if path else Path(directory) / f"meeting-{self.started:%Y%m%d-%H%M%S}.txt"
+        self.segments = 0
+        self.chars = 0
+        self._f = None
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = open(self.path, "a", encoding="utf-8")
+        self._f.write(f"# Встреча {self.started:%Y-%m-%d %H:%M:%S}\n")
+
+    def append(self, start_sec: float, end_sec: float, text: str):
+        self._line(start_sec, end_sec, text)
+        self.segments += 1
+        self.chars += len(text)
+
+    def gap(self, start_sec: float, end_sec: float):
+        """Пометка о пропущенном аудио (декодер не успевал)."""
+        self._line(start_sec, end_sec, f"… пропущено {end_sec - start_sec:.0f}s (декодер отстал) …")
+
+    def _line(self, start_sec: float, end_sec: float, text: str):
+        if self._f is None:
+            self._open()
+        self._f.write(f"[{_clock(start_sec)}–{_clock(end_sec)}] {text}\n")
+        self._f.flush()
+
+    def close(self):
+        if self._f is not None:
+            with contextlib.suppress(OSError):
+                self._f.close()
+            self._f = None
+
+
+# ═══════════════════════════════════════════════════
+# Ядро транскрипции без GUI
+
+class TranscriptionSession:
+    """
+    Одна диктовка без Tk и pyobjc: принимает аудио-блоки через feed(),
+    в фоновом потоке декодирует (streaming локально или одним запросом в Groq)
+    и отдаёт результат через колбэки.
+
+    on_result(text, trace) — итог (text может быть пустым), из потока воркера.
+    on_perf(line)          — строка для ~/whisper_perf.log.
+    prompt                 — базовый prompt вместо HOTWORDS_PROMPT.
+    meeting                — MeetingTranscript: режим встречи (только локально,
+                             текст уходит в файл по мере декодирования, on_result("")).
+    fast_repo              — быстрая модель каскада для чанков (None — CASCADE_FAST_REPO,
+                             "" — одна модель MODEL_REPO на всё).
+    """
+
+    def __init__(self, engine=None, *, use_groq=False, trace=None,
+                 on_result=None, on_perf=None, prompt=None,
+                 meeting=None, fast_repo=None):
+        # Движок декодирования: всё, у чего есть transcribe(audio, **opts)
+        # в формате mlx_whisper (для бенчмарка — whisper_bench.FakeEngine).
+        # None — mlx_whisper, импортируется при первом локальном декодировании.
+        self.engine     = engine
+        self.meeting    = meeting
+        self.fast_repo  = _cascade_repo(CASCADE_FAST_REPO if fast_repo is None else fast_repo)
+        self.use_groq   = bool(use_groq) and meeting is None
+        self.trace      = trace or UtteranceTrace("groq" if self.use_groq else "local")
+        self.on_result  = on_result
+        self.on_perf    = on_perf
+        self.prompt     = HOTWORDS_PROMPT if prompt is None else prompt
+        # Встреча держит в RAM только ещё не забранное декодером аудио.
+        self.audio      = AudioStore(spill_sec=0.0) if meeting is not None else AudioStore()
+        self._chunks_lock = threading.Lock()
+        self._taken     = 0      # сэмплов, уже забранных воркером
+        self._tail_trim = 0      # сколько из забранного отрезать с конца (trim_tail)
+        self._sealed    = False  # после stop() feed() ничего не добавляет
+        self.decoded_sec = 0.0   # сколько аудио уже декодировано (и записано во встречу)
+        self.recording  = False
+        self.started_at = None
+        self.stopped_at = None
+        self.text       = None
+        self.finished_at = None
+        self.done       = threading.Event()
+        self._thread    = None
+        self._parts     = []     # тексты чанков streaming-воркера (на случай ошибки)
+
+    # ── Жизненный цикл ─────────────────────────────────────────
+    def start(self):
+        """Начать запись: дальше блоки идут через feed(), воркер уже крутится."""
+        self.started_at = time.perf_counter()
+        self.recording = True
+        self._thread = threading.Thread(target=self._run_worker, args=(self.trace,), daemon=True)
+        self._thread.start()
+
+    def feed(self, block: np.ndarray):
+        """Добавить блок аудио (float32, 16 кГц). Вызывающий отдаёт копию."""
+        with self._chunks_lock:
+            if not self._sealed:
+                self.audio.append(block)
+
+    def stop(self):
+        """Конец записи: воркер доберёт остаток и вызовет on_result."""
+        with self._chunks_lock:
+            # Блок, опоздавший из аудио-коллбэка, в запись уже не попадёт: Groq
+            # читает store без замка, длина в заголовке WAV должна совпасть с данными.
+            self._sealed = True
+        self.stopped_at = time.perf_counter()
+        self.recording = False
+        if self.started_at is not None:
+            self.trace.add("capture", self.started_at, self.stopped_at)
+
+    def trim_tail(self, samples: int) -> int:
+        """Перед stop(): отрезать хвост записи (тишина после автостопа). Вернёт сколько."""
+        with self._chunks_lock:
+            total = len(self.audio)
+            samples = max(0, min(int(samples), total))
+            self.audio.truncate(total - samples)
+            # Что воркер уже забрал в pending, он отрежет сам после stop().
+            self._tail_trim = max(0, samples - (total - self._taken))
+        self.trace.meta["trimmed_ms"] = round(samples * 1000.0 / SAMPLE_RATE, 1)
+        return samples
+
+    def wait(self, timeout=None) -> str:
+        if not self.done.wait(timeout):
+            return None
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+        return self.text
+
+    def run_offline(self, audio: np.ndarray) -> str:
+        """Файловый режим: вся запись уже есть, воркер работает в текущем потоке."""
+        self.feed(np.asarray(audio, dtype=np.float32).reshape(-1))
+        self.started_at = self.stopped_at = time.perf_counter()
+        self.recording = False
+        self._run_worker(self.trace)
+        return self.text
+
+    def _run_worker(self, trace):
+        """
+        Воркер с гарантией итога: если декодирование упало (движок, процесс
+        инференса), сессия всё равно завершается через _finish с текстом уже
+        декодированных чанков — иначе вставка следующих диктовок ждала бы её вечно.
+        """
+        worker = self._groq_worker if self.use_groq else self._streaming_worker
+        try:
+            worker(trace)
+        except Exception as ex:  # noqa: BLE001
+            log(f"[session] ошибка декодирования: {type(ex).__name__}: {ex}")
+            trace.meta["error"] = f"{type(ex).__name__}: {ex}"
+            # Запись ещё может идти: итог — после стопа, как у обычной сессии.
+            while self.recording:
+                time.sleep(WORKER_POLL_SEC)
+            if not self.done.is_set():
+                partial = "" if self.meeting is not None else self._postprocess(_join_chunks(self._parts))
+                try:
+                    self._finish(partial, trace)
+                finally:
+                    self.done.set()
+
+    def _finish(self, full: str, trace):
+        self.text = full
+        self.finished_at = time.perf_counter()
+        trace.meta["chars"] = len(full)
+        if self.meeting is not None:
+            self.meeting.close()
+            trace.meta["meeting"] = str(self.meeting.path)
+            trace.meta["meeting_segments"] = self.meeting.segments
+        with self._chunks_lock:
+            if self.audio.spilled:
+                trace.meta["spilled"] = True
+            # Аудио больше не нужно: память освобождается, файл перелива удаляется.
+            self.audio.close()
+        try:
+            if self.on_result is not None:
+                self.on_result(full, trace)
+        finally:
+            self.done.set()
+
+    def _emit_perf(self, line: str):
+        if self.on_perf is not None:
+            self.on_perf(line)
+
+    # ── Декодирование ──────────────────────────────────────────
+    def _transcribe_audio(
+        self,
+        audio,
+        *,
+        prompt=None,
+        final=False,
+        condition_on_previous_text=True,
+        temperature=None,
+        repo=None,
+        without_timestamps=False,
+    ):
+        opts = dict(
+            path_or_hf_repo=repo or MODEL_REPO,
+            language=LANGUAGE,
+            initial_prompt=prompt,
+            condition_on_previous_text=condition_on_previous_text,
+        )
+        # Beam search в mlx_whisper пока не реализован.
+        opts["temperature"] = (
+            temperature if temperature is not None
+            else (FINAL_TEMPERATURES if final else 0.0)
+        )
+        if without_timestamps:
+            opts["without_timestamps"] = True
+        engine = self.engine or _lazy_import("mlx_whisper")
+        if engine is None:
+            raise RuntimeError("локальный движок mlx_whisper недоступен")
+        if isinstance(engine, InferenceClient):
+            return engine.transcribe(audio, **opts)   # процесс инференса сам ставит запросы в очередь
+        # Движок в этом процессе (INFERENCE_PROCESS=0, фоллбэк Groq → mlx_whisper,
+        # serve) не реентерабелен: пересекающиеся сессии декодируют по очереди.
+        with _ENGINE_LOCK:
+            return engine.transcribe(audio, **opts)
+
+    def _take_new_audio(self, pos: int) -> tuple:
+        """Аудио с позиции pos (в сэмплах) до конца записи: (новая позиция, audio | None)."""
+        with self._chunks_lock:
+            total = len(self.audio)
+            if pos >= total:
+                return pos, None
+            new_audio = self.audio.read(pos, total)
+            self._taken = total
+            if self.meeting is not None:
+                self.audio.discard(total)
+        return total, new_audio
+
+    @property
+    def lag_sec(self) -> float:
+        """Отставание декодера от записи, секунд аудио."""
+        return max(0.0, len(self.audio) / SAMPLE_RATE - self.decoded_sec)
+
+    def _commit(self, text: str, seconds: float) -> float:
+        """Учесть декодированный кусок; во встрече — сразу строка в стенограмму."""
+        start = self.decoded_sec
+        self.decoded_sec += seconds
+        if text and self.meeting is not None:
+            self.meeting.append(start, self.decoded_sec, _clean_chunk(text) or text)
+        return start
+
+    def _decode_piece(self, audio: np.ndarray, parts: list, label: str,
+                      trace=None, repo=None) -> tuple:
+        prompt = _prompt_from_parts(parts, self.prompt)
+        started = time.perf_counter()
+        # С черновиком чанк — одно окно одним сегментом без временных меток:
+        # только такие вызовы SpeculativeEngine декодирует сам (см. _eligible).
+        result = self._transcribe_audio(audio, prompt=prompt, final=False, repo=repo,
+                                        without_timestamps=bool(_speculative_repo()))
+        done = time.perf_counter()
+        elapsed = done - started
+        text = result.get("text", "").strip()
+        avg_logprob, avg_no_speech = _segment_quality(result)
+        if trace is not None:
+            extra = {"model": "fast"} if repo else {}
+            trace.add("decode", started, done, label=label,
+                      audio_sec=round(len(audio) / SAMPLE_RATE, 2), **extra)
+        if _likely_silence_hallucination(text, avg_no_speech):
+            log(
+                f"[{label}] пропуск (тишина): no_speech={avg_no_speech:.2f}, "
+                f"text='{text[:24]}'"
+            )
+            return "", elapsed, avg_logprob, avg_no_speech
+        if text:
+            log(f"[{label}] {text}")
+        return text, elapsed, avg_logprob, avg_no_speech
+
+    def _repair_piece(self, segment: np.ndarray, context: list, text: str,
+                      trace=None) -> tuple:
+        """
+        Каскад: неуверенный чанк быстрой модели заново декодирует MODEL_REPO.
+        Вернёт (текст, avg_logprob, секунд декодирования); если большая модель
+        ничего внятного не дала — остаётся текст быстрой.
+        """
+        new_text, elapsed, avg_logprob, _ = self._decode_piece(segment, context, "repair", trace)
+        if new_text and not _is_repetition_loop(new_text):
+            return new_text, avg_logprob, elapsed
+        return text, CASCADE_REPAIR_LOGPROB, elapsed
+
+    # ── Groq воркер (основной путь) ─────────────────────────────
+    def _groq_worker(self, trace):
+        """
+        Быстрый облачный путь: во время записи только копим аудио,
+        на стопе одним запросом отправляем всё в Groq и мгновенно вставляем.
+        При ошибке/пустом ответе — фоллбэк на локальную модель.
+        """
+        while self.recording:
+            time.sleep(WORKER_POLL_SEC)
+
+        # Запись остановлена и запечатана (stop): store больше не растёт, читаем без склейки копий.
+        audio_sec = len(self.audio) / SAMPLE_RATE
+        amp = self.audio.peak
+        if audio_sec < MIN_DURATION or amp <= 0.001:
+            log("[groq] слишком короткая/тихая запись — пропуск")
+            trace.meta["skipped"] = "short"
+            self._finish("", trace)
+            return
+        trace.meta["audio_sec"] = round(audio_sec, 2)
+
+        full = groq_transcribe(self.audio, prompt=self.prompt, trace=trace)
+
+        if not full:
+            log("[groq] пустой результат — фоллбэк на локальную модель")
+            trace.engine = "groq+local"
+            full = self._local_full_transcribe(self.audio.read(), trace)
+
+        with trace.span("post"):
+            full = self._postprocess(full)
+
+        log(f"→ {full}")
+        self._finish(full, trace)
+
+    def _local_full_transcribe(self, all_audio: np.ndarray, trace=None) -> str:
+        """Локальный фоллбэк: единый проход mlx-whisper по всей записи."""
+        if not len(all_audio):
+            return ""
+        trace = trace or UtteranceTrace("local")
+        try:
+            with trace.span("final_pass", audio_sec=round(len(all_audio) / SAMPLE_RATE, 2)):
+                res = self._transcribe_audio(
+                    all_audio,
+                    prompt=self.prompt,
+                    final=True,
+                    condition_on_previous_text=False,
+                )
+            text = res.get("text", "").strip()
+            if text and _is_repetition_loop(text):
+                with trace.span("final_safe"):
+                    safe = self._transcribe_audio(
+                        all_audio, prompt=None, final=False,
+                        condition_on_previous_text=False, temperature=0.0,
+                    )
+                safe_text = safe.get("text", "").strip()
+                if safe_text and not _is_repetition_loop(safe_text):
+                    text = safe_text
+            return text
+        except Exception as ex:  # noqa: BLE001
+            log(f"[local-fallback] ошибка: {ex}")
+            return ""
+
+    # ── Streaming воркер ────────────────────────────────────────
+    def _streaming_worker(self, trace):
+        """
+        Эффективный воркер для длинных записей.
+        Хранит pending-буфер, потребляет только НОВЫЕ чанки —
+        не конкатенирует весь массив каждую итерацию.
+        """
+        CHUNK      = int(CHUNK_SEC * SAMPLE_RATE)
+        meeting    = self.meeting is not None
+        # Встреча: контекст prompt — последние чанки, текст уже в файле.
+        parts      = collections.deque(maxlen=MEETING_CONTEXT_CHUNKS) if meeting else []
+        self._parts = parts
+        max_lag    = int(MEETING_MAX_LAG_SEC * SAMPLE_RATE)
+        max_lag_sec = 0.0
+        pending    = np.array([], dtype=np.float32)   # необработанный буфер
+        audio_pos  = 0                                 # сколько сэмплов уже взяли
+        decode_time_sec = 0.0
+        processed_audio_sec = 0.0
+        low_conf_chunks = 0
+        decoded_chunks = 0
+        fast       = self.fast_repo or None
+        # Каскад: (индекс в parts, аудио чанка, avg_logprob быстрой модели) —
+        # перекодируются большой моделью, когда декодеру нечего делать, и на стопе.
+        repairs    = []
+        repaired   = 0
+
+        def take(segment, phase, piece_trace):
+            """Декодировать кусок (в каскаде — быстрой моделью) и учесть его."""
+            nonlocal decode_time_sec, processed_audio_sec, decoded_chunks, low_conf_chunks
+            nonlocal repaired, max_lag_sec
+            text, elapsed, avg_logprob, _ = self._decode_piece(
+                segment, parts, phase, piece_trace, repo=fast
+            )
+            if meeting and fast and text and avg_logprob <= CASCADE_REPAIR_LOGPROB:
+                # Встреча: строка уходит в файл сразу — ремонт до записи.
+                text, avg_logprob, spent = self._repair_piece(segment, list(parts), text, piece_trace)
+                elapsed += spent
+                repaired += 1
+            if phase == "chunk":
+                max_lag_sec = max(max_lag_sec, self.lag_sec)
+            self._commit(text, len(segment) / SAMPLE_RATE)
+            decode_time_sec += elapsed
+            processed_audio_sec += len(segment) / SAMPLE_RATE
+            decoded_chunks += 1
+            if avg_logprob <= LOW_CONF_LOGPROB:
+                low_conf_chunks += 1
+            if text:
+                parts.append(text)
+                if not meeting and fast and avg_logprob <= CASCADE_REPAIR_LOGPROB:
+                    repairs.append((len(parts) - 1, segment, avg_logprob))
+
+        def repair(idx, segment, fast_logprob):
+            """Каскад: перекодировать неуверенный кусок parts[idx] большой моделью."""
+            nonlocal decode_time_sec, low_conf_chunks, repaired
+            parts[idx], avg_logprob, elapsed = self._repair_piece(
+                segment, parts[:idx], parts[idx], trace
+            )
+            decode_time_sec += elapsed
+            repaired += 1
+            if fast_logprob <= LOW_CONF_LOGPROB < avg_logprob:
+                low_conf_chunks -= 1
+
+        while self.recording:
+            time.sleep(WORKER_POLL_SEC)
+
+            # Берём только новые чанки с момента последней итерации
+            audio_pos, new_audio = self._take_new_audio(audio_pos)
+            if new_audio is None:
+                continue
+            pending   = np.concatenate([pending, new_audio]) if len(pending) else new_audio
+            if meeting and len(pending) > max_lag:
+                # Декодер не успевает: старое аудио пропускаем, а не копим.
+                skip = len(pending) - max_lag + CHUNK
+                start = self._commit("", skip / SAMPLE_RATE)
+                self.meeting.gap(start, self.decoded_sec)
+                log(f"[meeting] декодер отстал на {len(pending) / SAMPLE_RATE:.0f}s — пропуск {skip / SAMPLE_RATE:.0f}s")
+                pending = pending[skip:]
+
+            # Обрабатываем все полные чанки из буфера
+            # (если модель отстала — догоняем в цикле)
+            while len(pending) >= CHUNK:
+                segment = pending[:CHUNK]
+                pending = pending[CHUNK:]
+                take(segment, "chunk", None if meeting else trace)
+
+            if repairs and len(pending) < CHUNK:
+                # Новых чанков нет — один ремонт за итерацию, чтобы не отстать от записи.
+                repair(*repairs.pop(0))
+
+        # Запись остановлена — добираем остаток
+        audio_pos, new_audio = self._take_new_audio(audio_pos)
+        if new_audio is not None:
+            pending   = np.concatenate([pending, new_audio]) if len(pending) else new_audio
+        if self._tail_trim and len(pending):
+            pending = pending[:len(pending) - min(len(pending), self._tail_trim)]
+
+        # Если во время записи модель отстала, догоняем backlog кусками.
+        while len(pending) >= CHUNK:
+            segment = pending[:CHUNK]
+            pending = pending[CHUNK:]
+            take(segment, "flush", None if meeting else trace)
+
+        amp = float(np.max(np.abs(pending))) if len(pending) else 0
+        if len(pending) / SAMPLE_RATE >= MIN_DURATION and amp > 0.001:
+            take(pending, "tail", trace)
+
+        if repairs:
+            audio_sec = len(self.audio) / SAMPLE_RATE
+            if (FINAL_PASS_MIN_SEC <= audio_sec <= FINAL_PASS_MAX_SEC
+                    and decoded_chunks and low_conf_chunks / decoded_chunks >= 0.35):
+                # Всё равно будет final-pass большой моделью по всей записи.
+                log(f"[cascade] {len(repairs)} ремонт(ов) не нужны: будет final-pass")
+                repairs = []
+            for item in repairs:
+                repair(*item)
+        if fast:
+            trace.meta["cascade"] = fast
+            trace.meta["repaired"] = repaired
+
+        chunk_full = "" if meeting else _join_chunks(parts)
+        full = chunk_full
+        if meeting:
+            trace.meta["max_lag_sec"] = round(max_lag_sec, 1)
+
+        # Финальный quality-pass по всей записи: выше точность на длинных фразах.
+        with self._chunks_lock:
+            total = len(self.audio)
+        if total and meeting:
+            trace.meta["audio_sec"] = round(total / SAMPLE_RATE, 2)
+            log(f"[meeting] {self.meeting.segments} фраз, {total / SAMPLE_RATE / 60:.1f} мин → {self.meeting.path}")
+        elif total:
+            audio_sec = total / SAMPLE_RATE
+            low_conf_ratio = (
+                (low_conf_chunks / decoded_chunks)
+                if decoded_chunks else 0.0
+            )
+            need_final_pass = (
+                FINAL_PASS_MIN_SEC <= audio_sec <= FINAL_PASS_MAX_SEC
+                and (
+                    _is_repetition_loop(chunk_full)
+                    or not chunk_full
+                    or low_conf_ratio >= 0.35
+                )
+            )
+            trace.meta["audio_sec"] = round(audio_sec, 2)
+            trace.meta["final_pass"] = bool(need_final_pass and audio_sec >= MIN_DURATION)
+            if need_final_pass and audio_sec >= MIN_DURATION:
+                # Полная копия только когда она нужна (запись ≤ FINAL_PASS_MAX_SEC).
+                with self._chunks_lock:
+                    all_audio = self.audio.read()
+                try:
+                    with trace.span("final_pass", audio_sec=round(audio_sec, 2)):
+                        final_res = self._transcribe_audio(
+                            all_audio,
+                            prompt=self.prompt,
+                            final=True,
+                            # Этот режим в Whisper меньше зацикливается на повторах.
+                            condition_on_previous_text=False,
+                        )
+                    final_text = final_res.get("text", "").strip()
+                    if final_text:
+                        if _is_repetition_loop(final_text):
+                            log("[final] обнаружен loop-повтор, пробую safe-pass")
+                            with trace.span("final_safe"):
+                                safe_res = self._transcribe_audio(
+                                    all_audio,
+                                    prompt=None,
+                                    final=False,
+                                    condition_on_previous_text=False,
+                                    temperature=0.0,
+                                )
+                            safe_text = safe_res.get("text", "").strip()
+                            if safe_text and not _is_repetition_loop(safe_text):
+                                log(f"[final-safe] {safe_text}")
+                                full = safe_text
+                            else:
+                                log("[final] loop остался, fallback на chunk-текст")
+                                full = chunk_full
+                        else:
+                            log(f"[final] {final_text}")
+                            full = final_text
+                except Exception as ex:
+                    log(f"[final] fallback на чанки: {ex}")
+            elif audio_sec > FINAL_PASS_MAX_SEC:
+                skip_line = (
+                    f"[final] пропуск полного pass: запись {audio_sec:.1f}s > "
+                    f"{FINAL_PASS_MAX_SEC:.0f}s"
+                )
+                log(skip_line)
+                self._emit_perf(skip_line)
+
+        with trace.span("post"):
+            full = self._postprocess(full)
+
+        record_wall_sec = 0.0
+        if self.started_at is not None:
+            record_wall_sec = max(0.0, time.perf_counter() - self.started_at)
+        if processed_audio_sec > 0:
+            rtf = decode_time_sec / processed_audio_sec
+            perf_line = (
+                f"[perf] обработано {processed_audio_sec:.1f}s аудио за "
+                f"{decode_time_sec:.2f}s (RTF={rtf:.2f}x), запись шла {record_wall_sec:.1f}s"
+            )
+            log(perf_line)
+            self._emit_perf(perf_line)
+            trace.meta["rtf"] = round(rtf, 3)
+        trace.meta["chunks"] = decoded_chunks
+
+        log(f"→ {full}")
+        self._finish(full, trace)
+
+    def _postprocess(self, full: str) -> str:
+        if full and _is_repetition_loop(full):
+            collapsed = _collapse_repetition_loop(full).strip()
+            if collapsed and collapsed != full:
+                log("[post] схлопнул повторяющийся loop-текст")
+                full = collapsed
+        return full
+
+
+def pill_points(x1, y1, x2, y2, r):
+    return [
+        x1+r, y1,   x2-r, y1,
+        x2,   y1,   x2,   y1+r,
+        x2,   y2-r, x2,   y2,
+        x2-r, y2,   x1+r, y2,
+        x1,   y2,   x1,   y2-r,
+        x1,   y1+r, x1,   y1,
+    ]
+
+
+class BarRenderer:
+    """
+    Полоски эквалайзера: считает высоты для режима и трогает на canvas только
+    изменившиеся (damage tracking): полоска, сдвинувшаяся меньше чем на
+    BAR_DAMAGE_PX от нарисованной высоты, не перерисовывается.
+    render() возвращает число перерисованных полосок.
+    """
+
+    def __init__(self, canvas, bars: list, *, track_damage: bool = True,
+                 tolerance: float = BAR_DAMAGE_PX):
+        self.cv = canvas
+        self.bars = bars             # [(id прямоугольника, x)]
+        self.track_damage = track_damage
+        self.tolerance = tolerance if track_damage else -1.0
+        self.frame = 0
+        self._heights = [None] * len(bars)   # высота на экране
+        self._fills = [None] * len(bars)     # цвет на экране
+        self._smooth = [0.0] * len(bars)
+
+    def reset_levels(self):
+        self._smooth = [0.0] * len(self.bars)
+
+    def _recording_heights(self, levels, t: float) -> list:
+        # Attack/decay smoothing для ощущения VU-метра. Семь полосок — дешевле
+        # посчитать во float'ах, чем собирать numpy-массивы на каждый кадр.
+        target = [min(1.0, max(0.0, float(v))) ** EQ_VISUAL_GAMMA for v in levels]
+        energy = sum(target) / len(target) if target else 0.0
+        heights = []
+        for i, level in enumerate(target):
+            s = self._smooth[i]
+            s = s + (level - s) * EQ_ATTACK if level > s else s * (1.0 - EQ_DECAY)
+            self._smooth[i] = s
+            wobble = 0.0
+            if energy > 0.03:
+                wobble = (
+                    0.5 + 0.5 * math.sin(t * (5.2 + i * 0.15) + i * 0.9)
+                ) * EQ_WOBBLE_MAX * energy
+            heights.append(BAR_MIN + min(1.0, s + wobble) * BAR_MAX)
+        return heights
+
+    def render(self, mode: str, levels=None) -> int:
+        """mode: "recording" (нужны levels), "processing" или "idle"."""
+        self.frame += 1
+        t = self.frame * 0.12
+        if mode == "recording":
+            heights, fill = self._recording_heights(levels, t), C_REC
+        elif mode == "processing":
+            heights = [BAR_MIN + abs(math.sin(t * 4.0 + i * 0.5)) * BAR_MAX * 0.55
+                       for i in range(len(self.bars))]
+            fill = C_PROC
+        else:
+            heights, fill = [BAR_MIN] * len(self.bars), C_IDLE
+
+        cy = H // 2
+        changed = 0
+        tol, drawn_h, drawn_fill = self.tolerance, self._heights, self._fills
+        for i, (b, bx) in enumerate(self.bars):
+            h = heights[i]
+            old = drawn_h[i]
+            moved = old is None or abs(h - old) > tol
+            recolor = drawn_fill[i] != fill or tol < 0
+            if not (moved or recolor):
+                continue
+            if moved:
+                self.cv.coords(b, bx, cy - h, bx + BAR_W, cy + h)
+                drawn_h[i] = h
+            if recolor:
+                self.cv.itemconfig(b, fill=fill)
+                drawn_fill[i] = fill
+            changed += 1
+        return changed
+
+
+class AnimationLoop:
+    """
+    Кадры через after(interval): frame() возвращает True, пока есть что анимировать.
+    На False цикл засыпает до wake() (только из UI-потока). События из других
+    потоков будят его через UIEventBus.attach. Запасной путь, если Tk не умеет
+    file handler: poll — уснувший цикл проверяет его через poll_ms, интервал
+    удваивается на каждой пустой проверке до poll_max_ms (кадр не рисуется).
+    """
+
+    def __init__(self, after, frame, interval_ms: int = 33, *, suspend: bool = True,
+                 poll=None, poll_ms: int = 50, poll_max_ms: int = 1000):
+        self.after = after
+        self.frame = frame
+        self.interval_ms = interval_ms
+        self.suspend = suspend
+        self.poll = poll
+        self.poll_ms = poll_ms
+        self.poll_max_ms = max(poll_ms, poll_max_ms)
+        self.wakeups = 0
+        self.polls = 0
+        self._job = None
+        self._poll_job = None
+        self._poll_delay = poll_ms
+        self._running = False
+
+    @property
+    def sleeping(self) -> bool:
+        return self._job is None and not self._running
+
+    def wake(self):
+        if self.sleeping:
+            self._job = self.after(0, self._run)
+
+    def _run(self):
+        self._job = None
+        self._running = True
+        self.wakeups += 1
+        try:
+            more = self.frame()
+        finally:
+            self._running = False
+        if more or not self.suspend:
+            self._job = self.after(self.interval_ms, self._run)
+        elif self.poll is not None and self._poll_job is None:
+            self._poll_delay = self.poll_ms
+            self._poll_job = self.after(self._poll_delay, self._idle_poll)
+
+    def _idle_poll(self):
+        self._poll_job = None
+        if not self.sleeping:
+            return   # цикл разбудили из UI-потока; проверка вернётся, когда он уснёт
+        self.polls += 1
+        if self.poll():
+            self.wake()
+        else:
+            self._poll_delay = min(self.poll_max_ms, self._poll_delay * 2)
+            self._poll_job = self.after(self._poll_delay, self._idle_poll)
+
+
+# ── Шина событий UI ─────────────────────────────────
+# Tk не потокобезопасен: воркеры, слушатель pynput, писатель логов и загрузчики
+# не зовут root.after сами, а кладут типизированные события в очередь.
+# Её разбирает кадр анимации в Tk-потоке, не дольше бюджета на кадр. Уснувший
+# цикл кадров будит socketpair: post() пишет в него один байт (пока прежний не
+# прочитан), Tk видит его через createfilehandler — в покое пробуждений нет.
+# Без file handler — опрос очереди с отступом от UI_IDLE_POLL_MS до 1 s.
+# Уровни эквалайзера идут мимо очереди: аудио-коллбэк подменяет ссылку на
+# последний массив, UI берёт самый свежий (старые кадры никому не нужны).
+
+EV_STATE   = "state"     # payload: имя перехода ("ready", "hold_down", ...)
+EV_RESULT  = "result"    # payload: (seq, итоговый текст, trace)
+EV_PASTE   = "paste"     # payload: (seq, состояние вставки, info)
+UI_DRAIN_BUDGET_MS = max(1.0, _env_float("WHISPERMAC_UI_DRAIN_BUDGET_MS", 4.0))
+UI_IDLE_POLL_MS = int(max(10.0, _env_float("WHISPERMAC_UI_IDLE_POLL_MS", 50.0)))
+
+
+class UIEventBus:
+    """Очередь событий из любых потоков → обработчики в UI-потоке (drain())."""
+
+    def __init__(self, *, budget_ms: float = UI_DRAIN_BUDGET_MS):
+        self.budget_ms = budget_ms
+        self._q = queue.SimpleQueue()
+        self._levels = None
+        self._handlers = {}
+        self.posted = 0
+        self.drained = 0
+        self.max_depth = 0
+        self.over_budget = 0
+        self.wakes = 0           # пробуждений UI-потока через socketpair
+        self._latency_ms = collections.deque(maxlen=512)
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._wake_lock = threading.Lock()
+        self._wake_sent = False
+
+    def on(self, kind: str, handler):
+        self._handlers[kind] = handler
+
+    def post(self, kind: str, payload=None):
+        self._q.put((kind, payload, time.perf_counter()))
+        self.posted += 1
+        with self._wake_lock:
+            if self._wake_sent:
+                return   # байт ещё не прочитан: UI-поток и так проснётся
+            self._wake_sent = True
+        with contextlib.suppress(OSError):
+            self._wake_w.send(b"\0")
+
+    def attach(self, tkapp, wake) -> bool:
+        """
+        UI-поток: звать wake(), как только в очередь что-то положили.
+        tkapp — root.tk; False, если Tk не поддерживает file handler.
+        """
+        def ready(*_args):
+            self.ack()
+            wake()
+
+        try:
+            tkapp.createfilehandler(self._wake_r.fileno(), getattr(tk, "READABLE", 2), ready)
+        except Exception as ex:  # noqa: BLE001
+            log(f"[bus] createfilehandler недоступен: {ex}")
+            return False
+        if self.pending():
+            self._wake_w.send(b"\0")   # события, пришедшие до подписки
+        return True
+
+    def ack(self):
+        """UI-поток, до drain(): прочитать байт пробуждения; следующий post() пошлёт новый."""
+        with self._wake_lock:
+            self._wake_sent = False
+        self.wakes += 1
+        with contextlib.suppress(OSError):
+            while self._wake_r.recv(64):
+                pass
+
+    def close(self, tkapp=None):
+        if tkapp is not None:
+            with contextlib.suppress(Exception):
+                tkapp.deletefilehandler(self._wake_r.fileno())
+        self._wake_r.close()
+        self._wake_w.close()
+
+    def post_levels(self, levels):
+        """Из аудио-коллбэка: без очереди и без пробуждения (при записи цикл и так идёт)."""
+        self._levels = levels
+
+    def take_levels(self):
+        levels, self._levels = self._levels, None
+        return levels
+
+    def pending(self) -> bool:
+        """Есть ли события; можно звать из любого потока (SimpleQueue)."""
+        return not self._q.empty()
+
+    def drain(self) -> int:
+        """Разобрать очередь в пределах бюджета; остаток — на следующий кадр."""
+        depth = self._q.qsize()
+        self.max_depth = max(self.max_depth, depth)
+        started = time.perf_counter()
+        deadline = started + self.budget_ms / 1000.0
+        handled = 0
+        while True:
+            try:
+                kind, payload, posted_at = self._q.get_nowait()
+            except queue.Empty:
+                break
+            now = time.perf_counter()
+            self._latency_ms.append((now - posted_at) * 1000.0)
+            handler = self._handlers.get(kind)
+            try:
+                if handler is not None:
+                    handler(payload)
+                else:
+                    log(f"[bus] нет обработчика для {kind}")
+            except Exception as ex:
+                log(f"[bus] {kind}: {ex}")
+            handled += 1
+            if time.perf_counter() >= deadline:
+                if not self._q.empty():
+                    self.over_budget += 1
+                break
+        self.drained += handled
+        return handled
+
+    def stats(self) -> dict:
+        lat = list(self._latency_ms)
+        return {
+            "depth": self._q.qsize(),
+            "max_depth": self.max_depth,
+            "posted": self.posted,
+            "drained": self.drained,
+            "over_budget": self.over_budget,
+            "wakes": self.wakes,
+            "latency_p50_ms": round(_percentile(lat, 50), 2) if lat else 0.0,
+            "latency_p95_ms": round(_percentile(lat, 95), 2) if lat else 0.0,
+            "latency_max_ms": round(max(lat), 2) if lat else 0.0,
+        }
 
 
 class App:
@@ -703,17 +4342,41 @@ class App:
         self.ready      = False
         self.recording  = False
         self.processing = False
-        self.chunks     = []
-        self._chunks_lock = threading.Lock()
-        self.stream     = None
+        self.session    = None   # TranscriptionSession текущей записи
+        # Конвейер диктовок: новая запись не ждёт распознавания прошлой,
+        # а вставка идёт строго в порядке записей (seq).
+        self._seq       = 0
+        self._jobs      = {}     # seq → {"session", "target"} до вставки
+        self._results   = {}     # seq → (text, trace), ждут своей очереди
+        self._next_paste_seq = 1
+        self._server    = None   # TranscriptionServer при WHISPERMAC_SERVE
+        self.capture    = CaptureStream(on_block=self._on_audio_block)
         self.target     = None
-        self._recording_started_at = None
-        self._frame     = 0
+        self._paste_pending = 0
+        self._paste_backend = MacPasteBackend()
+        self._paste_cache = PasteStrategyCache() if PASTE_CACHE else None
+        self.bus = UIEventBus()
+        self.bus.on(EV_STATE, self._on_state_event)
+        self.bus.on(EV_RESULT, lambda p: self._deliver_in_order(*p))
+        self.bus.on(EV_PASTE, self._on_paste_event)
+        self._paster = PasteWorker(
+            emit=lambda seq, state, info: self.bus.post(EV_PASTE, (seq, state, info)),
+            copy=self._copy_for_paste,
+            frontmost=frontmost_bundle,
+            activate=activate_bundle,
+            send=self._send_paste_shortcut,
+            excluded=self._is_excluded_bundle,
+        )
+        # Движок декодирования: всё, у чего есть transcribe(audio, **opts)
+        # в формате mlx_whisper. None — mlx, грузится в _load_model или
+        # при первом фоллбэке с Groq.
+        self.engine     = None
         self._drag_ox   = 0
         self._drag_oy   = 0
         self._dragging  = False
         self._hold_key_down = False
         self._hold_started_recording = False
+        self._endpointer = None
         self._keyboard_listener = None
         self._keyboard_mod = None
         self._hold_key_mode = self._normalize_hold_key_mode(
@@ -722,7 +4385,6 @@ class App:
 
         # Real-time EQ levels (driven by FFT in audio callback)
         self._eq_levels = np.zeros(BAR_COUNT, dtype=np.float32)
-        self._eq_smooth = np.zeros(BAR_COUNT, dtype=np.float32)
         self._rms_smooth = 0.0
 
         # PNG-иконка микрофона
@@ -732,7 +4394,13 @@ class App:
         self._logs_win         = None
         self._logs_list        = None
         self._logs_text        = None
-        self._log_records      = []
+        self._logs_scroll      = None
+        self._log_records      = []    # новые сверху, как в Listbox
+        self._logs_offset      = 0     # до какого байта лог уже прочитан
+        self._logs_head        = 0     # с какого байта лог прочитан (раньше — ещё на диске)
+        self._logs_rendered    = 0     # сколько записей вставлено в Listbox
+        self._logs_archives    = None  # ещё не прочитанные архивы лога, от новых к старым
+        self._logs_more_pending = False
         self._logs_bounds      = (0, 0, 0, 0)
         self._close_bounds     = (0, 0, 0, 0)
         self._suppress_next_toggle = False
@@ -784,6 +4452,13 @@ class App:
                 fill=C_IDLE, outline="", tags="bar"
             )
             self.bars.append((b, x))
+        self.renderer = BarRenderer(self.cv, self.bars)
+        # Цикл анимации спит в покое; будят его смены состояния в UI-потоке, а
+        # события из других потоков — байт в socketpair шины (из чужих потоков Tk не зовём).
+        attached = self.bus.attach(self.root.tk, lambda: self._anim.wake())
+        self._anim = AnimationLoop(self.root.after, self._tick,
+                                   poll=None if attached else self.bus.pending,
+                                   poll_ms=UI_IDLE_POLL_MS)
 
         # Кнопка закрытия (рисованная)
         self._draw_close()
@@ -812,13 +4487,35 @@ class App:
 
         self.root.bind("<Destroy>", self._on_destroy)
 
+        # Окно рисуется сразу; pyobjc, PortAudio и модель догружаются в фоне.
+        self._anim.wake()
+        threading.Thread(target=self._load_platform, daemon=True).start()
+        threading.Thread(target=self._load_model, daemon=True).start()
+
+    def _load_platform(self):
+        _load_macos()
+        STARTUP.mark("macos")
+        self.bus.post(EV_STATE, "macos_ready")
+        if _lazy_import("sounddevice") is None:
+            log("sounddevice недоступен: запись невозможна")
+        elif CAPTURE_PERSISTENT:
+            try:
+                self.capture.open()
+                log(f"Микрофон открыт постоянно, pre-roll {CAPTURE_PREROLL_MS:.0f} мс")
+            except Exception as ex:
+                log(f"Постоянный захват не открылся, поток будет открываться на запись: {ex}")
+        STARTUP.mark("audio")
+
+    def _on_macos_ready(self):
+        self._apply_dock_mode()
         self._setup_hold_key_listener()
         if not request_accessibility_permission(prompt=True):
             log("Accessibility not granted: auto-paste and hold-key may not work")
             self._open_privacy_panel("Accessibility")
-        self._track_app()
-        self._tick()
-        threading.Thread(target=self._load_model, daemon=True).start()
+        global FOCUS
+        FOCUS = FocusTracker(
+            WorkspaceFocusSource(), excluded=self._is_excluded_bundle, on_change=self._on_focus_change,
+        ).start()
 
     def _normalize_hold_key_mode(self, raw: str) -> str:
         mode = (raw or "").strip().lower()
@@ -864,10 +4561,7 @@ class App:
         self.recording = False
         self.processing = False
         try:
-            if self.stream:
-                self.stream.stop()
-                self.stream.close()
-                self.stream = None
+            self.capture.close()
         except Exception as ex:
             log(f"Stream close during quit failed: {ex}")
         try:
@@ -876,11 +4570,24 @@ class App:
         except Exception as ex:
             log(f"Keyboard listener stop during quit failed: {ex}")
         self._close_logs_window()
+        if self._server is not None:
+            with contextlib.suppress(Exception):
+                self._server.close()
+        if isinstance(self.engine, InferenceClient):
+            with contextlib.suppress(Exception):
+                self.engine.close()
+        self._paster.close(timeout=0.5)
+        log("[bus] " + ", ".join(f"{k}={v}" for k, v in self.bus.stats().items()))
+        self.bus.close(self.root.tk)
+        if FOCUS is not None:
+            FOCUS.close()
         try:
             self.root.quit()
             self.root.destroy()
         except Exception:
             pass
+        # os._exit минует atexit — сбрасываем очередь логов вручную.
+        _LOG_WRITER.close()
         os._exit(0)
         return "break"
 
@@ -901,10 +4608,7 @@ class App:
         if self._hold_key_down:
             return
         self._hold_key_down = True
-        try:
-            self.root.after(0, self._handle_hold_key_down)
-        except Exception:
-            pass
+        self.bus.post(EV_STATE, "hold_down")
 
     def _on_global_key_release(self, key):
         if not self._is_hold_key(key):
@@ -912,13 +4616,10 @@ class App:
         if not self._hold_key_down:
             return
         self._hold_key_down = False
-        try:
-            self.root.after(0, self._handle_hold_key_up)
-        except Exception:
-            pass
+        self.bus.post(EV_STATE, "hold_up")
 
     def _handle_hold_key_down(self):
-        if not self.ready or self.processing or self.recording:
+        if not self.ready or self.recording:
             self._hold_started_recording = False
             return
         self._hold_started_recording = True
@@ -1112,7 +4813,8 @@ class App:
             highlightthickness=0,
         )
         list_scroll = tk.Scrollbar(left, orient="vertical", command=self._logs_list.yview)
-        self._logs_list.config(yscrollcommand=list_scroll.set)
+        self._logs_scroll = list_scroll
+        self._logs_list.config(yscrollcommand=self._on_logs_scroll)
         self._logs_list.pack(side="left", fill="both", expand=True)
         list_scroll.pack(side="right", fill="y")
         self._logs_list.bind("<<ListboxSelect>>", self._on_log_select)
@@ -1148,37 +4850,109 @@ class App:
         self._logs_win = None
         self._logs_list = None
         self._logs_text = None
+        self._logs_scroll = None
         self._log_records = []
+        self._logs_offset = 0
+        self._logs_head = 0
+        self._logs_rendered = 0
+        self._logs_archives = None
+        self._logs_more_pending = False
 
     def _log_file_path(self) -> Path:
-        return Path.home() / "whisper_log.txt"
+        return TRANSCRIPT_LOG_PATH
 
     def _runtime_log_file_path(self) -> Path:
-        return Path.home() / "whisper_runtime.log"
+        return RUNTIME_LOG_PATH
 
-    def _read_log_records(self) -> list:
+    def _read_log_records(self, offset: int = 0) -> tuple:
+        """
+        Читает записи лога, дописанные после байта offset.
+        Возвращает (записи от старых к новым, новое смещение). Недописанная
+        последняя строка (без \\n) остаётся на следующий раз.
+        """
         path = self._log_file_path()
         if not path.exists():
-            return []
+            return [], 0
         records = []
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                for line in f:
-                    raw = line.strip()
-                    if not raw:
-                        continue
-                    ts = ""
-                    text = raw
-                    if raw.startswith("[") and "] " in raw:
-                        ts, text = raw[1:].split("] ", 1)
-                    text = text.strip()
-                    if not text:
-                        continue
-                    records.append({"ts": ts, "text": text})
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except Exception as ex:
+            log(f"Не удалось прочитать лог: {ex}")
+            return [], offset
+        end = data.rfind(b"\n") + 1
+        return self._parse_log_records(data[:end]), offset + end
+
+    def _log_tail_end(self, size: int) -> int:
+        """Конец последней полной строки в первых size байтах лога."""
+        try:
+            with open(self._log_file_path(), "rb") as f:
+                pos = size
+                while pos > 0:
+                    step = min(LOGS_TAIL_BLOCK, pos)
+                    f.seek(pos - step)
+                    nl = f.read(step).rfind(b"\n")
+                    if nl >= 0:
+                        return pos - step + nl + 1
+                    pos -= step
+        except OSError:
+            pass
+        return 0
+
+    def _read_log_tail(self, end: int, limit: int = LOGS_TAIL_RECORDS) -> tuple:
+        """
+        Последние limit записей лога до байта end (end — граница строки):
+        файл читается блоками с конца, пока не наберётся limit строк.
+        Возвращает (записи от старых к новым, байт начала первой из них).
+        """
+        path = self._log_file_path()
+        try:
+            with open(path, "rb") as f:
+                pos, data = end, b""
+                while pos > 0 and data.count(b"\n") <= limit:
+                    step = min(LOGS_TAIL_BLOCK, pos)
+                    pos -= step
+                    f.seek(pos)
+                    data = f.read(step) + data
         except Exception as ex:
             log(f"Не удалось прочитать лог: {ex}")
+            return [], end
+        lines = data.split(b"\n")[:-1]   # data кончается на \n
+        if pos > 0:
+            pos += len(lines[0]) + 1      # первая строка блока — обрывок
+            lines = lines[1:]
+        if len(lines) > limit:
+            pos += sum(len(line) + 1 for line in lines[:-limit])
+            lines = lines[-limit:]
+        return self._parse_log_records(b"\n".join(lines)), pos
+
+    def _read_archive_records(self, path: Path) -> list:
+        """Все записи архива лога (.gz или несжатого), от старых к новым."""
+        try:
+            opener = gzip.open if path.suffix == ".gz" else open
+            with opener(path, "rb") as f:
+                return self._parse_log_records(f.read())
+        except Exception as ex:
+            log(f"Не удалось прочитать архив лога {path.name}: {ex}")
             return []
-        return list(reversed(records[-1000:]))
+
+    @staticmethod
+    def _parse_log_records(data: bytes) -> list:
+        records = []
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            raw = line.strip()
+            if not raw:
+                continue
+            ts = ""
+            text = raw
+            if raw.startswith("[") and "] " in raw:
+                ts, text = raw[1:].split("] ", 1)
+            text = text.strip()
+            if not text:
+                continue
+            records.append({"ts": ts, "text": text})
+        return records
 
     def _log_preview(self, text: str, max_len: int = 72) -> str:
         cleaned = " ".join(text.split())
@@ -1186,22 +4960,121 @@ class App:
             return cleaned
         return cleaned[: max_len - 1] + "…"
 
+    def _log_row(self, item: dict) -> str:
+        return f"{item['ts'] or '--'} · {self._log_preview(item['text'])}"
+
     def _refresh_logs(self):
+        """
+        Инкрементальное обновление: дочитываем из файла только новые записи
+        и вставляем их в начало Listbox, не пересобирая список. Выделение
+        остаётся на той же записи.
+        """
         if not self._logs_list:
             return
+        started = time.perf_counter()
+        try:
+            size = self._log_file_path().stat().st_size
+        except OSError:
+            size = 0
+        rebuilt = size < self._logs_offset
+        if rebuilt:
+            # Файл обрезали/ротировали — читаем заново.
+            self._log_records = []
+            self._logs_offset = 0
+            self._logs_head = 0
+            self._logs_rendered = 0
+            self._logs_archives = None
+            self._logs_list.delete(0, tk.END)
+
         prev_idx = self._selected_log_index()
-        self._log_records = self._read_log_records()
-        self._logs_list.delete(0, tk.END)
-        for item in self._log_records:
-            ts = item["ts"] or "--"
-            self._logs_list.insert(tk.END, f"{ts} · {self._log_preview(item['text'])}")
-        if self._log_records:
-            idx = prev_idx if prev_idx is not None and prev_idx < len(self._log_records) else 0
+        if self._logs_offset == 0 and size:
+            # Первое чтение — только хвост; остальное догрузит прокрутка.
+            end = self._log_tail_end(size)
+            new_records, self._logs_head = self._read_log_tail(end)
+            self._logs_offset = end
+        else:
+            new_records, self._logs_offset = self._read_log_records(self._logs_offset)
+        added = len(new_records)
+        if added:
+            new_records.reverse()
+            self._log_records[:0] = new_records
+            if self._logs_rendered == 0:
+                self._render_log_rows(min(LOGS_PAGE_ROWS, len(self._log_records)))
+            else:
+                self._logs_list.insert(0, *[self._log_row(r) for r in new_records])
+                self._logs_rendered += added
+
+        if not self._log_records:
+            if self._logs_text:
+                self._logs_text.delete("1.0", tk.END)
+        elif prev_idx is None:
+            self._select_log(0)
+        elif added:
+            # Запись та же — текст справа не перерисовываем.
+            idx = prev_idx + added
+            self._logs_list.selection_clear(0, tk.END)
             self._logs_list.selection_set(idx)
             self._logs_list.activate(idx)
-            self._on_log_select()
-        elif self._logs_text:
-            self._logs_text.delete("1.0", tk.END)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        log(
+            f"[logs] refresh: +{added}{' (rebuild)' if rebuilt else ''}, "
+            f"показано {self._logs_rendered}/{len(self._log_records)}, "
+            f"main-thread {elapsed_ms:.1f}ms"
+        )
+
+    def _render_log_rows(self, upto: int):
+        """Дорисовывает в Listbox записи [rendered, upto) — виртуальное окно растёт вниз."""
+        if not self._logs_list or upto <= self._logs_rendered:
+            return
+        rows = [self._log_row(r) for r in self._log_records[self._logs_rendered:upto]]
+        self._logs_list.insert(tk.END, *rows)
+        self._logs_rendered = upto
+
+    def _on_logs_scroll(self, first, last):
+        if self._logs_scroll:
+            self._logs_scroll.set(first, last)
+        if (
+            float(last) >= LOGS_LOAD_MORE_AT
+            and (self._logs_rendered < len(self._log_records) or self._logs_head > 0
+                 or self._logs_archives != [])
+            and not self._logs_more_pending
+            and self._logs_win
+        ):
+            # yscrollcommand зовётся изнутри перерисовки — вставляем после неё.
+            self._logs_more_pending = True
+            self._logs_win.after_idle(self._load_more_logs)
+
+    def _load_more_logs(self):
+        self._logs_more_pending = False
+        if not self._logs_list:
+            return
+        started = time.perf_counter()
+        if self._logs_archives is None:
+            self._logs_archives = log_archives(self._log_file_path())
+        # Сначала более ранние записи текущего файла, потом архивы ротации, по одному.
+        while len(self._log_records) < self._logs_rendered + LOGS_PAGE_ROWS:
+            if self._logs_head > 0:
+                older, self._logs_head = self._read_log_tail(self._logs_head)
+            elif self._logs_archives:
+                older = self._read_archive_records(self._logs_archives.pop(0))
+            else:
+                break
+            older.reverse()
+            self._log_records.extend(older)
+        upto = min(len(self._log_records), self._logs_rendered + LOGS_PAGE_ROWS)
+        self._render_log_rows(upto)
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        log(
+            f"[logs] подгрузка: показано {self._logs_rendered}/{len(self._log_records)}, "
+            f"main-thread {elapsed_ms:.1f}ms"
+        )
+
+    def _select_log(self, idx: int):
+        self._logs_list.selection_clear(0, tk.END)
+        self._logs_list.selection_set(idx)
+        self._logs_list.activate(idx)
+        self._on_log_select()
 
     def _selected_log_index(self):
         if not self._logs_list:
@@ -1280,7 +5153,7 @@ class App:
 
     # ── Запись ──────────────────────────────────────────────────
     def _toggle(self):
-        if not self.ready or self.processing:
+        if not self.ready:
             return
         if not self.recording:
             self._start_rec()
@@ -1288,17 +5161,28 @@ class App:
             self._stop_rec()
 
     def _start_rec(self):
-        with self._chunks_lock:
-            self.chunks = []
+        # Встреча и автостоп — только для записи кликом: при удержании клавиши
+        # это диктовка, её конец задаёт отпускание.
+        meeting = MeetingTranscript() if MEETING and not self._hold_started_recording else None
+        self._endpointer = (
+            Endpointer() if ENDPOINT and meeting is None and not self._hold_started_recording else None
+        )
         self._eq_levels[:] = 0
-        self._eq_smooth[:] = 0
+        self.renderer.reset_levels()
         self._rms_smooth = 0.0
-        self._recording_started_at = time.perf_counter()
-        current_bundle = frontmost_bundle()
+        session = TranscriptionSession(
+            self.engine,
+            use_groq=ENGINE == "groq" and GROQ_API_KEY,
+            on_perf=self._save_perf,
+            meeting=meeting,
+        )
+        self.session = session
+        current_bundle = FOCUS.frontmost if FOCUS is not None else frontmost_bundle()
         if current_bundle and not self._is_excluded_bundle(current_bundle):
             self.target = current_bundle
         self.recording = True
         self._set_mic_color(recording=True)
+        self._anim.wake()
         log(
             f"Конфиг: chunk={CHUNK_SEC:.1f}s, poll={WORKER_POLL_SEC:.2f}s, "
             f"final-pass={FINAL_PASS_MIN_SEC:.0f}-{FINAL_PASS_MAX_SEC:.0f}s"
@@ -1308,413 +5192,149 @@ class App:
             f"save_transcripts={'on' if SAVE_TRANSCRIPTS else 'off'}, "
             f"save_perf={'on' if SAVE_PERF_LOG else 'off'}"
         )
-        log(f"Запись... ({self.target})")
+        if meeting is not None:
+            log(f"Встреча: стенограмма пишется в {meeting.path}, без вставки")
+        else:
+            log(f"Запись... ({self.target})")
         try:
-            self.stream = sd.InputStream(
-                samplerate=SAMPLE_RATE, channels=1, dtype="float32",
-                blocksize=1024, latency="low", callback=self._audio_cb
-            )
-            self.stream.start()
+            self.capture.begin(session)
         except Exception as ex:
             log(f"Ошибка: {ex}")
             err = str(ex).lower()
             if any(k in err for k in ("permission", "not permitted", "unauthorized", "access")):
                 self._open_privacy_panel("Microphone")
+            self.session = None
+            self.recording = False
             self._reset()
             return
-        if ENGINE == "groq" and GROQ_API_KEY:
-            threading.Thread(target=self._groq_worker, daemon=True).start()
-        else:
-            threading.Thread(target=self._streaming_worker, daemon=True).start()
+        self._seq += 1
+        seq = self._seq
+        self._jobs[seq] = {"session": session, "target": self.target}
+        session.on_result = lambda text, trace, seq=seq: self._on_session_result(seq, text, trace)
+        session.start()
+
+    def _on_endpoint(self):
+        endpointer = self._endpointer
+        if not self.recording or endpointer is None:
+            return
+        log(f"[endpoint] тишина {endpointer.silence * 1000 // SAMPLE_RATE} мс — стоп без клика")
+        self._stop_rec(trim=endpointer.trim_samples)
 
-    def _stop_rec(self):
+    def _stop_rec(self, trim: int = 0):
         self.recording = False
-        current_bundle = frontmost_bundle()
-        if current_bundle and not self._is_excluded_bundle(current_bundle):
-            self.target = current_bundle
-        if self.stream:
-            self.stream.stop()
-            self.stream.close()
-            self.stream = None
+        self._endpointer = None
+        session = self.session
+        # Сначала снять приёмник: следующие блоки пойдут уже в новую сессию (или
+        # в pre-roll), а не в запись, которую воркер сейчас начнёт читать.
+        self.capture.end()
+        if session is not None:
+            if trim:
+                session.trim_tail(trim)
+            session.stop()
+        # Цель вставки — окно, из которого начали запись (_jobs, _start_rec):
+        # к стопу пользователь мог уже переключиться, а сессии пересекаются.
+        self.session = None
+        if session is not None:
+            session.trace.add("stop", session.stopped_at, time.perf_counter())
+            cap = self.capture
+            if cap.first_block_ms is not None:
+                session.trace.add(
+                    "open", cap.begin_at, cap.begin_at + cap.first_block_ms / 1000.0,
+                    persistent=cap.persistent, preroll_ms=round(cap.preroll_ms, 1),
+                )
         self.processing = True
         self._set_mic_color(recording=False)
+        self._anim.wake()
 
     # ── Аудио-коллбэк (real-time FFT для эквалайзера) ───────────
-    def _audio_cb(self, indata, frames, time_info, status):
-        frame = indata.flatten()
-        with self._chunks_lock:
-            self.chunks.append(indata.copy())
-
+    def _on_audio_block(self, block):
+        # Из коллбэка PortAudio (CaptureStream), только пока идёт запись.
+        endpointer = self._endpointer
+        if endpointer is not None and endpointer.feed(block):
+            self.bus.post(EV_STATE, "endpoint")
+        frame = block.reshape(-1)
         if len(frame) < 64:
-            return
-
-        # Сначала проверяем реальную громкость
-        rms = float(np.sqrt(np.mean(frame ** 2)))
-        self._rms_smooth = (
-            (1.0 - EQ_RMS_ALPHA) * self._rms_smooth + EQ_RMS_ALPHA * rms
-        )
-        gate = EQ_RMS_THRESHOLD
-
-        if self._rms_smooth <= gate:
-            self._eq_levels[:] = 0
-            return
-
-        # FFT → частотные полосы
-        windowed = frame * np.hanning(len(frame))
-        fft_vals  = np.abs(np.fft.rfft(windowed))
-        n_bins    = len(fft_vals)
-
-        levels = np.array([
-            np.mean(fft_vals[n_bins * i // BAR_COUNT : n_bins * (i+1) // BAR_COUNT])
-            for i in range(BAR_COUNT)
-        ], dtype=np.float32)
-
-        peak = levels.max()
-        if peak > 1e-6:
-            # Нормализуем форму (0–1), затем масштабируем по реальной громкости
-            shape = levels / peak
-            denom = max(1e-6, EQ_RMS_FULL - EQ_RMS_THRESHOLD)
-            amplitude = min(
-                1.0,
-                max(0.0, (self._rms_smooth - EQ_RMS_THRESHOLD) / denom),
-            )
-            # Чуть поднимаем средние уровни, чтобы анимация читалась живее.
-            amplitude = amplitude ** 0.72
-            self._eq_levels[:] = (shape * amplitude).astype(np.float32)
-        else:
-            self._eq_levels[:] = 0
-
-    def _transcribe_audio(
-        self,
-        audio,
-        *,
-        prompt=None,
-        final=False,
-        condition_on_previous_text=True,
-        temperature=None,
-    ):
-        opts = dict(
-            path_or_hf_repo=MODEL_REPO,
-            language=LANGUAGE,
-            initial_prompt=prompt,
-            condition_on_previous_text=condition_on_previous_text,
-        )
-        # Beam search в mlx_whisper пока не реализован.
-        opts["temperature"] = (
-            temperature if temperature is not None
-            else (FINAL_TEMPERATURES if final else 0.0)
-        )
-        return mlx_whisper.transcribe(audio, **opts)
-
-    def _take_new_audio(self, chunk_idx: int) -> tuple:
-        with self._chunks_lock:
-            total = len(self.chunks)
-            if chunk_idx >= total:
-                return chunk_idx, None
-            new_chunks = self.chunks[chunk_idx:total]
-            chunk_idx = total
-        if not new_chunks:
-            return chunk_idx, None
-        new_audio = np.concatenate([c.flatten() for c in new_chunks])
-        return chunk_idx, new_audio
-
-    def _decode_piece(self, audio: np.ndarray, parts: list, label: str) -> tuple:
-        prompt = _prompt_from_parts(parts)
-        started = time.perf_counter()
-        result = self._transcribe_audio(audio, prompt=prompt, final=False)
-        elapsed = time.perf_counter() - started
-        text = result.get("text", "").strip()
-        avg_logprob, avg_no_speech = _segment_quality(result)
-        if _likely_silence_hallucination(text, avg_no_speech):
-            log(
-                f"[{label}] пропуск (тишина): no_speech={avg_no_speech:.2f}, "
-                f"text='{text[:24]}'"
-            )
-            return "", elapsed, avg_logprob, avg_no_speech
-        if text:
-            log(f"[{label}] {text}")
-        return text, elapsed, avg_logprob, avg_no_speech
-
-    # ── Groq воркер (основной путь) ─────────────────────────────
-    def _groq_worker(self):
-        """
-        Быстрый облачный путь: во время записи только копим аудио,
-        на стопе одним запросом отправляем всё в Groq и мгновенно вставляем.
-        При ошибке/пустом ответе — фоллбэк на локальную модель.
-        """
-        while self.recording:
-            time.sleep(WORKER_POLL_SEC)
-
-        with self._chunks_lock:
-            all_audio = (
-                np.concatenate([c.flatten() for c in self.chunks])
-                if self.chunks else np.array([], dtype=np.float32)
-            )
-
-        audio_sec = len(all_audio) / SAMPLE_RATE
-        amp = float(np.max(np.abs(all_audio))) if len(all_audio) else 0.0
-        if audio_sec < MIN_DURATION or amp <= 0.001:
-            log("[groq] слишком короткая/тихая запись — пропуск")
-            self.root.after(0, self._reset)
-            return
-
-        full = groq_transcribe(all_audio, prompt=HOTWORDS_PROMPT)
-
-        if not full:
-            log("[groq] пустой результат — фоллбэк на локальную модель")
-            full = self._local_full_transcribe(all_audio)
-
-        if full and _is_repetition_loop(full):
-            collapsed = _collapse_repetition_loop(full).strip()
-            if collapsed and collapsed != full:
-                log("[post] схлопнул повторяющийся loop-текст")
-                full = collapsed
-
-        log(f"→ {full}")
-        if full:
-            self._save(full)
-            self.root.after(0, lambda t=full: self._paste_and_reset(t))
-        else:
-            self.root.after(0, self._reset)
-
-    def _local_full_transcribe(self, all_audio: np.ndarray) -> str:
-        """Локальный фоллбэк: единый проход mlx-whisper по всей записи."""
-        if not len(all_audio):
-            return ""
-        try:
-            res = self._transcribe_audio(
-                all_audio,
-                prompt=HOTWORDS_PROMPT,
-                final=True,
-                condition_on_previous_text=False,
-            )
-            text = res.get("text", "").strip()
-            if text and _is_repetition_loop(text):
-                safe = self._transcribe_audio(
-                    all_audio, prompt=None, final=False,
-                    condition_on_previous_text=False, temperature=0.0,
-                )
-                safe_text = safe.get("text", "").strip()
-                if safe_text and not _is_repetition_loop(safe_text):
-                    text = safe_text
-            return text
-        except Exception as ex:  # noqa: BLE001
-            log(f"[local-fallback] ошибка: {ex}")
-            return ""
-
-    # ── Streaming воркер ────────────────────────────────────────
-    def _streaming_worker(self):
-        """
-        Эффективный воркер для длинных записей.
-        Хранит pending-буфер, потребляет только НОВЫЕ чанки —
-        не конкатенирует весь массив каждую итерацию.
-        """
-        CHUNK      = int(CHUNK_SEC * SAMPLE_RATE)
-        parts      = []
-        pending    = np.array([], dtype=np.float32)   # необработанный буфер
-        chunk_idx  = 0                                 # сколько чанков уже взяли
-        decode_time_sec = 0.0
-        processed_audio_sec = 0.0
-        low_conf_chunks = 0
-        decoded_chunks = 0
-
-        while self.recording:
-            time.sleep(WORKER_POLL_SEC)
-
-            # Берём только новые чанки с момента последней итерации
-            chunk_idx, new_audio = self._take_new_audio(chunk_idx)
-            if new_audio is None:
-                continue
-            pending   = np.concatenate([pending, new_audio]) if len(pending) else new_audio
-
-            # Обрабатываем все полные чанки из буфера
-            # (если модель отстала — догоняем в цикле)
-            while len(pending) >= CHUNK:
-                segment = pending[:CHUNK]
-                pending = pending[CHUNK:]
-
-                text, elapsed, avg_logprob, _ = self._decode_piece(
-                    segment, parts, "chunk"
-                )
-                decode_time_sec += elapsed
-                processed_audio_sec += len(segment) / SAMPLE_RATE
-                decoded_chunks += 1
-                if avg_logprob <= LOW_CONF_LOGPROB:
-                    low_conf_chunks += 1
-                if text:
-                    parts.append(text)
-
-        # Запись остановлена — добираем остаток
-        chunk_idx, new_audio = self._take_new_audio(chunk_idx)
-        if new_audio is not None:
-            pending   = np.concatenate([pending, new_audio]) if len(pending) else new_audio
-
-        # Если во время записи модель отстала, догоняем backlog кусками.
-        while len(pending) >= CHUNK:
-            segment = pending[:CHUNK]
-            pending = pending[CHUNK:]
-            text, elapsed, avg_logprob, _ = self._decode_piece(segment, parts, "flush")
-            decode_time_sec += elapsed
-            processed_audio_sec += len(segment) / SAMPLE_RATE
-            decoded_chunks += 1
-            if avg_logprob <= LOW_CONF_LOGPROB:
-                low_conf_chunks += 1
-            if text:
-                parts.append(text)
+            return
 
-        amp = float(np.max(np.abs(pending))) if len(pending) else 0
-        if len(pending) / SAMPLE_RATE >= MIN_DURATION and amp > 0.001:
-            text, elapsed, avg_logprob, _ = self._decode_piece(pending, parts, "tail")
-            decode_time_sec += elapsed
-            processed_audio_sec += len(pending) / SAMPLE_RATE
-            decoded_chunks += 1
-            if avg_logprob <= LOW_CONF_LOGPROB:
-                low_conf_chunks += 1
-            if text:
-                parts.append(text)
+        # Сначала проверяем реальную громкость
+        rms = float(np.sqrt(np.mean(frame ** 2)))
+        self._rms_smooth = (
+            (1.0 - EQ_RMS_ALPHA) * self._rms_smooth + EQ_RMS_ALPHA * rms
+        )
+        gate = EQ_RMS_THRESHOLD
 
-        chunk_full = _join_chunks(parts)
-        full = chunk_full
+        if self._rms_smooth <= gate:
+            self.bus.post_levels(np.zeros(BAR_COUNT, dtype=np.float32))
+            return
 
-        # Финальный quality-pass по всей записи: выше точность на длинных фразах.
-        with self._chunks_lock:
-            all_audio = (
-                np.concatenate([c.flatten() for c in self.chunks])
-                if self.chunks else np.array([], dtype=np.float32)
-            )
-        if len(all_audio):
-            audio_sec = len(all_audio) / SAMPLE_RATE
-            low_conf_ratio = (
-                (low_conf_chunks / decoded_chunks)
-                if decoded_chunks else 0.0
-            )
-            need_final_pass = (
-                FINAL_PASS_MIN_SEC <= audio_sec <= FINAL_PASS_MAX_SEC
-                and (
-                    _is_repetition_loop(chunk_full)
-                    or not chunk_full
-                    or low_conf_ratio >= 0.35
-                )
-            )
-            if need_final_pass and audio_sec >= MIN_DURATION:
-                try:
-                    final_res = self._transcribe_audio(
-                        all_audio,
-                        prompt=HOTWORDS_PROMPT,
-                        final=True,
-                        # Этот режим в Whisper меньше зацикливается на повторах.
-                        condition_on_previous_text=False,
-                    )
-                    final_text = final_res.get("text", "").strip()
-                    if final_text:
-                        if _is_repetition_loop(final_text):
-                            log("[final] обнаружен loop-повтор, пробую safe-pass")
-                            safe_res = self._transcribe_audio(
-                                all_audio,
-                                prompt=None,
-                                final=False,
-                                condition_on_previous_text=False,
-                                temperature=0.0,
-                            )
-                            safe_text = safe_res.get("text", "").strip()
-                            if safe_text and not _is_repetition_loop(safe_text):
-                                log(f"[final-safe] {safe_text}")
-                                full = safe_text
-                            else:
-                                log("[final] loop остался, fallback на chunk-текст")
-                                full = chunk_full
-                        else:
-                            log(f"[final] {final_text}")
-                            full = final_text
-                except Exception as ex:
-                    log(f"[final] fallback на чанки: {ex}")
-            elif audio_sec > FINAL_PASS_MAX_SEC:
-                skip_line = (
-                    f"[final] пропуск полного pass: запись {audio_sec:.1f}s > "
-                    f"{FINAL_PASS_MAX_SEC:.0f}s"
-                )
-                log(skip_line)
-                self._save_perf(skip_line)
+        # FFT → частотные полосы
+        windowed = frame * np.hanning(len(frame))
+        fft_vals  = np.abs(np.fft.rfft(windowed))
+        n_bins    = len(fft_vals)
 
-        if full and _is_repetition_loop(full):
-            collapsed = _collapse_repetition_loop(full).strip()
-            if collapsed and collapsed != full:
-                log("[post] схлопнул повторяющийся loop-текст")
-                full = collapsed
+        levels = np.array([
+            np.mean(fft_vals[n_bins * i // BAR_COUNT : n_bins * (i+1) // BAR_COUNT])
+            for i in range(BAR_COUNT)
+        ], dtype=np.float32)
 
-        record_wall_sec = 0.0
-        if self._recording_started_at is not None:
-            record_wall_sec = max(0.0, time.perf_counter() - self._recording_started_at)
-        if processed_audio_sec > 0:
-            rtf = decode_time_sec / processed_audio_sec
-            perf_line = (
-                f"[perf] обработано {processed_audio_sec:.1f}s аудио за "
-                f"{decode_time_sec:.2f}s (RTF={rtf:.2f}x), запись шла {record_wall_sec:.1f}s"
+        peak = levels.max()
+        if peak > 1e-6:
+            # Нормализуем форму (0–1), затем масштабируем по реальной громкости
+            shape = levels / peak
+            denom = max(1e-6, EQ_RMS_FULL - EQ_RMS_THRESHOLD)
+            amplitude = min(
+                1.0,
+                max(0.0, (self._rms_smooth - EQ_RMS_THRESHOLD) / denom),
             )
-            log(perf_line)
-            self._save_perf(perf_line)
+            # Чуть поднимаем средние уровни, чтобы анимация читалась живее.
+            amplitude = amplitude ** 0.72
+            self.bus.post_levels((shape * amplitude).astype(np.float32))
+        else:
+            self.bus.post_levels(np.zeros(BAR_COUNT, dtype=np.float32))
 
-        log(f"→ {full}")
+    def _on_session_result(self, seq: int, full: str, trace):
+        """Итог сессии (поток воркера): сохранить и передать в Tk-поток через шину."""
         if full:
             self._save(full)
-            self.root.after(0, lambda t=full: self._paste_and_reset(t))
-        else:
-            self.root.after(0, self._reset)
+        self.bus.post(EV_RESULT, (seq, full, trace))
+
+    def _deliver_in_order(self, seq: int, full: str, trace):
+        """Вставка строго по порядку записей: короткая диктовка не обгоняет длинную."""
+        self._results[seq] = (full, trace)
+        if seq != self._next_paste_seq:
+            log(f"[pipeline] #{seq} готов, ждёт вставки #{self._next_paste_seq}")
+        while self._next_paste_seq in self._results:
+            cur = self._next_paste_seq
+            text, tr = self._results.pop(cur)
+            job = self._jobs.pop(cur, None) or {}
+            self._next_paste_seq += 1
+            if text:
+                self._submit_paste(cur, text, tr, target=job.get("target"))
+            else:
+                tr.save()
+                self._reset()
 
     # ── Вспомогательные ─────────────────────────────────────────
     def _save(self, text):
         if not SAVE_TRANSCRIPTS:
             return
-        from datetime import datetime
-        from pathlib import Path
-        with open(Path.home() / "whisper_log.txt", "a", encoding="utf-8") as f:
-            f.write(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {text}\n")
-        if self._logs_win and self._logs_win.winfo_exists():
-            self.root.after(0, self._refresh_logs)
+        _LOG_WRITER.write(TRANSCRIPT_LOG_PATH, text, on_written=self._on_transcript_written)
+
+    def _on_transcript_written(self):
+        # Вызывается из потока-писателя, когда строка уже на диске.
+        if self._logs_win is not None:
+            self.bus.post(EV_STATE, "logs_written")
 
     def _save_perf(self, text):
         if not SAVE_PERF_LOG:
             return
-        from datetime import datetime
-        from pathlib import Path
-        with open(Path.home() / "whisper_perf.log", "a", encoding="utf-8") as f:
-            f.write(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {text}\n")
-
-    def _send_paste_shortcut(self, target: str = "", text: str = "") -> bool:
-        mode = PASTE_SHORTCUT_MODE
-        modes = {
-            "ax": (("ax", lambda: ax_insert_text(text, target)),),
-            "keycode": (("osascript-keycode", lambda: cmd_v_osascript_keycode(target)),),
-            "osascript-keycode": (("osascript-keycode", lambda: cmd_v_osascript_keycode(target)),),
-            "osascript": (("osascript", lambda: cmd_v_osascript(target)),),
-            "pynput": (("pynput", cmd_v_pynput),),
-            "session": (("session", lambda: self._send_cgevent(kCGSessionEventTap)),),
-            "cgevent": (("cgevent", lambda: self._send_cgevent(kCGHIDEventTap)),),
-            "auto": (
-                ("ax", lambda: ax_insert_text(text, target)),
-                ("osascript-keycode", lambda: cmd_v_osascript_keycode(target)),
-                ("osascript", lambda: cmd_v_osascript(target)),
-                ("pynput", cmd_v_pynput),
-                ("session", lambda: self._send_cgevent(kCGSessionEventTap)),
-                ("cgevent", lambda: self._send_cgevent(kCGHIDEventTap)),
-            ),
-        }
-        for name, sender in modes.get(mode, modes["auto"]):
-            if name not in {"osascript", "osascript-keycode", "ax"} and not request_accessibility_permission(prompt=False):
-                log("Accessibility permission missing for simulated paste")
-                return False
-            if sender():
-                log(f"Paste sent via {name}")
-                return True
-        return False
+        _LOG_WRITER.write(PERF_LOG_PATH, text)
 
-    def _send_cgevent(self, tap: int) -> bool:
-        try:
-            cmd_v(tap)
-            return True
-        except Exception as ex:
-            log(f"CGEvent Cmd+V failed: {ex}")
-            return False
+    def _send_paste_shortcut(self, target: str = "", text: str = "") -> tuple:
+        ok, method, attempts = paste_with_strategy(
+            self._paste_backend, self._paste_cache, target, text
+        )
+        return ok, method, len(attempts)
 
     def _temporarily_move_self_away(self) -> bool:
         # Лог-архив во время вставки НЕ трогаем. Раньше он сворачивался, а затем
@@ -1738,11 +5358,20 @@ class App:
         self.root.after(350, restore)
 
     def _copy_to_clipboard(self, text: str) -> bool:
+        """Из Tk-потока (архив логов): нативный буфер, иначе Tk clipboard."""
+        return self._copy_native(text) or self._copy_tk(text)
+
+    def _copy_for_paste(self, text: str) -> bool:
+        """Из потока вставки: Tk clipboard трогаем только через UI-поток."""
+        return self._copy_native(text) or bool(self._paster.call_ui(lambda: self._copy_tk(text)))
+
+    def _copy_native(self, text: str) -> bool:
         env = os.environ.copy()
         env.setdefault("LANG", "C.UTF-8")
         env.setdefault("LC_CTYPE", "C.UTF-8")
 
         # Основной путь для macOS GUI-приложений: нативный pasteboard (Unicode).
+        _load_macos()
         try:
             pb = NSPasteboard.generalPasteboard()
             pb.clearContents()
@@ -1768,163 +5397,948 @@ class App:
             return True
         except Exception as ex:
             log(f"pbcopy failed, fallback to Tk clipboard: {ex}")
-            try:
-                self.root.clipboard_clear()
-                self.root.clipboard_append(text)
-                self.root.update_idletasks()
-                return True
-            except Exception as ex2:
-                log(f"clipboard fallback failed: {ex2}")
-                return False
+            return False
 
-    def _paste_and_reset(self, text):
-        if not self._copy_to_clipboard(text):
-            self._reset()
-            return
-        target = self.target or ""
-        if self._is_excluded_bundle(target):
-            target = ""
-        front = frontmost_bundle() or ""
-        if not target and front and not self._is_excluded_bundle(front):
-            target = front
+    def _copy_tk(self, text: str) -> bool:
+        try:
+            self.root.clipboard_clear()
+            self.root.clipboard_append(text)
+            self.root.update_idletasks()
+            return True
+        except Exception as ex:
+            log(f"clipboard fallback failed: {ex}")
+            return False
 
-        if not target and self._is_excluded_bundle(front):
-            log("Paste skipped: no external target; text is in clipboard")
+    def _submit_paste(self, seq: int, text: str, trace=None, target=None):
+        self._paste_pending += 1
+        self._anim.wake()
+        self._paster.submit(PasteJob(
+            seq, text, target or self.target or "", trace or UtteranceTrace("-"),
+        ))
+
+    def _on_paste_event(self, payload):
+        """Переход состояния в потоке вставки (разбирается в Tk-потоке)."""
+        seq, state, info = payload
+        if state == "ui":
+            info["run"]()
+        elif state == "restore":
+            self._restore_after_paste(self._temporarily_move_self_away())
+        elif state in ("done", "skipped", "failed"):
+            self._paste_pending = max(0, self._paste_pending - 1)
+            if state == "failed" and info.get("reason") == "send":
+                self._open_privacy_panel("Accessibility")
             self._reset()
-            return
 
-        logs_hidden = self._temporarily_move_self_away()
-        if target:
-            if activate_bundle(target):
-                front = frontmost_bundle() or ""
-            else:
-                log(f"Target activate failed: {target}")
-        time.sleep(0.08)
-        front = frontmost_bundle() or ""
-        paste_target = target
-        if front and not self._is_excluded_bundle(front):
-            if not paste_target or front != paste_target:
-                if paste_target:
-                    log(f"Paste target changed: saved={paste_target} actual={front}")
-                paste_target = front
-        if not paste_target and self._is_excluded_bundle(front):
-            log("Paste skipped after focus restore: no external target; text is in clipboard")
-            self._restore_after_paste(logs_hidden)
-            self._reset()
+    def _on_state_event(self, name: str):
+        handler = {
+            "ready": self._on_ready,
+            "macos_ready": self._on_macos_ready,
+            "hold_down": self._handle_hold_key_down,
+            "hold_up": self._handle_hold_key_up,
+            "logs_written": self._refresh_logs,
+            "endpoint": self._on_endpoint,
+        }.get(name)
+        if handler is None:
+            log(f"[bus] неизвестное состояние: {name}")
             return
-        log(
-            f"Paste target={paste_target or '-'} frontmost={front or '-'} "
-            f"mode={PASTE_SHORTCUT_MODE or 'auto'}"
-        )
-        if not self._send_paste_shortcut(paste_target, text):
-            self._open_privacy_panel("Accessibility")
-        self._restore_after_paste(logs_hidden)
-        self._reset()
+        handler()
 
     def _reset(self):
-        self.processing  = False
-        self._eq_levels[:] = 0
-        self._set_mic_color(recording=False)
+        # Идущая запись тоже в _jobs — её в «обработку» не считаем.
+        busy = len(self._jobs) + self._paste_pending
+        self.processing = busy > (1 if self.recording else 0)
+        if not self.recording:
+            self._eq_levels[:] = 0
+            self._set_mic_color(recording=False)
+        self._anim.wake()
 
     # ── Анимация ────────────────────────────────────────────────
-    def _tick(self):
-        self._frame += 1
-        t  = self._frame * 0.12
-        cy = H // 2
-
+    def _tick(self) -> bool:
+        """Кадр анимации; False — всё нарисовано и ждать нечего, цикл засыпает."""
+        self.bus.drain()
+        levels = self.bus.take_levels()
+        if levels is not None and self.recording:
+            self._eq_levels[:] = levels
         if self.recording:
-            # Attack/decay smoothing для ощущения VU-метра
-            target = np.power(np.clip(self._eq_levels, 0.0, 1.0), EQ_VISUAL_GAMMA)
-            rising = target > self._eq_smooth
-            self._eq_smooth = np.where(
-                rising,
-                self._eq_smooth + (target - self._eq_smooth) * EQ_ATTACK,
-                self._eq_smooth * (1.0 - EQ_DECAY)
-            )
-            energy = float(np.mean(target))
-            for i, (b, bx) in enumerate(self.bars):
-                wobble = 0.0
-                if energy > 0.03:
-                    wobble = (
-                        0.5 + 0.5 * math.sin(t * (5.2 + i * 0.15) + i * 0.9)
-                    ) * EQ_WOBBLE_MAX * energy
-                level = min(1.0, self._eq_smooth[i] + wobble)
-                h = BAR_MIN + level * BAR_MAX
-                self.cv.coords(b, bx, cy - h, bx + BAR_W, cy + h)
-                self.cv.itemconfig(b, fill=C_REC)
-
+            mode = "recording"
         elif self.processing:
-            for i, (b, bx) in enumerate(self.bars):
-                h = BAR_MIN + abs(math.sin(t * 4.0 + i * 0.5)) * BAR_MAX * 0.55
-                self.cv.coords(b, bx, cy - h, bx + BAR_W, cy + h)
-                self.cv.itemconfig(b, fill=C_PROC)
-
+            mode = "processing"
         else:
-            for b, bx in self.bars:
-                self.cv.coords(b, bx, cy - BAR_MIN, bx + BAR_W, cy + BAR_MIN)
-                self.cv.itemconfig(b, fill=C_IDLE)
+            mode = "idle"
+        changed = self.renderer.render(mode, self._eq_levels)
 
         if not self.ready:
             self.cv.itemconfig(
                 self.spinner,
-                text="◜◝◞◟"[self._frame // 4 % 4]
+                text="◜◝◞◟"[self.renderer.frame // 4 % 4]
             )
+            return True
+        # Вставка в полёте или события в очереди: разбираются здесь же, засыпать нельзя.
+        return mode != "idle" or changed > 0 or self._paste_pending > 0 or self.bus.pending()
 
-        self.root.after(33, self._tick)
-
-    def _track_app(self):
-        try:
-            if not self.recording and not self.processing:
-                b = frontmost_bundle()
-                if b and not self._is_excluded_bundle(b):
-                    self.target = b
-        except Exception:
-            pass
-        self.root.after(300, self._track_app)
+    def _on_focus_change(self, bid: str):
+        # Уведомление NSWorkspace: внешнее приложение стало активным.
+        if not self.recording and not self.processing:
+            self.target = bid
 
     def _load_model(self):
         if ENGINE == "groq" and GROQ_API_KEY:
+            # mlx не импортируем: понадобится только при фоллбэке.
             log(f"Движок: Groq ({GROQ_MODEL}), локальная модель — фоллбэк")
             log("Готово")
-            self.root.after(0, self._on_ready)
+            STARTUP.mark("engine")
+            self.bus.post(EV_STATE, "ready")
             return
         if ENGINE == "groq" and not GROQ_API_KEY:
             log("[groq] ключ не найден — работаю только на локальной модели")
         log("Загружаю модель...")
         log(f"Model: {MODEL_REPO}")
+        if _cascade_repo(CASCADE_FAST_REPO):
+            log(f"Каскад: чанки — {CASCADE_FAST_REPO}, ремонт и final-pass — {MODEL_REPO}")
         if STRICT_LOCAL_MODE:
             log("Strict local mode: offline-only")
-        dummy = np.zeros(SAMPLE_RATE, dtype=np.float32)
-        self._transcribe_audio(dummy, prompt=HOTWORDS_PROMPT, final=False)
+        self.engine = load_local_engine()
+        if self.engine is None:
+            return
         log("Готово")
-        self.root.after(0, self._on_ready)
+        STARTUP.mark("engine")
+        self.bus.post(EV_STATE, "ready")
 
     def _on_ready(self):
         self.ready = True
+        self._anim.wake()
         self.cv.itemconfig(self.spinner, state="hidden")
         self.cv.itemconfig("mic",        state="normal")
-
-    def run(self):
-        log("WhisperMac запущен")
-        from AppKit import (
-            NSApplication,
-            NSApplicationActivationPolicyAccessory,
-            NSApplicationActivationPolicyRegular,
-        )
-
+        if SERVE_ADDR and self._server is None:
+            try:
+                self._server = TranscriptionServer(self.engine, SERVE_ADDR)
+                log(f"[serve] слушаю {self._server.address}")
+            except Exception as ex:  # noqa: BLE001
+                log(f"[serve] не удалось запустить сервер: {ex}")
+
+    def _apply_dock_mode(self):
+        AppKit = _lazy_import("AppKit")
+        if AppKit is None:
+            return
         dock_mode = os.getenv("WHISPERMAC_DOCK_MODE", "regular").strip().lower()
-        app = NSApplication.sharedApplication()
+        app = AppKit.NSApplication.sharedApplication()
         if dock_mode == "accessory":
-            app.setActivationPolicy_(NSApplicationActivationPolicyAccessory)
+            app.setActivationPolicy_(AppKit.NSApplicationActivationPolicyAccessory)
             log("Dock mode: accessory")
         else:
-            app.setActivationPolicy_(NSApplicationActivationPolicyRegular)
+            app.setActivationPolicy_(AppKit.NSApplicationActivationPolicyRegular)
             log("Dock mode: regular")
 
+    def run(self):
+        log("WhisperMac запущен")
+        # Idle-колбэк после старта mainloop — окно уже отображено.
+        self.root.after_idle(lambda: STARTUP.mark("window"))
         self.root.mainloop()
 
 
+# ═══════════════════════════════════════════════════
+# Аудио-файлы и тела HTTP-запросов: общее для transcribe, serve и бенчмарков
+# (whisper_bench.py).
+
+
+def _read_wav_mono16k(path: Path) -> np.ndarray:
+    """PCM WAV (8/16/32 бит, моно/стерео) → float32 mono 16 кГц."""
+    with wave.open(path if hasattr(path, "read") else str(path), "rb") as wf:
+        channels = wf.getnchannels()
+        width = wf.getsampwidth()
+        rate = wf.getframerate()
+        raw = wf.readframes(wf.getnframes())
+    if width == 1:
+        audio = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        audio = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 4:
+        audio = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"неподдерживаемая разрядность WAV: {width * 8} бит")
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    if rate != SAMPLE_RATE and len(audio):
+        n_out = int(round(len(audio) * SAMPLE_RATE / rate))
+        audio = np.interp(
+            np.linspace(0, len(audio) - 1, n_out),
+            np.arange(len(audio)),
+            audio,
+        ).astype(np.float32)
+    return np.ascontiguousarray(audio, dtype=np.float32)
+
+
+def _iter_http_body(handler, size: int = 64 * 1024):
+    """
+    Блоки тела запроса: по Content-Length или Transfer-Encoding: chunked
+    (так шлёт groq_transcribe с GROQ_CHUNKED). ValueError — нет ни того, ни другого
+    или тело оборвано.
+    """
+    rfile = handler.rfile
+    if "chunked" in (handler.headers.get("Transfer-Encoding") or "").lower():
+        while True:
+            line = rfile.readline(1024)
+            if not line:
+                raise ValueError("chunked-тело оборвано")
+            left = int(line.split(b";", 1)[0].strip() or b"0", 16)
+            if left == 0:
+                while rfile.readline(1024) not in (b"\r\n", b"\n", b""):
+                    pass   # trailer-заголовки не нужны
+                return
+            while left:
+                block = rfile.read(min(size, left))
+                if not block:
+                    raise ValueError("chunked-тело оборвано")
+                left -= len(block)
+                yield block
+            rfile.readline(8)   # CRLF после чанка
+        return
+    left = int(handler.headers.get("Content-Length") or 0)
+    if left <= 0:
+        raise ValueError("нужен Content-Length или Transfer-Encoding: chunked")
+    while left:
+        block = rfile.read(min(size, left))
+        if not block:
+            raise ValueError("тело оборвано")
+        left -= len(block)
+        yield block
+
+
+def _parse_multipart(content_type: str, body: bytes) -> tuple:
+    """multipart/form-data → (поля, {имя: (filename, bytes)})."""
+    from email.parser import BytesParser
+    from email.policy import HTTP
+    msg = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+    )
+    fields, files = {}, {}
+    for part in msg.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if not name:
+            continue
+        data = part.get_payload(decode=True) or b""
+        filename = part.get_filename()
+        if filename is not None:
+            files[name] = (filename, data)
+        else:
+            fields[name] = data.decode("utf-8", errors="replace")
+    return fields, files
+
+
+def _convert_to_wav(src: Path, dst: Path):
+    """Любой аудиоформат → WAV 16 кГц mono: afconvert (macOS), иначе ffmpeg."""
+    afconvert = shutil.which("afconvert")
+    if afconvert:
+        cmd = [afconvert, "-f", "WAVE", "-d", f"LEI16@{SAMPLE_RATE}", "-c", "1",
+               str(src), str(dst)]
+    elif shutil.which("ffmpeg"):
+        cmd = [shutil.which("ffmpeg"), "-nostdin", "-loglevel", "error", "-y",
+               "-i", str(src), "-ac", "1", "-ar", str(SAMPLE_RATE),
+               "-c:a", "pcm_s16le", str(dst)]
+    else:
+        raise ValueError(f"не умею декодировать {src.name}: нет afconvert/ffmpeg")
+    subprocess.run(cmd, capture_output=True, timeout=600, check=True)
+
+
+def _load_audio_file(path: Path) -> np.ndarray:
+    """Аудиофайл с диска → float32 16 кГц (WAV напрямую, прочее через конвертер)."""
+    path = Path(path)
+    with open(path, "rb") as f:
+        is_wav = f.read(4) == b"RIFF"
+    if is_wav:
+        return _read_wav_mono16k(path)
+    with tempfile.TemporaryDirectory() as td:
+        dst = Path(td) / "out.wav"
+        _convert_to_wav(path, dst)
+        return _read_wav_mono16k(dst)
+
+
+def _decode_upload(filename: str, data: bytes) -> np.ndarray:
+    """Аудио из запроса → float32 16 кГц (WAV напрямую, прочее через конвертер)."""
+    if data[:4] == b"RIFF" and data[12:16] == b"fmt " and data[20:22] == b"\x07\x00":
+        return _ulaw_to_float(data)
+    if data[:4] == b"RIFF":
+        return _read_wav_mono16k(io.BytesIO(data))
+    with tempfile.TemporaryDirectory() as td:
+        src = Path(td) / (Path(filename).name or "in.bin")
+        src.write_bytes(data)
+        return _load_audio_file(src)
+
+
+def _quiet_logs(verbose: bool):
+    """Пакетный режим и бенчмарки не пишут в пользовательские логи; в консоль — только с --verbose."""
+    global RUNTIME_LOG, SAVE_TRANSCRIPTS, SAVE_PERF_LOG, LOG_ECHO
+    RUNTIME_LOG = False
+    SAVE_TRANSCRIPTS = False
+    SAVE_PERF_LOG = False
+    LOG_ECHO = verbose
+
+
+def _bench_module():
+    """
+    whisper_bench.py (FakeEngine, MockGroqServer, bench-*) по требованию.
+    Запущенный скриптом whisper_mac — это __main__: whisper_bench должен
+    увидеть его, а не импортировать второй экземпляр модуля.
+    """
+    sys.modules.setdefault("whisper_mac", sys.modules[__name__])
+    return importlib.import_module("whisper_bench")
+
+
+# ═══════════════════════════════════════════════════
+# Пакетная транскрипция: python whisper_mac.py transcribe <files|dir>
+#
+# Тот же конвейер, что и для диктовки (чанки, фильтр тишины, loop-детектор,
+# hotword-промпт), но для готовых файлов: пул процессов для локальной модели,
+# пул потоков для Groq, результаты пишутся по мере готовности, прогресс —
+# в манифест, чтобы прерванный прогон продолжился с того же места.
+
+AUDIO_EXTS = {
+    ".wav", ".m4a", ".mp3", ".aac", ".caf", ".aiff", ".aif", ".flac",
+    ".ogg", ".opus", ".mp4", ".mov", ".webm",
+}
+
+_BATCH_ENGINE = None   # движок внутри процесса пула (грузится один раз)
+
+
+def _batch_inputs(paths: list) -> list:
+    files = []
+    for raw in paths:
+        p = Path(raw).expanduser()
+        if p.is_dir():
+            files.extend(sorted(
+                f for f in p.rglob("*")
+                if f.is_file() and f.suffix.lower() in AUDIO_EXTS
+            ))
+        elif p.is_file():
+            files.append(p)
+        else:
+            print(f"Пропуск: {raw} не найден", file=sys.stderr)
+    return [f.resolve() for f in files]
+
+
+def _file_key(path: Path) -> dict:
+    st = path.stat()
+    return {"path": str(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _load_manifest(path: Path) -> dict:
+    """path → последняя запись манифеста (JSONL, дописывается по одной строке)."""
+    done = {}
+    if not path.exists():
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue   # оборванная строка после kill -9
+            if "path" in item:
+                done[item["path"]] = item
+    return done
+
+
+def _manifest_done(entry, key: dict) -> bool:
+    return bool(
+        entry
+        and entry.get("status") == "done"
+        and entry.get("size") == key["size"]
+        and entry.get("mtime_ns") == key["mtime_ns"]
+    )
+
+
+def _batch_worker_init(engine_name: str, fake_rtf: float, verbose: bool):
+    global _BATCH_ENGINE
+    _quiet_logs(verbose)
+    if engine_name == "fake":
+        _BATCH_ENGINE = _bench_module().FakeEngine(rtf=fake_rtf)
+    else:
+        _BATCH_ENGINE = local_engine(_lazy_import("mlx_whisper"))
+
+
+def _transcribe_file_job(path_str: str, use_groq: bool) -> dict:
+    """Один файл целиком через TranscriptionSession.run_offline (в процессе/потоке пула)."""
+    path = Path(path_str)
+    started = time.perf_counter()
+    row = {"file": path_str, "engine": "groq" if use_groq else "local"}
+    try:
+        audio = _load_audio_file(path)
+        trace = UtteranceTrace(row["engine"], persist=False)
+        session = TranscriptionSession(_BATCH_ENGINE, use_groq=use_groq, trace=trace)
+        text = session.run_offline(audio)
+        row.update(
+            text=text or "",
+            audio_sec=round(len(audio) / SAMPLE_RATE, 2),
+            engine=trace.engine,
+            final_pass=bool(trace.meta.get("final_pass")),
+        )
+        if trace.meta.get("error"):
+            # Сессия довела итог до конца, но декодирование падало — файл пробуем снова.
+            row["error"] = trace.meta["error"]
+    except Exception as ex:  # noqa: BLE001
+        row["error"] = f"{type(ex).__name__}: {ex}"
+    row["wall_sec"] = round(time.perf_counter() - started, 2)
+    return row
+
+
+def _format_batch_row(row: dict, fmt: str) -> str:
+    if fmt == "jsonl":
+        return json.dumps(row, ensure_ascii=False) + "\n"
+    return f"=== {Path(row['file']).name} ===\n{row.get('text', '')}\n\n"
+
+
+def batch_main(argv: list) -> int:
+    import argparse
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+    parser = argparse.ArgumentParser(
+        prog="whisper_mac.py transcribe",
+        description="Пакетная транскрипция файлов тем же конвейером, что и диктовка",
+    )
+    parser.add_argument("inputs", nargs="+", help="файлы или каталоги (рекурсивно)")
+    parser.add_argument("-o", "--output", default="transcripts.jsonl",
+                        help="куда писать результаты (.jsonl или .txt)")
+    parser.add_argument("--format", choices=("jsonl", "txt"),
+                        help="формат вывода (по умолчанию — по расширению --output)")
+    parser.add_argument("--manifest", help="файл прогресса (по умолчанию <output>.manifest.jsonl)")
+    parser.add_argument("--engine", choices=("local", "groq", "fake"),
+                        default="groq" if ENGINE == "groq" and GROQ_API_KEY else "local")
+    parser.add_argument("-j", "--jobs", type=int, default=0,
+                        help="параллелизм: процессы для local/fake, запросы для groq")
+    parser.add_argument("--fake-rtf", type=float, default=0.05, help="скорость FakeEngine")
+    parser.add_argument("--restart", action="store_true",
+                        help="начать заново: очистить вывод и манифест")
+    parser.add_argument("--verbose", action="store_true", help="печатать лог воркеров")
+    args = parser.parse_args(argv)
+
+    _quiet_logs(args.verbose)
+    use_groq = args.engine == "groq"
+    if use_groq and not GROQ_API_KEY:
+        print("Groq: ключ не найден (GROQ_API_KEY)", file=sys.stderr)
+        return 2
+    if args.engine == "local" and _lazy_import("mlx_whisper") is None:
+        print("mlx_whisper недоступен на этой машине", file=sys.stderr)
+        return 2
+
+    out_path = Path(args.output).expanduser()
+    fmt = args.format or ("txt" if out_path.suffix.lower() == ".txt" else "jsonl")
+    manifest_path = Path(args.manifest or f"{out_path}.manifest.jsonl").expanduser()
+    if args.restart:
+        for p in (out_path, manifest_path):
+            if p.exists():
+                p.unlink()
+
+    files = _batch_inputs(args.inputs)
+    manifest = _load_manifest(manifest_path)
+    todo = []
+    for path in files:
+        key = _file_key(path)
+        if not _manifest_done(manifest.get(key["path"]), key):
+            todo.append(key)
+    skipped = len(files) - len(todo)
+    print(f"Файлов: {len(files)}, готово ранее: {skipped}, в работе: {len(todo)}", file=sys.stderr)
+    if not todo:
+        return 0
+
+    if use_groq:
+        jobs = args.jobs or 4
+        _batch_worker_init(args.engine, args.fake_rtf, args.verbose)
+        pool = ThreadPoolExecutor(max_workers=jobs)
+    else:
+        # Каждый процесс держит свою копию модели: по умолчанию немного.
+        jobs = args.jobs or (min(4, os.cpu_count() or 1) if args.engine == "fake" else 2)
+        pool = ProcessPoolExecutor(
+            max_workers=jobs,
+            mp_context=_spawn_context(),
+            initializer=_batch_worker_init,
+            initargs=(args.engine, args.fake_rtf, args.verbose),
+        )
+
+    failed = 0
+    interrupted = False
+    started = time.perf_counter()
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(out_path, "a", encoding="utf-8") as out, \
+                open(manifest_path, "a", encoding="utf-8") as mf:
+            futures = {
+                pool.submit(_transcribe_file_job, key["path"], use_groq): key
+                for key in todo
+            }
+            for n, fut in enumerate(as_completed(futures), 1):
+                key = futures[fut]
+                row = fut.result()
+                status = "error" if "error" in row else "done"
+                if status == "done":
+                    out.write(_format_batch_row(row, fmt))
+                    out.flush()
+                else:
+                    failed += 1
+                mf.write(json.dumps(
+                    {**key, "status": status, "error": row.get("error"),
+                     "audio_sec": row.get("audio_sec"), "wall_sec": row["wall_sec"]},
+                    ensure_ascii=False,
+                ) + "\n")
+                mf.flush()
+                name = Path(key["path"]).name
+                detail = row.get("error") or f"{row.get('audio_sec', 0):.1f}s аудио за {row['wall_sec']:.1f}s"
+                print(f"[{n}/{len(todo)}] {name}: {detail}", file=sys.stderr)
+    except KeyboardInterrupt:
+        interrupted = True
+        print("Прервано: готовые файлы в манифесте, повторный запуск продолжит", file=sys.stderr)
+        return 130
+    finally:
+        pool.shutdown(wait=not interrupted, cancel_futures=True)
+
+    total = time.perf_counter() - started
+    print(f"Готово за {total:.1f}s: {len(todo) - failed} ок, {failed} с ошибкой → {out_path}",
+          file=sys.stderr)
+    return 1 if failed else 0
+
+
+# ═══════════════════════════════════════════════════
+# Локальный сервер: python whisper_mac.py serve [--listen 127.0.0.1:8787 | unix:/path]
+#
+# OpenAI-совместимый POST /v1/audio/transcriptions поверх уже прогретой модели:
+# скрипты переиспользуют одну копию Whisper, а WHISPERMAC_GROQ_URL можно
+# направить на локальный экземпляр. Очередь ограничена (503 при переполнении),
+# декодирование — в SERVE_WORKERS потоках, запросы из одного окна
+# SERVE_BATCH_MS забираются пачкой.
+
+SERVE_TRANSCRIBE_PATHS = (
+    "/v1/audio/transcriptions",
+    "/openai/v1/audio/transcriptions",
+    "/audio/transcriptions",
+)
+
+
+class _ServeJob:
+    __slots__ = ("audio", "prompt", "enqueued_at", "done", "text", "error", "wait_ms", "decode_ms",
+                 "cancelled")
+
+    def __init__(self, audio: np.ndarray, prompt):
+        self.audio = audio
+        self.prompt = prompt
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.text = None
+        self.error = None
+        self.wait_ms = 0.0
+        self.decode_ms = 0.0
+        self.cancelled = False   # клиент уже получил 504 — декодировать незачем
+
+
+def _parse_listen(spec: str) -> tuple:
+    """'unix:/path' | '/path.sock' → ('unix', path); 'host:port' | 'port' → ('tcp', host, port)."""
+    spec = spec.strip()
+    if spec.startswith("unix:"):
+        return ("unix", str(Path(spec[5:]).expanduser()))
+    if spec.startswith("/") or spec.startswith("~"):
+        return ("unix", str(Path(spec).expanduser()))
+    host, _, port = spec.rpartition(":")
+    return ("tcp", host or "127.0.0.1", int(port))
+
+
+def _read_http_body(handler, limit: int) -> bytes:
+    """
+    Тело запроса по Content-Length или chunked; ValueError, если нет ни длины,
+    ни chunked, OverflowError — тело больше limit (chunked — как только перевалит).
+    """
+    length = int(handler.headers.get("Content-Length") or 0)
+    if length > limit:
+        raise OverflowError(f"тело {length} байт больше лимита {limit}")
+    parts, got = [], 0
+    for block in _iter_http_body(handler):
+        got += len(block)
+        if got > limit:
+            raise OverflowError(f"тело больше лимита {limit} байт")
+        parts.append(block)
+    return b"".join(parts)
+
+
+class TranscriptionServer:
+    """
+    HTTP-сервер (TCP или Unix-сокет) с ограниченной очередью и пулом воркеров.
+    Каждый запрос проходит TranscriptionSession.run_offline — тот же конвейер,
+    что и у диктовки, всегда на локальном движке (без петли через Groq).
+    """
+
+    def __init__(self, engine, listen: str, *, workers: int = SERVE_WORKERS,
+                 queue_size: int = SERVE_QUEUE_SIZE, batch_ms: float = SERVE_BATCH_MS,
+                 max_batch: int = SERVE_MAX_BATCH, max_upload_mb: float = SERVE_MAX_UPLOAD_MB):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        import socketserver
+
+        self.engine = engine
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.batch_sec = batch_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.max_upload = int(max_upload_mb * 1024 * 1024)
+        self.stats = {"served": 0, "rejected": 0, "errors": 0, "timeouts": 0, "cancelled": 0,
+                      "batches": 0, "batched_jobs": 0}
+        self._stats_lock = threading.Lock()
+        self._stopping = threading.Event()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path == "/health":
+                    self._reply(200, server.health())
+                elif path in ("/v1/models", "/openai/v1/models"):
+                    desc = describe_engine(server.engine)
+                    model = desc.get("model") or desc["engine"]
+                    self._reply(200, {"object": "list", "data": [
+                        {"id": model, "object": "model", "owned_by": "whispermac"},
+                    ]})
+                else:
+                    self._reply(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                if self.path.split("?", 1)[0] not in SERVE_TRANSCRIBE_PATHS:
+                    self._reply(404, {"error": {"message": "not found"}})
+                    return
+                try:
+                    body = _read_http_body(self, server.max_upload)
+                    fields, files = _parse_multipart(self.headers.get("Content-Type", ""), body)
+                    if "file" not in files:
+                        raise ValueError("нет поля file")
+                    fname, data = files["file"]
+                    audio = _decode_upload(fname, data)
+                except OverflowError as ex:
+                    self._reply(413, {"error": {"message": str(ex)}})
+                    return
+                except Exception as ex:  # noqa: BLE001
+                    self._reply(400, {"error": {"message": str(ex)}})
+                    return
+
+                job = _ServeJob(audio, fields.get("prompt") or None)
+                try:
+                    server.jobs.put_nowait(job)
+                except queue.Full:
+                    server._count("rejected")
+                    self._reply(503, {"error": {"message": "очередь заполнена"}},
+                                headers={"Retry-After": "1"})
+                    return
+                if not job.done.wait(GROQ_TIMEOUT):
+                    # Ещё в очереди — воркер его пропустит; уже декодируется — доработает впустую.
+                    job.cancelled = True
+                    server._count("timeouts")
+                    self._reply(504, {"error": {"message": "таймаут декодирования"}})
+                    return
+                if job.error:
+                    self._reply(500, {"error": {"message": job.error}})
+                    return
+
+                fmt = fields.get("response_format", "json")
+                if fmt == "text":
+                    self._reply_raw(200, (job.text + "\n").encode("utf-8"), "text/plain; charset=utf-8")
+                elif fmt == "verbose_json":
+                    self._reply(200, {
+                        "task": "transcribe", "language": LANGUAGE, "text": job.text,
+                        "duration": round(len(job.audio) / SAMPLE_RATE, 2),
+                        "x_whispermac": {"queue_ms": round(job.wait_ms, 1),
+                                         "decode_ms": round(job.decode_ms, 1)},
+                    })
+                else:
+                    self._reply(200, {"text": job.text})
+
+            def _reply(self, status: int, payload: dict, headers=None):
+                raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self._reply_raw(status, raw, "application/json", headers)
+
+            def _reply_raw(self, status: int, raw: bytes, ctype: str, headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(raw)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def address_string(self):
+                # У Unix-сокета client_address — пустая строка.
+                return self.client_address[0] if self.client_address else "unix"
+
+            def log_message(self, *_args):
+                pass
+
+        addr = _parse_listen(listen)
+        if addr[0] == "unix":
+            class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+                daemon_threads = True
+
+            sock_path = Path(addr[1])
+            if sock_path.exists():
+                sock_path.unlink()
+            self._httpd = UnixHTTPServer(str(sock_path), Handler)
+            os.chmod(sock_path, 0o600)
+            self.address = f"unix:{sock_path}"
+        else:
+            self._httpd = ThreadingHTTPServer((addr[1], addr[2]), Handler)
+            self._httpd.daemon_threads = True
+            host, port = self._httpd.server_address[:2]
+            self.address = f"http://{host}:{port}"
+        self._unix_path = addr[1] if addr[0] == "unix" else None
+
+        self._workers = [
+            threading.Thread(target=self._worker, daemon=True, name=f"serve-{i}")
+            for i in range(max(1, workers))
+        ]
+        for t in self._workers:
+            t.start()
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def health(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {
+            "status": "ok",
+            **describe_engine(self.engine),
+            "queue": self.jobs.qsize(),
+            "queue_size": self.jobs.maxsize,
+            "workers": len(self._workers),
+            **stats,
+        }
+
+    def _next_batch(self) -> list:
+        """Первый запрос ждём блокирующе, остальные — в пределах окна batch_sec."""
+        try:
+            first = self.jobs.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.batch_sec
+        while len(batch) < self.max_batch:
+            left = deadline - time.perf_counter()
+            try:
+                batch.append(self.jobs.get(timeout=left) if left > 0 else self.jobs.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            self._count("batches")
+            self._count("batched_jobs", len(batch))
+            # mlx_whisper не умеет батч-инференс: внутри пачки — короткие первыми,
+            # чтобы они не стояли за длинной записью.
+            for job in sorted(batch, key=lambda j: len(j.audio)):
+                self._run_job(job)
+
+    def _run_job(self, job: _ServeJob):
+        if job.cancelled:
+            self._count("cancelled")
+            log(f"[serve] {len(job.audio) / SAMPLE_RATE:.1f}s аудио: пропуск, клиент ушёл по таймауту")
+            job.done.set()
+            return
+        started = time.perf_counter()
+        job.wait_ms = (started - job.enqueued_at) * 1000.0
+        trace = UtteranceTrace("serve")
+        trace.add("queue", job.enqueued_at, started)
+        try:
+            session = TranscriptionSession(self.engine, trace=trace, prompt=job.prompt)
+            job.text = session.run_offline(job.audio) or ""
+            if trace.meta.get("error"):
+                raise RuntimeError(trace.meta["error"])
+            self._count("served")
+        except Exception as ex:  # noqa: BLE001
+            job.error = f"{type(ex).__name__}: {ex}"
+            self._count("errors")
+        job.decode_ms = (time.perf_counter() - started) * 1000.0
+        trace.save()
+        log(
+            f"[serve] {len(job.audio) / SAMPLE_RATE:.1f}s аудио: очередь {job.wait_ms:.0f}ms, "
+            f"декодирование {job.decode_ms:.0f}ms{' — ' + job.error if job.error else ''}"
+        )
+        job.done.set()
+
+    def close(self):
+        self._stopping.set()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._unix_path:
+            with contextlib.suppress(OSError):
+                Path(self._unix_path).unlink()
+
+
+def serve_main(argv: list) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="whisper_mac.py serve",
+        description="OpenAI-совместимый /v1/audio/transcriptions на локальной модели",
+    )
+    parser.add_argument("--listen", default=SERVE_ADDR or "127.0.0.1:8787",
+                        help="host:port или unix:/path/to.sock")
+    parser.add_argument("--engine", choices=("local", "fake"), default="local")
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--queue", type=int, default=SERVE_QUEUE_SIZE)
+    parser.add_argument("--batch-ms", type=float, default=SERVE_BATCH_MS)
+    parser.add_argument("--max-batch", type=int, default=SERVE_MAX_BATCH)
+    parser.add_argument("--fake-rtf", type=float, default=0.05, help="скорость FakeEngine")
+    args = parser.parse_args(argv)
+
+    if args.engine == "fake":
+        engine = _bench_module().FakeEngine(rtf=args.fake_rtf)
+    else:
+        # Тот же движок, что и в приложении: каскад, черновик, прогрев, процесс инференса.
+        log(f"Загружаю модель... ({MODEL_REPO})")
+        engine = load_local_engine()
+        if engine is None:
+            print("локальная модель недоступна на этой машине", file=sys.stderr)
+            return 2
+
+    server = TranscriptionServer(
+        engine, args.listen, workers=args.workers, queue_size=args.queue,
+        batch_ms=args.batch_ms, max_batch=args.max_batch,
+    )
+    log(f"[serve] слушаю {server.address} (воркеров {args.workers}, очередь {args.queue})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if isinstance(engine, InferenceClient):
+            engine.close()
+    return 0
+
+
+# ═══════════════════════════════════════════════════
+# Отчёт по span'ам: python whisper_mac.py report
+
+REPORT_PHASES = (
+    "open", "capture", "stop", "queue", "encode", "upload", "server", "retry", "decode", "final_pass",
+    "final_safe", "post", "clipboard", "activate", "verify", "paste", "stop_to_paste",
+)
+
+
+def _percentile(values: list, q: float) -> float:
+    """Перцентиль с линейной интерполяцией (как numpy method='linear')."""
+    if not values:
+        return float("nan")
+    data = sorted(values)
+    pos = (len(data) - 1) * q / 100.0
+    lo, hi = math.floor(pos), math.ceil(pos)
+    return data[lo] + (data[hi] - data[lo]) * (pos - lo)
+
+
+def _load_perf_spans(path: Path) -> list:
+    """Записи из текущего JSONL и его ротированных архивов, от старых к новым."""
+    sources = sorted(
+        path.parent.glob(f"{path.name}.*"),
+        key=lambda p: p.stat().st_mtime,
+    )
+    sources.append(path)
+    records = []
+    for src in sources:
+        opener = gzip.open if src.suffix == ".gz" else open
+        try:
+            with opener(src, "rt", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            continue
+    return records
+
+
+def _span_samples(records: list) -> dict:
+    """(engine, phase) → длительности в мс; stop_to_paste считается по диктовке."""
+    samples = {}
+    for rec in records:
+        engine = rec.get("engine") or "-"
+        spans = rec.get("spans") or []
+        for sp in spans:
+            samples.setdefault((engine, sp.get("phase", "?")), []).append(float(sp.get("ms", 0.0)))
+        stop = next((sp for sp in spans if sp.get("phase") == "stop"), None)
+        pastes = [sp for sp in spans if sp.get("phase") == "paste"]
+        if stop and pastes:
+            total_ms = (float(pastes[-1]["end"]) - float(stop["start"])) * 1000.0
+            samples.setdefault((engine, "stop_to_paste"), []).append(total_ms)
+    return samples
+
+
+def perf_report_main(argv: list) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="whisper_mac.py report",
+        description="p50/p95/p99 по фазам диктовки и движкам из ~/whisper_perf.jsonl",
+    )
+    parser.add_argument("path", nargs="?", default=str(PERF_SPANS_PATH))
+    parser.add_argument("--engine", help="только этот движок (groq, local, groq+local)")
+    parser.add_argument("--last", type=int, default=0, help="только последние N диктовок")
+    args = parser.parse_args(argv)
+
+    records = _load_perf_spans(Path(args.path).expanduser())
+    if args.engine:
+        records = [r for r in records if r.get("engine") == args.engine]
+    if args.last > 0:
+        records = records[-args.last:]
+    if not records:
+        print(f"Нет данных в {args.path}")
+        return 1
+
+    samples = _span_samples(records)
+    engines = sorted({engine for engine, _ in samples})
+    if len(engines) > 1:
+        for (engine, phase), values in list(samples.items()):
+            samples.setdefault(("*", phase), []).extend(values)
+        engines.append("*")
+    order = {phase: i for i, phase in enumerate(REPORT_PHASES)}
+
+    print(f"Диктовок: {len(records)}")
+    print(f"{'engine':<12}{'phase':<15}{'n':>6}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}")
+    for engine in engines:
+        phases = sorted(
+            (phase for eng, phase in samples if eng == engine),
+            key=lambda ph: (order.get(ph, len(order)), ph),
+        )
+        for phase in phases:
+            values = samples[(engine, phase)]
+            print(
+                f"{engine:<12}{phase:<15}{len(values):>6}"
+                f"{_percentile(values, 50):>11.1f}"
+                f"{_percentile(values, 95):>11.1f}"
+                f"{_percentile(values, 99):>11.1f}"
+            )
+    return 0
+
+
+# ═══════════════════════════════════════════════════
+# Командная строка: python whisper_mac.py <команда> [...]; без команды — приложение.
+# bench-* живут в whisper_bench.py и импортируются только по требованию.
+
+COMMANDS = {
+    "report": perf_report_main,
+    "transcribe": batch_main,
+    "serve": serve_main,
+}
+
+
+def _run_bench(argv: list) -> int:
+    return _bench_module().main(argv)
+
+
 if __name__ == "__main__":
+    _command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if _command in COMMANDS:
+        sys.exit(COMMANDS[_command](sys.argv[2:]))
+    if _command.startswith("bench"):
+        sys.exit(_run_bench(sys.argv[1:]))
+    STARTUP.mark("import")
     _instance_lock = acquire_instance_lock()
     if _instance_lock is None:
         log("WhisperMac уже запущен, второй экземпляр остановлен")